@@ -0,0 +1,190 @@
+"""
+Idle Connection Benchmark
+Đo CPU server tốn cho mỗi thiết bị đang kết nối nhưng không hỏi gì, để biết một máy giữ được
+bao nhiêu kết nối. Mỗi thiết bị giả lập gửi nhiễu nền theo đúng nhịp 30ms như firmware vad/,
+hoặc (--pause) gửi PAUSE rồi chỉ gửi HEARTBEAT định kỳ.
+
+Chạy từ thư mục server_implement:
+    python -m benchmark.idle --clients 0,10,50,100
+    python -m benchmark.idle --clients 0,50 --noise-dbfs -40       # lớp học ồn
+    python -m benchmark.idle --clients 0,50 --no-gate              # so sánh khi tắt energy gate
+    python -m benchmark.idle --clients 0,50 --pause
+    python -m benchmark.idle --url ws://192.168.1.10:8000/ws --clients 0,50
+
+Server cục bộ chạy trong process con để CPU của các thiết bị giả lập không bị tính vào;
+CPU được đọc từ /metrics (connections.process_cpu_seconds) trước và sau mỗi mức.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmark.replay import FRAME_SAMPLES, FRAME_SECONDS, _fetch_json, _free_port
+from settings import server_settings as cfg
+
+HEARTBEAT_SECONDS = 5.0  # Như HEARTBEAT_INTERVAL_MS của firmware
+
+
+def noise_frames(noise_dbfs: float, seconds: float = 3.0, seed: int = 0) -> List[bytes]:
+    """Nhiễu trắng có mức RMS noise_dbfs, cắt thành frame 30ms (phát lặp lại)"""
+    rng = np.random.default_rng(seed)
+    n_frames = int(seconds / FRAME_SECONDS)
+    rms = 32768.0 * 10 ** (noise_dbfs / 20)
+    samples = np.clip(rng.standard_normal(n_frames * FRAME_SAMPLES) * rms, -32768, 32767).astype(np.int16)
+    return [samples[i * FRAME_SAMPLES:(i + 1) * FRAME_SAMPLES].tobytes() for i in range(n_frames)]
+
+
+async def run_idle_client(url: str, client_id: int, seconds: float, frames: List[bytes], pause: bool):
+    """Một thiết bị không nói gì trong `seconds` giây"""
+    import websockets
+
+    async with websockets.connect(f"{url}?device_id=idle-{client_id}", max_size=None) as ws:
+        end = time.perf_counter() + seconds
+        if pause:
+            await ws.send(cfg.PAUSE_MESSAGE)
+            while time.perf_counter() < end:
+                await asyncio.sleep(min(HEARTBEAT_SECONDS, max(0.0, end - time.perf_counter())))
+                await ws.send(cfg.HEARTBEAT_MESSAGE)
+            return
+        clock = time.perf_counter()
+        i = client_id  # Lệch pha để các thiết bị không gửi cùng một frame
+        while clock < end:
+            clock += FRAME_SECONDS
+            delay = clock - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await ws.send(frames[i % len(frames)])
+            i += 1
+
+
+async def run_level(url: str, http_base: str, n_clients: int, frames: List[bytes], args) -> Dict:
+    clients = [
+        asyncio.create_task(run_idle_client(url, i, args.warmup + args.seconds + 1.0, frames, args.pause))
+        for i in range(n_clients)
+    ]
+    await asyncio.sleep(args.warmup)
+    before = await asyncio.to_thread(_fetch_json, f"{http_base}/metrics?recent=0")
+    await asyncio.sleep(args.seconds)
+    after = await asyncio.to_thread(_fetch_json, f"{http_base}/metrics?recent=0")
+    results = await asyncio.gather(*clients, return_exceptions=True)
+    failed = [r for r in results if isinstance(r, Exception)]
+    if failed:
+        print(f"⚠️  {len(failed)} client(s) failed: {failed[0]}")
+    if not before or not after:
+        raise RuntimeError("Server /metrics unavailable")
+
+    b, a = before["connections"], after["connections"]
+    frames_delta = a["frames"] - b["frames"]
+    return {
+        "clients": n_clients,
+        "failed_clients": len(failed),
+        "open_connections": a["open"],
+        "paused_connections": a["paused"],
+        "cpu_percent": round(100 * (a["process_cpu_seconds"] - b["process_cpu_seconds"]) / args.seconds, 2),
+        "frames_per_second": round(frames_delta / args.seconds, 1),
+        "gated_ratio": round((a["gated_frames"] - b["gated_frames"]) / frames_delta, 4) if frames_delta else None,
+    }
+
+
+def start_server_process(port: int, gate: bool) -> subprocess.Popen:
+    """uvicorn server.app trong process con; chỉ cần VAD sẵn sàng (không có câu hỏi nào)"""
+    env = {**os.environ, "ENERGY_GATE": "1" if gate else "0"}
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server.app:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"Server exited with code {proc.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=2) as resp:
+                ready = json.loads(resp.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            ready = json.loads(e.read().decode("utf-8"))
+        except OSError:
+            ready = None
+        if ready and ready["accepting_connections"]:
+            return proc
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("Server did not start accepting connections")
+
+
+def summarize(levels: List[Dict]) -> Optional[Dict]:
+    """CPU mỗi kết nối = độ dốc giữa mức ít nhất và nhiều kết nối nhất"""
+    if len(levels) < 2:
+        return None
+    low, high = min(levels, key=lambda l: l["clients"]), max(levels, key=lambda l: l["clients"])
+    if high["clients"] == low["clients"]:
+        return None
+    per_connection = (high["cpu_percent"] - low["cpu_percent"]) / (high["clients"] - low["clients"])
+    return {
+        "cpu_percent_per_connection": round(per_connection, 4),
+        "idle_connections_per_core": int(100 / per_connection) if per_connection > 0 else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure server CPU per idle device connection")
+    parser.add_argument("--clients", default="0,10,50", help="Số thiết bị im lặng cho từng mức, cách nhau bởi dấu phẩy")
+    parser.add_argument("--seconds", type=float, default=15.0, help="Thời gian đo mỗi mức")
+    parser.add_argument("--warmup", type=float, default=3.0)
+    parser.add_argument("--noise-dbfs", type=float, default=-60.0, help="Mức nhiễu nền thiết bị gửi lên")
+    parser.add_argument("--pause", action="store_true", help="Thiết bị gửi PAUSE rồi chỉ gửi HEARTBEAT")
+    parser.add_argument("--no-gate", action="store_true", help="Tắt energy gate trên server cục bộ")
+    parser.add_argument("--url", default=None, help="Đo server có sẵn thay vì chạy server cục bộ")
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    proc = None
+    if args.url:
+        url = args.url
+    else:
+        port = _free_port()
+        proc = start_server_process(port, gate=not args.no_gate)
+        url = f"ws://127.0.0.1:{port}/ws"
+        print(f"🚀 Local server (pid {proc.pid}) at {url}")
+    http_base = url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws", 1)[0]
+    frames = noise_frames(args.noise_dbfs)
+
+    levels = []
+    try:
+        for n_clients in [int(x) for x in args.clients.split(",") if x.strip()]:
+            print(f"\n▶️  {n_clients} idle device(s)...")
+            level = asyncio.run(run_level(url, http_base, n_clients, frames, args))
+            levels.append(level)
+            print(f"   CPU {level['cpu_percent']}%  frames/s={level['frames_per_second']}  gated={level['gated_ratio']}")
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {**vars(args), "server_url": url},
+        "summary": summarize(levels),
+        "levels": levels,
+    }
+    output = Path(args.output or f"benchmark_results/idle_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if report["summary"]:
+        print(f"\n✅ CPU per idle connection: {report['summary']['cpu_percent_per_connection']}% "
+              f"(~{report['summary']['idle_connections_per_core']} idle connections per core)")
+    print(f"📝 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Stand-in OpenAI-compatible LLM server
+Phục vụ /v1/chat/completions (stream SSE hoặc JSON) bằng MockBackend, để load test đi qua
+đúng đường HTTP của backend "openai" mà không tốn quota Gemini.
+
+Chạy từ thư mục server_implement:
+    python -m benchmark.llm_server --port 8081 --ttft 0.4 --tokens-per-second 80
+    LLM_BACKEND=openai OPENAI_BASE_URL=http://127.0.0.1:8081/v1 uvicorn server.app:app
+"""
+import argparse
+import json
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from modules.llm_backends import MockBackend
+
+
+app = FastAPI()
+backend: MockBackend = None
+
+
+def _messages(body: dict):
+    return [m for m in body.get("messages", []) if m.get("role") in ("user", "assistant")]
+
+
+@app.get("/v1/models")
+def list_models():
+    return {"object": "list", "data": [{"id": "mock", "object": "model"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = _messages(body)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "mock")
+
+    if not body.get("stream"):
+        text = "".join([token async for token in backend.astream("", messages)])
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        }
+
+    async def events():
+        async for token in backend.astream("", messages):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    global backend
+    parser = argparse.ArgumentParser(description="OpenAI-compatible mock LLM server for load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--ttft", type=float, default=0.4)
+    parser.add_argument("--tokens-per-second", type=float, default=80.0)
+    args = parser.parse_args()
+
+    import uvicorn
+    backend = MockBackend(ttft_seconds=args.ttft, tokens_per_second=args.tokens_per_second)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,345 @@
+"""
+Offline Benchmark Harness
+Phát lại các file WAV (ví dụ audio_files/) như N thiết bị ESP32 gửi audio theo thời gian thực
+qua websocket tới server, đo độ trễ theo từng giai đoạn, real-time factor và số thiết bị
+đồng thời tối đa còn giữ được SLO. Kết quả được ghi ra JSON để so sánh giữa các lần chạy.
+
+Chạy từ thư mục server_implement:
+    python -m benchmark.replay --audio-dir audio_files --clients 1,2,4,8
+    python -m benchmark.replay --real-tts --clients 1,2
+    python -m benchmark.replay --llm-backend openai --llm-url http://127.0.0.1:8081/v1
+    python -m benchmark.replay --url ws://192.168.1.10:8000/ws --clients 4
+"""
+import argparse
+import asyncio
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+import wave
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from modules.resample import resample
+
+SAMPLE_RATE = 16000
+FRAME_MS = 30
+FRAME_SAMPLES = SAMPLE_RATE * FRAME_MS // 1000
+FRAME_SECONDS = FRAME_MS / 1000
+TRAILING_SILENCE_RMS = 0.02   # Ngưỡng (so với RMS lớn nhất) để cắt khoảng lặng cuối file
+GAP_BETWEEN_UTTERANCES = 1.0  # Im lặng giữa hai câu hỏi liên tiếp của cùng một thiết bị
+
+
+# ===== Audio =====
+
+def _read_wav(path: Path) -> np.ndarray:
+    with wave.open(str(path), "rb") as wf:
+        sr = wf.getframerate()
+        channels = wf.getnchannels()
+        if wf.getsampwidth() != 2:
+            raise ValueError(f"{path}: only 16-bit PCM is supported")
+        samples = np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    if channels > 1:
+        samples = samples[::channels]
+    if sr != SAMPLE_RATE:
+        samples = resample(samples, sr, SAMPLE_RATE)
+    return samples
+
+
+def _trim_trailing_silence(samples: np.ndarray) -> np.ndarray:
+    """Bỏ khoảng lặng cuối file để mốc "hết tiếng nói" được đo chính xác"""
+    n_frames = len(samples) // FRAME_SAMPLES
+    if n_frames == 0:
+        return samples
+    frames = samples[:n_frames * FRAME_SAMPLES].astype(np.float32).reshape(n_frames, FRAME_SAMPLES)
+    rms = np.sqrt((frames ** 2).mean(axis=1))
+    voiced = np.nonzero(rms > TRAILING_SILENCE_RMS * rms.max())[0]
+    if len(voiced) == 0:
+        return samples
+    return samples[:(voiced[-1] + 1) * FRAME_SAMPLES]
+
+
+def load_utterances(audio_dir: Path) -> List[Dict]:
+    utterances = []
+    for path in sorted(audio_dir.glob("*.wav")):
+        samples = _trim_trailing_silence(_read_wav(path))
+        n_frames = len(samples) // FRAME_SAMPLES
+        if n_frames == 0:
+            continue
+        frames = [
+            samples[i * FRAME_SAMPLES:(i + 1) * FRAME_SAMPLES].tobytes() for i in range(n_frames)
+        ]
+        utterances.append({"name": path.name, "frames": frames, "seconds": n_frames * FRAME_SECONDS})
+    if not utterances:
+        raise FileNotFoundError(f"No usable .wav files in {audio_dir}")
+    return utterances
+
+
+# ===== Simulated device =====
+
+async def run_client(
+    url: str,
+    client_id: int,
+    utterances: List[Dict],
+    n_utterances: int,
+    response_timeout: float,
+    start_delay: float = 0.0,
+) -> List[Dict]:
+    """Một thiết bị giả lập: full-duplex, gửi mic liên tục (câu hỏi rồi im lặng) theo đúng nhịp 30ms"""
+    import websockets
+
+    silence = bytes(FRAME_SAMPLES * 2)
+    results = []
+    state: Dict = {}
+    done = asyncio.Event()
+
+    await asyncio.sleep(start_delay)
+    async with websockets.connect(f"{url}?device_id=bench-{client_id}", max_size=None) as ws:
+
+        async def receiver():
+            async for message in ws:
+                now = time.perf_counter()
+                if isinstance(message, str):
+                    if message == "PROCESSING_START":
+                        state.setdefault("processing_start", now)
+                    elif message in ("TTS_END", "TTS_ABORT"):
+                        state["end"] = now
+                        state["aborted"] = message == "TTS_ABORT"
+                        done.set()
+                else:
+                    state.setdefault("first_audio", now)
+                    state["audio_bytes"] = state.get("audio_bytes", 0) + len(message)
+
+        receiver_task = asyncio.create_task(receiver())
+        clock = time.perf_counter()
+
+        async def send_frame(frame: bytes):
+            nonlocal clock
+            clock += FRAME_SECONDS
+            delay = clock - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            await ws.send(frame)
+
+        try:
+            for i in range(n_utterances):
+                utt = utterances[(client_id + i) % len(utterances)]
+                state.clear()
+                done.clear()
+                for frame in utt["frames"]:
+                    await send_frame(frame)
+                speech_end = time.perf_counter()
+
+                deadline = speech_end + response_timeout
+                while not done.is_set() and time.perf_counter() < deadline:
+                    await send_frame(silence)
+
+                result = {
+                    "client": client_id,
+                    "utterance": utt["name"],
+                    "audio_seconds": utt["seconds"],
+                    "timed_out": not done.is_set(),
+                    "aborted": state.get("aborted", False),
+                    "response_bytes": state.get("audio_bytes", 0),
+                }
+                for key in ("processing_start", "first_audio", "end"):
+                    if key in state:
+                        result[f"{key}_latency"] = state[key] - speech_end
+                if "processing_start" in state and "first_audio" in state:
+                    result["rtf"] = (state["first_audio"] - state["processing_start"]) / utt["seconds"]
+                results.append(result)
+
+                for _ in range(int(GAP_BETWEEN_UTTERANCES / FRAME_SECONDS)):
+                    await send_frame(silence)
+        finally:
+            receiver_task.cancel()
+    return results
+
+
+# ===== Reporting =====
+
+def _percentiles(values: List[float]) -> Optional[Dict]:
+    if not values:
+        return None
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "count": len(values),
+        "mean": round(float(arr.mean()), 4),
+        "p50": round(float(np.percentile(arr, 50)), 4),
+        "p95": round(float(np.percentile(arr, 95)), 4),
+        "p99": round(float(np.percentile(arr, 99)), 4),
+        "max": round(float(arr.max()), 4),
+    }
+
+
+def _fetch_json(url: str) -> Optional[Dict]:
+    try:
+        with urllib.request.urlopen(url, timeout=5) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except Exception as e:
+        print(f"⚠️  Could not fetch {url}: {e}")
+        return None
+
+
+def summarize_level(n_clients: int, results: List[Dict], server_metrics: Optional[Dict], slo: float) -> Dict:
+    def collect(key):
+        return [r[key] for r in results if key in r]
+
+    first_audio = _percentiles(collect("first_audio_latency"))
+    timeouts = sum(1 for r in results if r["timed_out"])
+    sustainable = (
+        first_audio is not None and timeouts == 0 and first_audio["p95"] <= slo
+    )
+    return {
+        "clients": n_clients,
+        "utterances": len(results),
+        "timeouts": timeouts,
+        "latency": {
+            "endpoint": _percentiles(collect("processing_start_latency")),
+            "first_audio": first_audio,
+            "end": _percentiles(collect("end_latency")),
+        },
+        "rtf": _percentiles(collect("rtf")),
+        "sustainable": sustainable,
+        "server": server_metrics,
+    }
+
+
+# ===== Local server with stand-ins =====
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_local_server(real_tts: bool, llm_backend: str = "mock"):
+    """Chạy server trong thread riêng với LLM backend đã chọn (và ZipVoice giả lập nếu không --real-tts)"""
+    from benchmark import standins
+    standins.install(llm_backend=llm_backend, tts=not real_tts)
+
+    import uvicorn
+    from server import app as server_app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(server_app.app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.05)
+
+    # Model được tải trong lifespan: chờ /ready để thời gian tải không bị tính vào độ trễ
+    start = time.perf_counter()
+    while True:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=5):
+                break
+        except urllib.error.HTTPError as e:
+            if e.code != 503:
+                raise
+            ready = json.loads(e.read().decode("utf-8"))
+            failed = {k: v for k, v in ready["engines"].items() if v["state"] == "failed"}
+            if failed:
+                raise RuntimeError(f"Engines failed to load: {failed}")
+        time.sleep(0.2)
+    print(f"⏱️  Server ready after {time.perf_counter() - start:.2f}s")
+    return f"ws://127.0.0.1:{port}/ws", server, server_app
+
+
+async def run_level(url: str, n_clients: int, utterances: List[Dict], args) -> List[Dict]:
+    tasks = [
+        run_client(
+            url, client_id, utterances, args.utterances_per_client, args.response_timeout,
+            start_delay=client_id * args.stagger,
+        )
+        for client_id in range(n_clients)
+    ]
+    per_client = await asyncio.gather(*tasks, return_exceptions=True)
+    results = []
+    for item in per_client:
+        if isinstance(item, Exception):
+            print(f"⚠️  Client failed: {item}")
+            continue
+        results.extend(item)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded audio through the voice pipeline")
+    parser.add_argument("--audio-dir", default="audio_files")
+    parser.add_argument("--clients", default="1,2,4,8", help="Số thiết bị đồng thời cho từng mức, cách nhau bởi dấu phẩy")
+    parser.add_argument("--utterances-per-client", type=int, default=3)
+    parser.add_argument("--slo", type=float, default=3.0, help="p95 độ trễ tới audio đầu tiên (giây) được chấp nhận")
+    parser.add_argument("--response-timeout", type=float, default=30.0)
+    parser.add_argument("--stagger", type=float, default=0.25, help="Độ lệch thời điểm bắt đầu giữa các thiết bị (giây)")
+    parser.add_argument("--url", default=None, help="Benchmark server có sẵn thay vì chạy server cục bộ với stand-in")
+    parser.add_argument("--real-tts", action="store_true", help="Dùng ZipVoice thật thay vì stand-in")
+    parser.add_argument("--llm-backend", default="mock", choices=["mock", "openai", "gemini"],
+                        help="gemini tốn quota thật; openai dùng --llm-url (ví dụ benchmark.llm_server)")
+    parser.add_argument("--llm-url", default=None, help="Base URL cho --llm-backend openai")
+    parser.add_argument("--llm-ttft", type=float, default=0.4)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=80.0)
+    parser.add_argument("--tts-rtf", type=float, default=0.3)
+    parser.add_argument("--output", default=None)
+    args = parser.parse_args()
+
+    utterances = load_utterances(Path(args.audio_dir))
+    print(f"📂 Loaded {len(utterances)} utterances from {args.audio_dir}")
+
+    local = None
+    if args.url:
+        url = args.url
+    else:
+        from benchmark import standins
+        from settings import llm_settings
+        llm_settings.MOCK_TTFT_SECONDS = args.llm_ttft
+        llm_settings.MOCK_TOKENS_PER_SECOND = args.llm_tokens_per_second
+        if args.llm_url:
+            llm_settings.OPENAI_BASE_URL = args.llm_url
+        standins.StandInTTSEngine.real_time_factor = args.tts_rtf
+        url, server, local = start_local_server(args.real_tts, args.llm_backend)
+        print(f"🚀 Local server with stand-ins at {url}")
+    http_base = url.replace("ws://", "http://").replace("wss://", "https://").rsplit("/ws", 1)[0]
+
+    levels = []
+    for n_clients in [int(x) for x in args.clients.split(",") if x.strip()]:
+        if local is not None:
+            local.metrics.reset()
+            local.speculation_stats.reset()
+        print(f"\n▶️  {n_clients} concurrent device(s)...")
+        results = asyncio.run(run_level(url, n_clients, utterances, args))
+        server_metrics = _fetch_json(f"{http_base}/metrics?recent=0")
+        level = summarize_level(n_clients, results, server_metrics, args.slo)
+        level["results"] = results
+        levels.append(level)
+        fa = level["latency"]["first_audio"] or {}
+        print(
+            f"   first audio p50={fa.get('p50')}s p95={fa.get('p95')}s "
+            f"timeouts={level['timeouts']} sustainable={level['sustainable']}"
+        )
+
+    sustainable = [lvl["clients"] for lvl in levels if lvl["sustainable"]]
+    report = {
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {**vars(args), "server_url": url, "utterance_files": len(utterances)},
+        "max_sustainable_clients": max(sustainable) if sustainable else 0,
+        "levels": levels,
+    }
+
+    output = Path(args.output or f"benchmark_results/bench_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"\n✅ Max sustainable concurrent devices (p95 ≤ {args.slo}s): {report['max_sustainable_clients']}")
+    print(f"📝 Results written to {output}")
+
+    if local is not None:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
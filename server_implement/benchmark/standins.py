@@ -0,0 +1,61 @@
+"""
+Local stand-in for ZipVoice
+Giả lập độ trễ của TTS để benchmark STT + VAD + websocket mà không cần GPU. Có cùng interface
+với TTSEngine mà pipeline sử dụng. LLM dùng backend "mock" (hoặc "openai" trỏ tới
+benchmark.llm_server) của modules.llm_backends nên không tốn quota API.
+"""
+import asyncio
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+
+
+class StandInTTSEngine:
+    """
+    Sinh file WAV 16 kHz có độ dài tỉ lệ với câu trả lời, sau khi "tính toán"
+    trong khoảng thời gian = real_time_factor * độ dài audio.
+    """
+
+    sample_rate = 16000
+    seconds_per_char = 0.06
+    real_time_factor = 0.3
+    output_dir = Path("audio_cache")
+
+    def __init__(self):
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+
+    def _audio_seconds(self, text: str) -> float:
+        return max(0.5, len(text) * self.seconds_per_char)
+
+    def _write(self, text: str, output_path) -> Path:
+        output_path = Path(output_path) if output_path else self.output_dir / "output.wav"
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        n = int(self._audio_seconds(text) * self.sample_rate)
+        t = np.arange(n, dtype=np.float32) / self.sample_rate
+        tone = (0.05 * np.sin(2 * np.pi * 220.0 * t) * 32767).astype(np.int16)
+        with wave.open(str(output_path), "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(self.sample_rate)
+            wf.writeframes(tone.tobytes())
+        return output_path
+
+    def synthesize(self, text, output_path=None, ref_audio=None, prompt_text=None):
+        time.sleep(self._audio_seconds(text) * self.real_time_factor)
+        return self._write(text, output_path)
+
+    async def synthesize_async(self, text, output_path=None, ref_audio=None, prompt_text=None):
+        await asyncio.sleep(self._audio_seconds(text) * self.real_time_factor)
+        return self._write(text, output_path)
+
+
+def install(llm_backend: str = "mock", tts: bool = True):
+    """Chọn backend LLM và thay ZipVoice bằng stand-in; phải gọi TRƯỚC khi import server.app"""
+    from settings import llm_settings
+    llm_settings.LLM_BACKEND = llm_backend
+    if tts:
+        import modules.pipeline as pipeline_module
+        pipeline_module.TTSEngine = StandInTTSEngine
@@ -0,0 +1,222 @@
+"""
+Context Builder
+Ghép prompt cho mỗi lượt trong một ngân sách token:
+- system prompt tĩnh được dựng một lần
+- chỉ giữ tài liệu RAG đủ liên quan, cắt cho vừa ngân sách
+- giữ nguyên văn vài lượt gần nhất, các lượt cũ hơn được tóm tắt dần (không gọi LLM)
+- thinking budget theo thời gian còn lại của lượt thay vì để model nghĩ không giới hạn
+Token được ước lượng offline (không gọi count_tokens của API) để không tốn thêm độ trễ.
+"""
+import math
+import re
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from settings import llm_settings as cfg
+from . import metrics
+from .degradation import degradation
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text: str) -> int:
+    """Ước lượng số token: mỗi âm tiết / dấu câu ~ TOKENS_PER_WORD token"""
+    if not text:
+        return 0
+    return math.ceil(len(_TOKEN_RE.findall(text)) * cfg.TOKENS_PER_WORD)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cắt text ở ranh giới từ sao cho không vượt quá max_tokens"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    kept = []
+    used = 0
+    for word in words:
+        cost = estimate_tokens(word)
+        if used + cost > max_tokens:
+            break
+        kept.append(word)
+        used += cost
+    return " ".join(kept) + " …"
+
+
+def first_sentence(text: str, max_tokens: int) -> str:
+    return truncate_to_tokens(_SENTENCE_END_RE.split(text.strip(), maxsplit=1)[0], max_tokens)
+
+
+class ContextBuilder:
+    """Một builder dùng chung cho mọi session; phần tóm tắt được lưu theo session_id"""
+
+    def __init__(self):
+        self.base_prompt = cfg.ROLE_PROMPT + "\n" + cfg.SAFETY_PROMPT
+        self.base_tokens = estimate_tokens(self.base_prompt)
+        self._summaries: Dict[str, Deque[str]] = {}
+        self._summarized_seq: Dict[str, int] = {}
+        self._last_used: Dict[str, float] = {}  # session_id -> time.monotonic() của lượt gần nhất
+        self._swept_at = time.monotonic()
+
+    def _update_summary(self, session_id: str, older: List[Dict]) -> str:
+        """Đưa các message vừa rời khỏi cửa sổ gần nhất vào bản tóm tắt của session"""
+        lines = self._summaries.setdefault(session_id, deque())
+        last_seq = self._summarized_seq.get(session_id, -1)
+        for msg in older:
+            if msg["seq"] <= last_seq:
+                continue
+            if msg["role"] == "user":
+                lines.append("Cậu hỏi: " + truncate_to_tokens(msg["content"], cfg.SUMMARY_LINE_TOKENS))
+            else:
+                lines.append("Tớ đáp: " + first_sentence(msg["content"], cfg.SUMMARY_LINE_TOKENS))
+            last_seq = msg["seq"]
+        self._summarized_seq[session_id] = last_seq
+        while lines and estimate_tokens("\n".join(lines)) > cfg.SUMMARY_MAX_TOKENS:
+            lines.popleft()
+        return "\n".join(lines)
+
+    def with_documents(self, corpus: str) -> str:
+        """Prefix tĩnh gồm system prompt và toàn bộ tài liệu bài học (để cache phía server)"""
+        return (
+            self.base_prompt
+            + "\n\n=== TÀI LIỆU BÀI HỌC ===\n"
+            + corpus
+            + "\n=== KẾT THÚC TÀI LIỆU BÀI HỌC ==="
+        )
+
+    def forget(self, session_id: str):
+        self._summaries.pop(session_id, None)
+        self._summarized_seq.pop(session_id, None)
+        self._last_used.pop(session_id, None)
+
+    def _touch(self, session_id: str):
+        """Ghi nhận session vừa dùng; thỉnh thoảng bỏ tóm tắt của các session đã lâu không hỏi"""
+        now = time.monotonic()
+        self._last_used[session_id] = now
+        if now - self._swept_at < cfg.SUMMARY_IDLE_SECONDS / 10:
+            return
+        self._swept_at = now
+        idle = [s for s, used in self._last_used.items() if now - used > cfg.SUMMARY_IDLE_SECONDS]
+        for s in idle:
+            self.forget(s)
+        if idle:
+            log.debug("🧹 Dropped summaries of %d idle session(s)", len(idle))
+
+    def export(self, session_id: str) -> Dict:
+        return {
+            "summary": list(self._summaries.get(session_id, ())),
+            "summarized_seq": self._summarized_seq.get(session_id, -1),
+        }
+
+    def restore(self, session_id: str, state: Dict):
+        self._summaries[session_id] = deque(state.get("summary", ()))
+        self._summarized_seq[session_id] = state.get("summarized_seq", -1)
+        self._touch(session_id)
+
+    def thinking_budget(self, elapsed: Optional[float]) -> Optional[int]:
+        """
+        Số token thinking cho lượt này. Với THINKING_BUDGET = "latency": phần thời gian còn lại
+        tới TURN_LATENCY_TARGET_SECONDS (sau khi trừ thời gian đã trôi qua từ lúc trẻ nói xong,
+        TTFT cơ bản và thời gian tới audio đầu tiên của TTS) đổi ra token; quá ít thì tắt thinking.
+        """
+        if not cfg.USE_THINKING:
+            return None
+        if not degradation.tier.thinking:
+            return 0  # Quá tải: tắt thinking
+        if cfg.THINKING_BUDGET != "latency":
+            return cfg.THINKING_BUDGET
+        remaining = (
+            cfg.TURN_LATENCY_TARGET_SECONDS
+            - (elapsed or 0.0)
+            - cfg.LLM_BASE_TTFT_SECONDS
+            - cfg.TTS_FIRST_AUDIO_SECONDS
+        )
+        tokens = int(remaining * cfg.THINKING_TOKENS_PER_SECOND)
+        if tokens < cfg.THINKING_MIN_TOKENS:
+            return 0
+        return min(tokens, cfg.THINKING_MAX_TOKENS)
+
+    def _select_rag(self, docs: List[Dict], budget: int) -> List[str]:
+        parts = []
+        used = 0
+        relevant = [d for d in docs if d.get("relevance", 0.0) >= cfg.RAG_MIN_RELEVANCE]
+        for i, doc in enumerate(relevant, 1):
+            header = f"[Tài liệu {i} - {doc['source']}]:\n"
+            remaining = budget - used - estimate_tokens(header)
+            if remaining < cfg.RAG_MIN_CHUNK_TOKENS:
+                break
+            part = header + truncate_to_tokens(doc["text"].strip(), remaining)
+            parts.append(part)
+            used += estimate_tokens(part)
+        return parts
+
+    def build(
+        self,
+        text: str,
+        history: List[Dict],
+        rag_docs: Optional[List[Dict]],
+        session_id: str = "default",
+        elapsed: Optional[float] = None,
+        prefix: Optional[str] = None,
+    ) -> Tuple[str, List[Dict], Optional[int]]:
+        """
+        Trả về (system_prompt, messages, thinking_budget).
+        history: message của ChatHistory (role, content, seq), cũ trước mới sau.
+        elapsed: số giây đã trôi qua của lượt (từ lúc đóng câu nói), None nếu không rõ.
+        prefix: phần đầu đã được cache (bắt đầu bằng base_prompt); không tính vào ngân sách.
+        """
+        budget = cfg.CONTEXT_MAX_INPUT_TOKENS - self.base_tokens - estimate_tokens(text)
+
+        rag_parts = self._select_rag(rag_docs or [], min(cfg.RAG_MAX_TOKENS, max(budget // 2, 0)))
+        budget -= sum(estimate_tokens(p) for p in rag_parts)
+
+        self._touch(session_id)
+        recent_count = cfg.HISTORY_RECENT_TURNS * 2
+        older = history[:-recent_count] if len(history) > recent_count else []
+        recent = history[-recent_count:] if recent_count else []
+        summary = self._update_summary(session_id, older)
+        # Message đã nằm trong tóm tắt (bị bỏ ở lượt trước vì quá ngân sách) không gửi nguyên văn nữa
+        last_seq = self._summarized_seq[session_id]
+        recent = [m for m in recent if m["seq"] > last_seq]
+        while True:
+            costs = [estimate_tokens(m["content"]) for m in recent]
+            room = budget - estimate_tokens(summary)
+            dropped = 0
+            while dropped < len(recent) and (sum(costs[dropped:]) > room or recent[dropped]["role"] != "user"):
+                # Quá ngân sách: bỏ lượt cũ nhất; lịch sử luôn bắt đầu bằng câu của trẻ
+                dropped += 1
+            if not dropped:
+                break
+            # Lượt bị bỏ được đưa vào tóm tắt; tóm tắt dài ra thì có thể phải bỏ thêm lượt
+            summary = self._update_summary(session_id, recent[:dropped])
+            recent = recent[dropped:]
+
+        messages = [{"role": m["role"], "content": m["content"]} for m in recent]
+        messages.append({"role": "user", "content": text})
+
+        prompt = prefix or self.base_prompt
+        if summary:
+            prompt += "\n\n=== CÁC LƯỢT TRƯỚC (tóm tắt) ===\n" + summary
+        if rag_parts:
+            prompt += (
+                "\n\n=== TÀI LIỆU THAM KHẢO ===\n"
+                + "\n\n".join(rag_parts)
+                + "\n=== KẾT THÚC TÀI LIỆU ==="
+            )
+
+        thinking = self.thinking_budget(elapsed)
+        # Chỉ đếm phần không nằm trong cache (prefix có thể là cả bộ tài liệu)
+        uncached = prompt[len(prefix):] if prefix else prompt
+        input_tokens = estimate_tokens(uncached) + sum(estimate_tokens(m["content"]) for m in messages)
+        metrics.tag("llm_input_tokens", input_tokens)
+        metrics.tag("rag_docs_used", len(rag_parts))
+        if thinking is not None:
+            metrics.tag("thinking_budget", thinking)
+        if rag_parts:
+            log.debug("📚 Using %d relevant documents", len(rag_parts))
+        return prompt, messages, thinking
@@ -0,0 +1,178 @@
+"""
+Graceful Degradation
+Khi cả lớp hỏi cùng lúc, thay vì mọi lượt đều trễ: bộ điều khiển xem số lượt đang chờ vào
+pipeline và p95 độ trễ tới audio đầu tiên của các lượt gần đây, rồi lên / xuống từng bậc
+trong DEGRADATION_TIERS (có trễ khi xuống bậc để không dao động). Các engine đọc
+`degradation.tier` lúc chạy:
+- TTS: ít bước flow matching hơn (tts_steps)
+- LLM: tắt thinking (thinking), bỏ tìm tài liệu RAG (rag)
+- STT: ép greedy search (stt_greedy)
+- server.qos: bậc cuối (canned) trả câu tổng hợp sẵn thay vì chạy pipeline
+"""
+import asyncio
+import time
+from collections import Counter, deque
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from settings import server_settings as cfg
+from .log import get_logger
+from .metrics import metrics
+
+log = get_logger(__name__)
+
+LATENCY_STAGE = "e2e_first_audio"
+
+
+@dataclass(frozen=True)
+class Tier:
+    name: str
+    level: int
+    tts_steps: Optional[int] = None  # None = NUM_STEP của tts_settings
+    thinking: bool = True
+    stt_greedy: bool = False
+    rag: bool = True
+    canned: bool = False
+
+
+def build_tiers(spec) -> List[Tier]:
+    """[(tên, {thay đổi})...] -> các Tier; mỗi bậc giữ các thay đổi của bậc trước nó"""
+    tiers, fields = [], {}
+    for level, (name, changes) in enumerate(spec):
+        fields.update(changes)
+        tiers.append(Tier(name, level, **fields))
+    return tiers
+
+
+class DegradationController:
+    def __init__(self):
+        self.tiers = build_tiers(cfg.DEGRADATION_TIERS)
+        self.level = 0
+        self.forced: Optional[int] = None
+        self.changed_at = time.time()
+        self.pressure: dict = {}
+        self.changes: Counter = Counter()
+        self.seconds: Counter = Counter()  # Thời gian đã ở mỗi bậc (trước lần đổi gần nhất)
+        self.history = deque(maxlen=20)
+        self._over = 0
+        self._under = 0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def tier(self) -> Tier:
+        return self.tiers[self.forced if self.forced is not None else self.level]
+
+    def find(self, name: str) -> int:
+        for tier in self.tiers:
+            if tier.name == name:
+                return tier.level
+        raise ValueError(
+            f"Unknown degradation tier '{name}', choose one of: auto, {', '.join(t.name for t in self.tiers)}"
+        )
+
+    def force(self, name: Optional[str]):
+        """Ép một bậc; None / "auto" trả lại cho bộ điều khiển"""
+        level = None if name in (None, "auto") else self.find(name)
+        previous = self.tier
+        self.forced = level
+        self._changed(previous, "forced" if level is not None else "auto")
+
+    def recent_latency(self) -> List[float]:
+        """e2e_first_audio của các lượt thật sự chạy pipeline, trong cửa sổ và sau lần đổi bậc cuối"""
+        since = max(time.time() - cfg.DEGRADATION_WINDOW_SECONDS, self.changed_at)
+        return [
+            trace["spans"][LATENCY_STAGE]
+            for trace in metrics.recent_traces(LATENCY_STAGE, since)
+            if "qos" not in trace  # Câu "đợi chút" không nói gì về độ trễ của pipeline
+        ]
+
+    def evaluate(self, queue_depth: int) -> Tier:
+        """Một lần kiểm tra: cập nhật áp lực tải, lên / xuống tối đa một bậc"""
+        samples = self.recent_latency()
+        p95 = float(np.percentile(samples, 95)) if len(samples) >= cfg.DEGRADATION_MIN_SAMPLES else None
+        self.pressure = {
+            "queue_depth": queue_depth,
+            "p95_seconds": round(p95, 3) if p95 is not None else None,
+            "samples": len(samples),
+        }
+        slo = cfg.DEGRADATION_LATENCY_SLO_SECONDS
+        if queue_depth >= cfg.DEGRADATION_QUEUE_HIGH or (p95 is not None and p95 > slo):
+            self._over, self._under = self._over + 1, 0
+        elif queue_depth == 0 and (p95 is None or p95 < slo * cfg.DEGRADATION_RECOVER_RATIO):
+            self._over, self._under = 0, self._under + 1
+        else:
+            self._over = self._under = 0
+
+        if self.forced is not None:
+            return self.tier
+        reason = f"queue_depth={queue_depth}, p95={self.pressure['p95_seconds']}"
+        if self._over >= cfg.DEGRADATION_STEP_UP_CHECKS and self.level < len(self.tiers) - 1:
+            self._step(1, reason)
+        elif self._under >= cfg.DEGRADATION_STEP_DOWN_CHECKS and self.level > 0:
+            self._step(-1, reason)
+        return self.tier
+
+    def _step(self, delta: int, reason: str):
+        previous = self.tier
+        self.level += delta
+        self._over = self._under = 0
+        self._changed(previous, reason)
+
+    def _changed(self, previous: Tier, reason: str):
+        current = self.tier
+        if current == previous:
+            return
+        now = time.time()
+        self.seconds[previous.name] += now - self.changed_at
+        self.changed_at = now
+        self.changes[current.name] += 1
+        self.history.append({"at": round(now, 3), "from": previous.name, "to": current.name, "reason": reason})
+        icon = "📉" if current.level > previous.level else "📈"
+        log.info("%s Degradation tier %s -> %s (%s)", icon, previous.name, current.name, reason)
+
+    async def _run(self, queue_depth: Callable[[], int]):
+        while True:
+            await asyncio.sleep(cfg.DEGRADATION_INTERVAL_SECONDS)
+            try:
+                self.evaluate(queue_depth())
+            except Exception as e:
+                log.warning("⚠️  Degradation check failed: %s", e)
+
+    def start(self, queue_depth: Callable[[], int]):
+        """Chạy vòng kiểm tra trong event loop hiện tại; queue_depth() = số lượt đang chờ vào pipeline"""
+        if cfg.DEGRADATION_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run(queue_depth))
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict:
+        tier = self.tier
+        seconds = self.seconds.copy()
+        seconds[tier.name] += time.time() - self.changed_at
+        return {
+            "enabled": cfg.DEGRADATION_ENABLED,
+            "tier": tier.name,
+            "level": tier.level,
+            "forced": self.forced is not None,
+            "pressure": self.pressure,
+            "changes": dict(self.changes),
+            "seconds_in_tier": {name: round(value, 1) for name, value in seconds.items()},
+            "history": list(self.history),
+        }
+
+    def prometheus(self) -> str:
+        lines = [
+            "# TYPE voice_degradation_tier gauge",
+            f"voice_degradation_tier {self.tier.level}",
+            "# TYPE voice_degradation_changes_total counter",
+        ]
+        lines += [f'voice_degradation_changes_total{{tier="{t.name}"}} {self.changes[t.name]}' for t in self.tiers]
+        return "\n".join(lines) + "\n"
+
+
+degradation = DegradationController()
@@ -0,0 +1,182 @@
+"""
+Adaptive End-of-Utterance Detection
+Kết hợp xu hướng xác suất VAD, transcript tạm thời và thống kê khoảng ngừng của từng thiết bị
+để quyết định khi nào một câu nói đã kết thúc.
+"""
+import re
+from collections import deque
+from typing import Dict, Optional
+
+import numpy as np
+
+
+# Từ cuối câu thường gặp khi trẻ hỏi xong ("... không?", "... bao nhiêu?")
+COMPLETE_ENDINGS = (
+    "không", "chưa", "nhỉ", "nhé", "hả", "ạ", "sao", "gì", "nào",
+    "đâu", "bao nhiêu", "mấy", "thế", "vậy", "ai",
+)
+
+# Từ nối/ngập ngừng: câu nói chắc chắn chưa xong
+HESITANT_ENDINGS = (
+    "và", "với", "thì", "là", "mà", "của", "nhưng", "hoặc", "hay",
+    "rồi thì", "ừm", "ờ", "ơ", "để", "cho",
+)
+
+
+def _last_words(text: str, n: int) -> str:
+    words = re.findall(r"\w+", text.lower(), flags=re.UNICODE)
+    return " ".join(words[-n:])
+
+
+def transcript_looks_complete(text: str) -> bool:
+    """Câu đã trọn ý (ví dụ kết thúc bằng từ để hỏi)"""
+    return any(
+        _last_words(text, len(ending.split())) == ending for ending in COMPLETE_ENDINGS
+    )
+
+
+def transcript_looks_hesitant(text: str) -> bool:
+    """Câu kết thúc bằng từ nối/ngập ngừng, người nói nhiều khả năng sẽ nói tiếp"""
+    return any(
+        _last_words(text, len(ending.split())) == ending for ending in HESITANT_ENDINGS
+    )
+
+
+class PauseStats:
+    """Thống kê độ dài các khoảng ngừng giữa câu (đơn vị: frame) của một thiết bị"""
+
+    def __init__(self, max_samples: int = 200, min_samples: int = 10):
+        self.pauses = deque(maxlen=max_samples)
+        self.min_samples = min_samples
+
+    def add(self, frames: int):
+        self.pauses.append(frames)
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Phân vị q (0-100) của khoảng ngừng, None nếu chưa đủ dữ liệu"""
+        if len(self.pauses) < self.min_samples:
+            return None
+        return float(np.percentile(np.fromiter(self.pauses, dtype=np.float32), q))
+
+
+_device_pause_stats: Dict[str, PauseStats] = {}
+
+
+def get_pause_stats(device_id: str) -> PauseStats:
+    """Thống kê khoảng ngừng được giữ lại giữa các lần kết nối của cùng một thiết bị"""
+    return _device_pause_stats.setdefault(device_id, PauseStats())
+
+
+def forget_pause_stats(device_id: str):
+    _device_pause_stats.pop(device_id, None)
+
+
+class AdaptiveEndpointer:
+    """
+    Quyết định kết thúc câu nói theo từng frame VAD.
+
+    Số frame im lặng cần chờ không cố định mà được tính lại mỗi frame:
+    - Thống kê: lấy phân vị PAUSE_PERCENTILE của các khoảng ngừng giữa câu mà
+      thiết bị này từng có (ngừng rồi nói tiếp), cộng thêm một khoảng an toàn.
+    - Xu hướng VAD: xác suất rơi hẳn về ~0 -> kết thúc sớm hơn; xác suất lơ lửng
+      dưới ngưỡng (thở, "ừm...") -> chờ lâu hơn.
+    - Transcript tạm thời: câu đã trọn ý thì đóng sớm, câu dừng ở từ nối thì chờ thêm.
+    """
+
+    PAUSE_PERCENTILE = 90
+    PAUSE_MARGIN_FRAMES = 3
+    MIN_PAUSE_FRAMES = 3          # Khoảng ngừng ngắn hơn được coi là nhiễu VAD
+    CONFIDENT_PROB = 0.1          # Xác suất trung bình khi im lặng "thật"
+    HESITANT_PROB = 0.25          # Xác suất trung bình khi ngập ngừng
+    CONFIDENT_FACTOR = 0.8
+    HESITANT_FACTOR = 1.4
+
+    def __init__(
+        self,
+        pause_stats: PauseStats,
+        default_frames: int,
+        min_frames: int,
+        max_frames: int,
+    ):
+        self.pause_stats = pause_stats
+        self.default_frames = default_frames
+        self.min_frames = min_frames
+        self.max_frames = max_frames
+        self.partial_id = 0
+        self.gap_frames: Optional[int] = None
+        self._reset_utterance()
+
+    def _reset_utterance(self):
+        self.silence_frames = 0
+        self.silence_probs = []
+        self.partial_text: Optional[str] = None
+        self.partial_id += 1
+
+    def start(self):
+        """
+        Bắt đầu câu nói mới. Nếu trẻ nói tiếp ngay sau khi câu trước vừa bị đóng,
+        khoảng lặng đó thực chất là một khoảng ngừng giữa câu -> đưa vào thống kê,
+        tránh việc ngưỡng học được chỉ toàn các khoảng ngừng ngắn hơn ngưỡng hiện tại.
+        """
+        if self.gap_frames is not None:
+            self.pause_stats.add(self.gap_frames)
+            self.gap_frames = None
+        self._reset_utterance()
+
+    def end(self):
+        """Câu nói vừa được đóng; bắt đầu đếm khoảng lặng sau đó"""
+        self.gap_frames = self.silence_frames
+        self._reset_utterance()
+
+    def on_idle(self):
+        """Frame im lặng khi không có câu nói nào đang thu"""
+        if self.gap_frames is not None:
+            self.gap_frames += 1
+            if self.gap_frames > self.max_frames:
+                self.gap_frames = None
+
+    def on_speech(self):
+        """Frame có tiếng nói: nếu trước đó đang ngừng thì đó là một khoảng ngừng giữa câu"""
+        if self.silence_frames >= self.MIN_PAUSE_FRAMES:
+            self.pause_stats.add(self.silence_frames)
+        self.silence_frames = 0
+        self.silence_probs.clear()
+        self.partial_text = None
+        self.partial_id += 1
+
+    def on_silence(self, speech_prob: float) -> bool:
+        """Frame im lặng trong câu nói; trả về True nếu đã đủ điều kiện kết thúc câu"""
+        self.silence_frames += 1
+        self.silence_probs.append(speech_prob)
+        return self.silence_frames >= self.required_silence_frames()
+
+    def begin_partial(self) -> int:
+        """Đánh dấu bắt đầu decode transcript tạm thời cho khoảng ngừng hiện tại"""
+        return self.partial_id
+
+    def set_partial_transcript(self, text: str, partial_id: int):
+        """Bỏ qua kết quả đến muộn nếu người nói đã nói tiếp sau khi bắt đầu decode"""
+        if partial_id == self.partial_id:
+            self.partial_text = text
+
+    def required_silence_frames(self) -> int:
+        learned = self.pause_stats.percentile(self.PAUSE_PERCENTILE)
+        if learned is None:
+            frames = float(self.default_frames)
+        else:
+            frames = learned + self.PAUSE_MARGIN_FRAMES
+
+        if self.silence_probs:
+            mean_prob = sum(self.silence_probs) / len(self.silence_probs)
+            if mean_prob < self.CONFIDENT_PROB:
+                frames *= self.CONFIDENT_FACTOR
+            elif mean_prob > self.HESITANT_PROB:
+                frames *= self.HESITANT_FACTOR
+
+        if self.partial_text is not None:
+            if transcript_looks_complete(self.partial_text):
+                frames = self.min_frames
+            elif transcript_looks_hesitant(self.partial_text):
+                frames = max(frames, self.default_frames) * self.HESITANT_FACTOR
+
+        return int(min(max(frames, self.min_frames), self.max_frames))
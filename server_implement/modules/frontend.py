@@ -0,0 +1,136 @@
+"""
+Audio Front-end
+Xử lý từng frame PCM 16-bit của thiết bị trước khi đưa vào VAD/STT:
+lọc thông cao bỏ DC -> khử nhiễu trừ phổ (spectral subtraction) -> AGC theo block.
+Mỗi kết nối có một AudioFrontEnd riêng (trạng thái lọc, ước lượng nhiễu, gain),
+mọi phép tính trong một frame đều vector hoá bằng NumPy.
+"""
+import numpy as np
+
+
+SAMPLE_RATE = 16000
+
+# --- DC high-pass (bậc 1: y[n] = x[n] - x[n-1] + a*y[n-1]) ---
+HIGHPASS_POLE = 0.995           # ~13 Hz ở 16 kHz
+
+# --- Khử nhiễu (STFT 30ms, hop 15ms, cửa sổ sqrt-Hann, overlap-add) ---
+DENOISE_FFT_SIZE = 480
+DENOISE_OVERSUBTRACT = 1.5
+DENOISE_FLOOR = 0.15            # Gain tối thiểu mỗi bin: khử nhẹ để không làm méo giọng
+NOISE_RISE = 1.002              # Ước lượng nhiễu tăng chậm (~0.6 dB/s) khi nền ồn lên
+NOISE_FALL = 0.1                # Hệ số cập nhật khi công suất xuống dưới mức nhiễu hiện tại
+NOISE_INIT_HOPS = 10            # 150ms đầu: chỉ ước lượng nhiễu (min theo bin), chưa khử
+
+# --- AGC ---
+AGC_TARGET_RMS = 0.1            # ~ -20 dBFS
+AGC_MIN_GAIN = 0.5
+AGC_MAX_GAIN = 16.0             # +24 dB cho các board micro nhỏ
+AGC_GATE_RMS = 0.003            # Dưới mức này (im lặng) giữ nguyên gain, không khuếch đại nhiễu
+AGC_ATTACK = 0.5                # Giảm gain nhanh khi to lên
+AGC_RELEASE = 0.05              # Tăng gain chậm khi nhỏ đi
+
+
+class AudioFrontEnd:
+    """Trạng thái front-end của một kết nối; gọi trên từng frame bytes, trả về bytes cùng độ dài"""
+
+    def __init__(self, denoise: bool = True, agc: bool = True):
+        self.denoise = denoise
+        self.agc = agc
+
+        # DC high-pass
+        self._hp_x = 0.0
+        self._hp_y = 0.0
+        self._hp_len = 0
+        self._hp_pows = None
+
+        # Denoise
+        hop = DENOISE_FFT_SIZE // 2
+        self._hop = hop
+        self._window = np.sqrt(np.hanning(DENOISE_FFT_SIZE + 1)[:-1]).astype(np.float32)
+        self._in_tail = np.zeros(hop, dtype=np.float32)
+        self._ola = np.zeros(hop, dtype=np.float32)
+        self._noise = None
+        self._hops_seen = 0
+
+        # AGC
+        self.gain = 1.0
+
+    def _highpass(self, x: np.ndarray) -> np.ndarray:
+        """IIR bậc 1 dạng đóng: y[n] = a^n * (y[-1]*a + sum_k d[k] * a^-k), tính bằng cumsum"""
+        n = len(x)
+        if n != self._hp_len:
+            k = np.arange(n, dtype=np.float64)
+            self._hp_pows = (HIGHPASS_POLE ** k, HIGHPASS_POLE ** -k)
+            self._hp_len = n
+        pows, inv_pows = self._hp_pows
+        d = np.diff(x, prepend=self._hp_x)
+        y = pows * (self._hp_y * HIGHPASS_POLE + np.cumsum(d * inv_pows))
+        self._hp_x = float(x[-1])
+        self._hp_y = float(y[-1])
+        return y.astype(np.float32)
+
+    def _spectral_subtract(self, x: np.ndarray) -> np.ndarray:
+        """
+        Mỗi frame 480 mẫu gồm 2 cửa sổ STFT (hop 240); trả về 480 mẫu đã khử nhiễu,
+        trễ một hop (15ms) so với đầu vào do overlap-add.
+        """
+        hop = self._hop
+        n_hops = len(x) // hop
+        seg = np.concatenate([self._in_tail, x])
+        idx = np.arange(n_hops)[:, None] * hop + np.arange(DENOISE_FFT_SIZE)[None, :]
+        spectra = np.fft.rfft(seg[idx] * self._window, axis=1)
+        power = spectra.real ** 2 + spectra.imag ** 2
+
+        for i in range(n_hops):
+            self._hops_seen += 1
+            if self._noise is None:
+                self._noise = power[i].copy()
+                continue
+            if self._hops_seen <= NOISE_INIT_HOPS:
+                # Kết nối có thể bắt đầu giữa lúc đang nói: lấy min để không coi giọng nói là nhiễu
+                np.minimum(self._noise, power[i], out=self._noise)
+                continue
+            below = power[i] < self._noise
+            self._noise = np.where(
+                below,
+                self._noise + NOISE_FALL * (power[i] - self._noise),
+                self._noise * NOISE_RISE,
+            )
+            gain = 1.0 - DENOISE_OVERSUBTRACT * self._noise / np.maximum(power[i], 1e-12)
+            spectra[i] *= np.maximum(gain, DENOISE_FLOOR)
+
+        frames = np.fft.irfft(spectra, n=DENOISE_FFT_SIZE, axis=1).astype(np.float32) * self._window
+        out = np.empty(n_hops * hop, dtype=np.float32)
+        ola = self._ola
+        for i in range(n_hops):
+            out[i * hop:(i + 1) * hop] = ola + frames[i, :hop]
+            ola = frames[i, hop:]
+        self._ola = ola.copy()
+        self._in_tail = seg[-hop:].copy()
+        return out
+
+    def _apply_agc(self, x: np.ndarray) -> np.ndarray:
+        """Gain mục tiêu theo RMS của block, làm mượt attack/release và nội suy trong frame để không bị 'zipper'"""
+        rms = float(np.sqrt(np.mean(x * x)))
+        target = self.gain
+        if rms > AGC_GATE_RMS:
+            desired = min(max(AGC_TARGET_RMS / rms, AGC_MIN_GAIN), AGC_MAX_GAIN)
+            rate = AGC_ATTACK if desired < self.gain else AGC_RELEASE
+            target = self.gain + rate * (desired - self.gain)
+        ramp = np.linspace(self.gain, target, len(x), dtype=np.float32)
+        self.gain = target
+        return x * ramp
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """float32 trong khoảng [-1, 1] -> float32 đã xử lý"""
+        x = self._highpass(samples)
+        if self.denoise and len(x) % self._hop == 0:
+            x = self._spectral_subtract(x)
+        if self.agc:
+            x = self._apply_agc(x)
+        return x
+
+    def __call__(self, pcm: bytes) -> bytes:
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) * (1.0 / 32768.0)
+        out = self.process(samples)
+        return np.clip(out * 32768.0, -32768, 32767).astype(np.int16).tobytes()
@@ -0,0 +1,65 @@
+"""
+Hotwords for STT contextual biasing
+Tạo file hotwords cho modified_beam_search của sherpa-onnx từ từ vựng bài học:
+danh sách cố định (số đếm, phép tính) + các cụm từ lặp lại nhiều trong tài liệu RAG.
+"""
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Iterable, List
+
+from settings import stt_settings as cfg
+from settings import llm_settings
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+def _words(text: str) -> List[str]:
+    return re.findall(r"[^\W\d_]+", text.lower(), flags=re.UNICODE)
+
+
+def corpus_phrases(rag_dir: Path, max_phrases: int, min_count: int) -> List[str]:
+    """
+    Cụm 2-3 âm tiết xuất hiện ít nhất min_count lần trong tài liệu RAG.
+    Tiếng Việt đơn âm tiết nên cụm từ (không phải từ đơn) mới là đơn vị đáng để bias.
+    """
+    rag_dir = Path(rag_dir)
+    if not rag_dir.exists():
+        return []
+
+    counts: Counter = Counter()
+    for file_path in rag_dir.rglob("*.txt"):
+        try:
+            text = file_path.read_text(encoding="utf-8")
+        except Exception as e:
+            log.warning("⚠️  Hotwords: cannot read %s: %s", file_path, e)
+            continue
+        for line in text.splitlines():
+            words = _words(line)
+            for n in (2, 3):
+                for i in range(len(words) - n + 1):
+                    counts[" ".join(words[i:i + n])] += 1
+
+    phrases = [p for p, c in counts.most_common() if c >= min_count]
+    return phrases[:max_phrases]
+
+
+def build_hotwords_file(
+    output_path: Path,
+    rag_dir: Path = llm_settings.RAG_DIR,
+    extra: Iterable[str] = cfg.CURRICULUM_HOTWORDS,
+) -> int:
+    """Ghi file hotwords (mỗi dòng một cụm); trả về số cụm đã ghi"""
+    phrases = list(dict.fromkeys(
+        [p.strip().lower() for p in extra if p.strip()]
+        + corpus_phrases(rag_dir, cfg.HOTWORDS_MAX_CORPUS_PHRASES, cfg.HOTWORDS_MIN_COUNT)
+    ))
+    if cfg.HOTWORDS_UPPERCASE:
+        phrases = [p.upper() for p in phrases]
+
+    output_path = Path(output_path)
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text("\n".join(phrases) + "\n", encoding="utf-8")
+    log.debug("Wrote %d hotwords to %s", len(phrases), output_path)
+    return len(phrases)
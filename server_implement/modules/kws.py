@@ -0,0 +1,96 @@
+"""
+Wake Word Module (keyword spotting)
+sherpa-onnx KeywordSpotter: một model streaming nhỏ dùng chung cho mọi kết nối,
+mỗi kết nối một stream. Chạy trên từng frame 30ms khi thiết bị đang chờ wake word;
+chỉ câu nói sau wake word mới được đưa vào VAD/STT/LLM.
+"""
+from typing import List, Optional
+
+import numpy as np
+
+from settings import kws_settings as cfg
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+def _find_model_file(patterns: List[str]) -> str:
+    for pattern in patterns:
+        files = sorted(cfg.MODEL_DIR.glob(pattern))
+        if files:
+            return str(files[0])
+    raise FileNotFoundError(f"KWS model file not found in {cfg.MODEL_DIR} for patterns: {patterns}")
+
+
+def build_keywords_file(sherpa_onnx, tokens_path: str) -> int:
+    """Tách KEYWORDS thành token của model (định dạng keywords file của sherpa-onnx); trả về số keyword"""
+    bpe_model = _find_model_file(cfg.BPE_MODEL_PATTERNS) if cfg.KEYWORDS_TOKENS_TYPE == "bpe" else None
+    phrases = [p.strip() for p in cfg.KEYWORDS if p.strip()]
+    token_lists = sherpa_onnx.text2token(
+        phrases, tokens=tokens_path, tokens_type=cfg.KEYWORDS_TOKENS_TYPE, bpe_model=bpe_model
+    )
+    lines = [
+        f"{' '.join(tokens)} @{phrase.replace(' ', '_')}"
+        for phrase, tokens in zip(phrases, token_lists)
+    ]
+    cfg.KEYWORDS_FILE.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    log.debug("Wrote %d keywords to %s", len(lines), cfg.KEYWORDS_FILE)
+    return len(lines)
+
+
+class KeywordSpotterModel:
+    """Model KWS dùng chung; trạng thái decode nằm trong từng KeywordStream"""
+
+    def __init__(self):
+        # Import tại đây: chỉ cần sherpa-onnx khi bật wake word phía server
+        import sherpa_onnx
+
+        log.info("🔧 Initializing keyword spotter...")
+        tokens = _find_model_file(cfg.TOKENS_FILE_PATTERNS)
+        count = build_keywords_file(sherpa_onnx, tokens)
+        self.spotter = sherpa_onnx.KeywordSpotter(
+            tokens=tokens,
+            encoder=_find_model_file(cfg.ENCODER_FILE_PATTERNS),
+            decoder=_find_model_file(cfg.DECODER_FILE_PATTERNS),
+            joiner=_find_model_file(cfg.JOINER_FILE_PATTERNS),
+            keywords_file=str(cfg.KEYWORDS_FILE),
+            num_threads=cfg.NUM_THREADS,
+            sample_rate=cfg.SAMPLE_RATE,
+            feature_dim=cfg.FEATURE_DIM,
+            max_active_paths=cfg.MAX_ACTIVE_PATHS,
+            keywords_score=cfg.KEYWORDS_SCORE,
+            keywords_threshold=cfg.KEYWORDS_THRESHOLD,
+            num_trailing_blanks=cfg.NUM_TRAILING_BLANKS,
+            provider=cfg.PROVIDER,
+        )
+        self.keywords = count
+        self.detections = 0
+        log.info("✅ Keyword spotter ready (%d keywords: %s)", count, ", ".join(cfg.KEYWORDS))
+
+    def new_stream(self) -> "KeywordStream":
+        return KeywordStream(self)
+
+    def stats(self) -> dict:
+        return {"keywords": list(cfg.KEYWORDS), "detections": self.detections}
+
+
+class KeywordStream:
+    """Stream KWS của một kết nối; gọi trên frame PCM 16-bit, trả về keyword khi phát hiện"""
+
+    def __init__(self, model: KeywordSpotterModel):
+        self.model = model
+        self.stream = model.spotter.create_stream()
+
+    def __call__(self, pcm: bytes) -> Optional[str]:
+        spotter = self.model.spotter
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) * (1.0 / 32768.0)
+        self.stream.accept_waveform(cfg.SAMPLE_RATE, samples)
+        while spotter.is_ready(self.stream):
+            spotter.decode_stream(self.stream)
+            keyword = spotter.get_result(self.stream)
+            if keyword:
+                # Phải reset sau mỗi lần phát hiện, nếu không keyword bị báo lại ở frame sau
+                spotter.reset_stream(self.stream)
+                self.model.detections += 1
+                return keyword
+        return None
@@ -2,13 +2,25 @@ import os
 import json
 import time
 import re
+import math
+import asyncio
+import random
+import threading
+from collections import deque
 from pathlib import Path
 from typing import List, Dict, Optional, Tuple
 
-from google import genai
-from google.genai import types
+import numpy as np
 
 from settings import llm_settings as cfg
+from . import metrics
+from .degradation import degradation
+from .llm_backends import LLMBackend, create_backend
+from .context import ContextBuilder, estimate_tokens
+from .prompt_cache import CachedPrefix, PromptCache
+from .log import get_logger
+
+log = get_logger(__name__)
 
 
 class SimpleRAG:
@@ -24,68 +36,133 @@ class SimpleRAG:
         self.chunk_size = chunk_size or cfg.RAG_CHUNK_SIZE
         self.overlap = overlap or cfg.RAG_CHUNK_OVERLAP
         self.chunks: List[Tuple[str, str]] = []
+        self.chunk_tokens: List[set] = []
+        self.idf: Dict[str, float] = {}
+        self.documents: List[Tuple[str, str]] = []
+        self.version = 0  # Tăng mỗi lần nạp lại, để biết prefix cache có còn đúng không
+        self._file_stats: Tuple = ()
         self._loaded = False
+        # search() / corpus_text() chạy trong nhiều thread (asyncio.to_thread): chỉ một lần nạp
+        # tại một thời điểm, và index mới được dựng riêng rồi mới thay vào (reader không bao giờ
+        # thấy index trống hay nửa cũ nửa mới)
+        self._build_lock = threading.Lock()
+        self._lock = threading.Lock()
     
     def _tokenize(self, s: str) -> List[str]:
         """Tokenize text thành các từ"""
-        return re.findall(r"\\w+", s.lower(), flags=re.UNICODE)
+        return re.findall(r"\w+", s.lower(), flags=re.UNICODE)
     
+    def _scan(self) -> Tuple:
+        """(đường dẫn, mtime, size) của các file tài liệu; đổi khi có file được thêm/sửa/xoá"""
+        if not self.folder.exists():
+            return ()
+        return tuple(sorted(
+            (str(p), p.stat().st_mtime_ns, p.stat().st_size) for p in self.folder.rglob("*.txt")
+        ))
+
+    def reload_if_changed(self) -> bool:
+        """Nạp lại tài liệu nếu thư mục RAG đã thay đổi; trả về True nếu có nạp lại"""
+        if not self._loaded:
+            return False
+        with self._build_lock:
+            if self._scan() == self._file_stats:
+                return False
+            log.info("🔄 RAG documents changed, reloading")
+            self._swap(*self._build())
+        return True
+
+    def corpus_text(self) -> str:
+        """Toàn bộ tài liệu (không chia chunk), dùng làm phần tĩnh của prompt"""
+        self._load()
+        with self._lock:
+            documents = self.documents
+        return "\n\n".join(
+            f"[{Path(src).name}]:\n{text.strip()}" for src, text in documents
+        )
+
     def _load(self):
-        """Load và chunk các document"""
+        """Load và chunk các document (một lần)"""
         if self._loaded:
             return
-        
+        with self._build_lock:
+            if not self._loaded:
+                self._swap(*self._build())
+
+    def _build(self):
+        """Dựng index mới trong biến cục bộ; trả về (file_stats, documents, chunks, chunk_tokens, idf)"""
         if not self.folder.exists():
-            print(f"⚠️  RAG folder không tồn tại: {self.folder}")
+            log.warning("⚠️  RAG folder không tồn tại: %s", self.folder)
             self.folder.mkdir(parents=True, exist_ok=True)
-            self._loaded = True
-            return
+            return (), [], [], [], {}
         
-        print(f"📚 Loading RAG documents from {self.folder}...")
-        doc_count = 0
+        log.info("📚 Loading RAG documents from %s...", self.folder)
+        file_stats = self._scan()
+        documents: List[Tuple[str, str]] = []
+        chunks: List[Tuple[str, str]] = []
         
         for file_path in self.folder.rglob("*.txt"):
             try:
                 with open(file_path, "r", encoding="utf-8") as f:
                     text = f.read()
+                documents.append((str(file_path), text))
                 
                 i = 0
                 while i < len(text):
                     chunk = text[i:i + self.chunk_size]
-                    self.chunks.append((str(file_path), chunk))
+                    chunks.append((str(file_path), chunk))
                     i += self.chunk_size - self.overlap
-                
-                doc_count += 1
             except Exception as e:
-                print(f"  ⚠️  Error loading {file_path}: {e}")
+                log.warning("⚠️  Error loading %s: %s", file_path, e)
         
-        print(f"  ✓ Loaded {doc_count} documents, {len(self.chunks)} chunks")
-        self._loaded = True
+        # Token của từng chunk và IDF được tính một lần, không phải mỗi câu hỏi
+        chunk_tokens = [set(self._tokenize(chunk)) for _, chunk in chunks]
+        doc_freq: Dict[str, int] = {}
+        for tokens in chunk_tokens:
+            for token in tokens:
+                doc_freq[token] = doc_freq.get(token, 0) + 1
+        n = len(chunks)
+        idf = {token: math.log((n + 1) / (df + 0.5)) for token, df in doc_freq.items()}
+
+        log.info("✓ Loaded %d documents, %d chunks", len(documents), len(chunks))
+        return file_stats, documents, chunks, chunk_tokens, idf
+
+    def _swap(self, file_stats, documents, chunks, chunk_tokens, idf):
+        with self._lock:
+            self._file_stats = file_stats
+            self.documents, self.chunks, self.chunk_tokens, self.idf = documents, chunks, chunk_tokens, idf
+            self.version += 1
+            self._loaded = True
     
     def search(self, query: str, top_k: int = None) -> List[Dict[str, any]]:
         """Tìm kiếm các chunk liên quan nhất"""
         self._load()
+        with self._lock:
+            chunks, chunk_tokens, idf = self.chunks, self.chunk_tokens, self.idf
         
-        if not self.chunks:
+        if not chunks:
             return []
         
         top_k = top_k or cfg.RAG_TOP_K
         q_tokens = set(self._tokenize(query))
+        # Từ không có trong tài liệu được coi là hiếm nhất: câu hỏi lạc đề có relevance thấp
+        max_idf = math.log(len(chunks) + 1) + 1.0
+        q_weight = sum(idf.get(t, max_idf) for t in q_tokens) or 1.0
         
         scored = []
-        for src, chunk in self.chunks:
-            c_tokens = set(self._tokenize(chunk))
-            score = len(q_tokens & c_tokens)
-            if score > 0:
-                scored.append((score, src, chunk))
+        for (src, chunk), c_tokens in zip(chunks, chunk_tokens):
+            matched = q_tokens & c_tokens
+            if matched:
+                relevance = sum(idf[t] for t in matched) / q_weight
+                scored.append((relevance, len(matched), src, chunk))
         
-        scored.sort(key=lambda x: x, reverse=True)
+        scored.sort(key=lambda x: x[:2], reverse=True)
         
         results = []
-        for score, src, chunk in scored[:top_k]:
+        for relevance, score, src, chunk in scored[:top_k]:
             results.append({
                 "source": Path(src).name,
                 "score": int(score),
+                "relevance": round(relevance, 3),
                 "text": chunk
             })
         
@@ -104,25 +181,30 @@ class ChatHistory:
     def add(self, session_id: str, role: str, text: str):
         """Thêm message vào history"""
         messages = self.memory.setdefault(session_id, [])
+        # Số thứ tự tăng dần trong session (để biết message nào đã được tóm tắt); tính theo
+        # message cuối nên vẫn đúng khi lịch sử được nạp lại từ session store trên node khác
+        seq = messages[-1]["seq"] + 1 if messages else 1
         messages.append({
             "role": role,
             "content": text,
-            "timestamp": time.time()
+            "timestamp": time.time(),
+            "seq": seq
         })
         
         if len(messages) > cfg.MAX_HISTORY_TURNS * 2:
             self.memory[session_id] = messages[-cfg.MAX_HISTORY_TURNS * 2:]
         
         try:
-            with open(self.history_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps({
-                    "session_id": session_id,
-                    "role": role,
-                    "content": text,
-                    "timestamp": time.time()
-                }, ensure_ascii=False) + "\\n")
+            with metrics.span("history_write"), metrics.usage("history_write"):
+                with open(self.history_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({
+                        "session_id": session_id,
+                        "role": role,
+                        "content": text,
+                        "timestamp": time.time()
+                    }, ensure_ascii=False) + "\\n")
         except Exception as e:
-            print(f"⚠️  Failed to save history: {e}")
+            log.warning("⚠️  Failed to save history: %s", e)
     
     def get_history(self, session_id: str) -> List[Dict]:
         """Lấy lịch sử hội thoại"""
@@ -133,59 +215,300 @@ class ChatHistory:
         if session_id in self.memory:
             del self.memory[session_id]
 
+    def restore(self, session_id: str, messages: List[Dict]):
+        """Nạp lại lịch sử một session (từ session store, khi thiết bị kết nối vào node này)"""
+        self.memory[session_id] = list(messages)[-cfg.MAX_HISTORY_TURNS * 2:]
+
 
 class LLMEngine:
-    """LLM Engine with Gemini API - Features: Chain of Thought, RAG"""
+    """LLM Engine (Gemini / OpenAI-compatible / mock backend) - Features: Chain of Thought, RAG"""
     
-    def __init__(self):
-        self.client = None
+    def __init__(self, backend: Optional[str] = None):
+        """
+        Args:
+            backend: tên backend trong llm_backends.BACKENDS; None = llm_settings.LLM_BACKEND
+        """
+        self.backend: Optional[LLMBackend] = None
         self.rag = SimpleRAG(cfg.RAG_DIR)
         self.history = ChatHistory()
-        self._initialize_client()
+        self.context = ContextBuilder()
+        self.ttft_samples = deque(maxlen=200)  # TTFT gần đây, dùng để chọn thời điểm gửi hedged request
+        self.prompt_cache: Optional[PromptCache] = None
+        self._prefix = (-1, "")  # (phiên bản tài liệu RAG, prefix tĩnh tương ứng)
+        self._corpus_checked_at = time.monotonic()
+        self._initialize_backend(backend)
     
-    def _initialize_client(self):
-        """Khởi tạo Gemini client"""
-        print("🔧 Initializing Gemini LLM...")
-        
-        api_key = cfg.GEMINI_API_KEY
-        if not api_key or api_key == "YOUR_API_KEY_HERE":
-            raise ValueError(
-                "❌ GEMINI_API_KEY chưa được cấu hình!\\n"
-                "Vui lòng set environment variable GEMINI_API_KEY "
-                "hoặc cập nhật settings/llm_settings.py"
-            )
-        
-        self.client = genai.Client(api_key=api_key)
-        print(f"  ✓ Model: {cfg.GEMINI_MODEL}")
-        print(f"  ✓ Chain of Thought: {'Enabled' if cfg.USE_THINKING else 'Disabled'}")
-        print("✅ LLM initialized successfully")
-    
-    def _build_system_prompt(self) -> str:
-        """Xây dựng system prompt"""
-        return cfg.ROLE_PROMPT + "\\n" + cfg.SAFETY_PROMPT
+    def _initialize_backend(self, backend: Optional[str]):
+        """Khởi tạo backend sinh câu trả lời"""
+        log.info("🔧 Initializing LLM backend '%s'...", backend or cfg.LLM_BACKEND)
+        self.backend = create_backend(backend)
+        if cfg.CONTEXT_CACHE_ENABLED and self.backend.supports_cache:
+            self.prompt_cache = PromptCache(self.backend)
+        log.info("✅ LLM initialized successfully")
+
+    def _static_prefix(self) -> str:
+        """System prompt, kèm toàn bộ tài liệu bài học nếu CONTEXT_CACHE_CORPUS và đủ nhỏ"""
+        now = time.monotonic()
+        if now - self._corpus_checked_at >= cfg.CONTEXT_CACHE_CHECK_SECONDS:
+            self._corpus_checked_at = now
+            self.rag.reload_if_changed()
+        self.rag._load()
+        if self._prefix[0] != self.rag.version:
+            prefix = self.context.base_prompt
+            corpus = self.rag.corpus_text() if cfg.CONTEXT_CACHE_CORPUS else ""
+            if corpus and estimate_tokens(corpus) <= cfg.CONTEXT_CACHE_MAX_CORPUS_TOKENS:
+                prefix = self.context.with_documents(corpus)
+            self._prefix = (self.rag.version, prefix)
+        return self._prefix[1]
+
+    def _cached_prefix(self) -> Optional[CachedPrefix]:
+        """Cached content cho prefix tĩnh (tạo / gia hạn khi cần); None nếu không dùng cache"""
+        if self.prompt_cache is None:
+            return None
+        return self.prompt_cache.get(self._static_prefix())
+
+    def warm_prompt_cache(self):
+        """Tạo sẵn context cache lúc khởi động để lượt đầu tiên không phải chờ"""
+        self._cached_prefix()
+
+    def _corpus_cached(self, cache: Optional[CachedPrefix]) -> bool:
+        return cache is not None and cache.text != self.context.base_prompt
+
+    def _drop_cache(self, cache: Optional[CachedPrefix], error: Exception) -> bool:
+        """Cache hết hạn / bị xoá phía server: bỏ đi để gửi lại nguyên prompt; trả về True nếu đúng vậy"""
+        if cache is None or not self.backend.is_cache_error(error):
+            return False
+        self.prompt_cache.invalidate(cache.name)
+        return True
     
-    def _format_rag_context(self, docs: List[Dict]) -> str:
-        """Format RAG documents thành context"""
-        if not docs:
-            return ""
+    def _build_request(
+        self,
+        text: str,
+        session_id: str,
+        use_rag: bool,
+        rag_docs: Optional[List[Dict]] = None,
+        cache: Optional[CachedPrefix] = None,
+    ):
+        """Ghép prompt trong ngân sách token; trả về (system_prompt, messages, thinking_budget) cho backend"""
+        if self._corpus_cached(cache):
+            use_rag = False  # Tài liệu bài học đã nằm trong prefix được cache
+        if rag_docs is None and use_rag:
+            with metrics.span("rag"):
+                rag_docs = self.rag.search(text)
+
+        trace = metrics.current_trace()
+        elapsed = trace.since("eos") if trace else None
+        return self.context.build(
+            text,
+            self.history.get_history(session_id),
+            rag_docs if use_rag else None,
+            session_id=session_id,
+            elapsed=elapsed,
+            prefix=cache.text if cache else None,
+        )
+
+    def generate_reply(
+        self,
+        text: str,
+        session_id: str = "default",
+        use_rag: bool = True
+    ) -> str:
+        """
+        Sinh câu trả lời cho `text` mà KHÔNG ghi vào lịch sử hội thoại.
+        Dùng cho chạy suy đoán: chỉ khi kết quả được dùng mới gọi commit_turn().
+        Lỗi từ Gemini được raise ra cho phía gọi xử lý.
+        """
+        cache = self._cached_prefix()
+        use_rag = use_rag and degradation.tier.rag
         
-        context_parts = []
-        for i, doc in enumerate(docs, 1):
-            context_parts.append(
-                f"[Tài liệu {i} - {doc['source']}]:\\n{doc['text']}"
-            )
+        # Dùng stream để đo được thời gian tới token đầu tiên (TTFT)
+        start = time.perf_counter()
+        parts = []
+        with metrics.span("llm_total"):
+            while True:
+                system_prompt, messages, thinking_budget = self._build_request(text, session_id, use_rag, cache=cache)
+                try:
+                    for chunk in self.backend.stream(system_prompt, messages, thinking_budget, cache):
+                        if not parts:
+                            metrics.record("llm_ttft", time.perf_counter() - start)
+                        parts.append(chunk)
+                    break
+                except Exception as e:
+                    if parts or not self._drop_cache(cache, e):
+                        raise
+                    cache = None
         
-        return "\\n\\n".join(context_parts)
+        reply = "".join(parts)
+        log.info("🤖 Assistant: %s", reply)
+        return reply
+
+    # ===== Async =====
+
+    def _hedge_delay(self) -> float:
+        """Chờ tới p95 TTFT gần đây rồi mới gửi request thứ hai"""
+        if len(self.ttft_samples) < cfg.LLM_HEDGE_MIN_SAMPLES:
+            return cfg.LLM_HEDGE_DEFAULT_DELAY
+        return float(np.percentile(self.ttft_samples, cfg.LLM_HEDGE_PERCENTILE))
+
+    async def _stream_once(
+        self,
+        system_prompt: str,
+        messages: List[Dict],
+        thinking_budget: Optional[int],
+        cache: Optional[CachedPrefix],
+        first_token: Optional[asyncio.Event] = None,
+    ) -> Tuple[str, float]:
+        """Một request stream; trả về (reply, ttft). `first_token` được set khi có chunk đầu tiên"""
+        start = time.perf_counter()
+        ttft = None
+        parts = []
+        async for chunk in self.backend.astream(system_prompt, messages, thinking_budget, cache):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+                if first_token is not None:
+                    first_token.set()
+            parts.append(chunk)
+        return "".join(parts), ttft if ttft is not None else time.perf_counter() - start
+
+    async def _hedged_call(
+        self,
+        system_prompt: str,
+        messages: List[Dict],
+        thinking_budget: Optional[int],
+        cache: Optional[CachedPrefix],
+    ) -> Tuple[str, float]:
+        """
+        Gửi request; nếu sau hedge delay vẫn chưa có token đầu tiên thì gửi thêm một bản sao và
+        lấy kết quả về trước. Request đã bắt đầu stream thì không bao giờ bị hedge.
+        Request thua bị huỷ (đóng stream).
+        """
+        first_token = asyncio.Event()
+        primary = asyncio.create_task(
+            self._stream_once(system_prompt, messages, thinking_budget, cache, first_token)
+        )
+        if not cfg.LLM_HEDGE_ENABLED:
+            return await primary
+
+        tasks = {primary}
+        try:
+            waiter = asyncio.create_task(first_token.wait())
+            try:
+                await asyncio.wait({primary, waiter}, timeout=self._hedge_delay(), return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+            if not first_token.is_set() and not primary.done():
+                log.info("⏱️  LLM slow, sending hedged request")
+                metrics.tag("llm_hedged", True)
+                tasks.add(asyncio.create_task(self._stream_once(system_prompt, messages, thinking_budget, cache)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def generate_reply_async(
+        self,
+        text: str,
+        session_id: str = "default",
+        use_rag: bool = True,
+        deadline: Optional[float] = None,
+    ) -> str:
+        """
+        Như generate_reply() nhưng async: mỗi lần gọi có deadline riêng,
+        lỗi tạm thời (timeout, 429, 5xx) được thử lại với exponential backoff,
+        và không bao giờ vượt quá `deadline` (giờ của event loop). Lỗi cuối cùng được raise.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = deadline or loop.time() + cfg.LLM_HARD_SLA_SECONDS
+        use_rag = use_rag and degradation.tier.rag  # Quá tải: bỏ tìm tài liệu RAG
+
+        cache = await asyncio.to_thread(self._cached_prefix) if self.prompt_cache else None
+        if self.prompt_cache:
+            metrics.tag("llm_cache", "hit" if cache else "miss")
+
+        async def prepare(cache):
+            rag_docs = None
+            if use_rag and not self._corpus_cached(cache):
+                with metrics.span("rag"):
+                    rag_docs = await asyncio.to_thread(metrics.measure, "rag", self.rag.search, text)
+            return self._build_request(text, session_id, use_rag, rag_docs, cache)
+
+        system_prompt, messages, thinking_budget = await prepare(cache)
+
+        attempt = 0
+        with metrics.span("llm_total"):
+            while True:
+                remaining = deadline - loop.time()
+                try:
+                    reply, ttft = await asyncio.wait_for(
+                        self._hedged_call(system_prompt, messages, thinking_budget, cache),
+                        timeout=min(cfg.LLM_CALL_TIMEOUT, remaining),
+                    )
+                    break
+                except Exception as e:
+                    if self._drop_cache(cache, e):
+                        # Không tính là một lần thử: gửi lại ngay với nguyên prompt
+                        cache = None
+                        metrics.tag("llm_cache", "invalidated")
+                        system_prompt, messages, thinking_budget = await prepare(cache)
+                        continue
+                    attempt += 1
+                    backoff = min(cfg.LLM_BACKOFF_BASE * 2 ** (attempt - 1), cfg.LLM_BACKOFF_MAX)
+                    backoff *= random.uniform(0.5, 1.0)
+                    if (
+                        not self.backend.is_retryable(e)
+                        or attempt > cfg.LLM_MAX_RETRIES
+                        or deadline - loop.time() - backoff <= 0
+                    ):
+                        metrics.tag("llm_attempts", attempt)
+                        raise
+                    log.warning("⚠️  LLM attempt %d failed (%s: %s), retrying in %.2fs", attempt, type(e).__name__, e, backoff)
+                    await asyncio.sleep(backoff)
+
+        metrics.tag("llm_attempts", attempt + 1)
+        metrics.record("llm_ttft", ttft)
+        self.ttft_samples.append(ttft)
+        log.info("🤖 Assistant: %s", reply)
+        return reply
+
+    async def generate_reply_or_fallback(
+        self,
+        text: str,
+        session_id: str = "default",
+        use_rag: bool = True
+    ) -> str:
+        """Không bao giờ raise: quá SLA hoặc lỗi thì trả về câu dự phòng (thay vì đọc lỗi cho trẻ nghe)"""
+        try:
+            return await self.generate_reply_async(text, session_id=session_id, use_rag=use_rag)
+        except Exception as e:
+            log.error("❌ LLM Error: %s: %s", type(e).__name__, e)
+            metrics.tag("llm_fallback", True)
+            return cfg.LLM_FALLBACK_REPLY
+
+    async def chat_async(
+        self,
+        text: str,
+        session_id: str = "default",
+        use_rag: bool = True
+    ) -> str:
+        """Phiên bản async của chat()"""
+        log.info("💬 User: %s", text)
+        reply = await self.generate_reply_or_fallback(text, session_id=session_id, use_rag=use_rag)
+        self.commit_turn(session_id, text, reply)
+        return reply
     
-    def _format_history_for_gemini(self, history: List[Dict]) -> List[Dict]:
-        """Convert internal history format to Gemini format"""
-        gemini_history = []
-        for msg in history:
-            gemini_history.append({
-                "role": "user" if msg["role"] == "user" else "model",
-                "parts": [{"text": msg["content"]}]
-            })
-        return gemini_history
+    def commit_turn(self, session_id: str, text: str, reply: str):
+        """Ghi một lượt hỏi-đáp đã được dùng vào lịch sử"""
+        self.history.add(session_id, "user", text)
+        if reply != cfg.LLM_FALLBACK_REPLY:
+            # Câu dự phòng không phải câu trả lời thật, không đưa vào ngữ cảnh lượt sau
+            self.history.add(session_id, "assistant", reply)
     
     def chat(
         self,
@@ -194,68 +517,18 @@ class LLMEngine:
         use_rag: bool = True
     ) -> str:
         """Chat với LLM"""
-        print(f"💬 User: {text}")
-        
-        self.history.add(session_id, "user", text)
-        
-        rag_context = ""
-        if use_rag:
-            docs = self.rag.search(text)
-            if docs:
-                rag_context = self._format_rag_context(docs)
-                print(f"  📚 Retrieved {len(docs)} relevant documents")
-        
-        system_prompt = self._build_system_prompt()
-        
-        if rag_context:
-            enhanced_prompt = (
-                f"{system_prompt}\\n\\n"
-                f"=== TÀI LIỆU THAM KHẢO ===\\n{rag_context}\\n"
-                f"=== KẾT THÚC TÀI LIỆU ===\\n\\n"
-            )
-        else:
-            enhanced_prompt = system_prompt
-        
-        history = self.history.get_history(session_id)
-        gemini_history = self._format_history_for_gemini(history[:-1])
-        
-        contents = gemini_history + [{
-            "role": "user",
-            "parts": [{"text": text}]
-        }]
-        
-        generation_config = types.GenerateContentConfig(
-            temperature=cfg.TEMPERATURE,
-            max_output_tokens=cfg.MAX_OUTPUT_TOKENS,
-            top_p=cfg.TOP_P,
-            top_k=cfg.TOP_K,
-            system_instruction=enhanced_prompt,
-        )
-        
-        if cfg.USE_THINKING:
-            generation_config.thinking_config = types.ThinkingConfig(
-                thinking_budget=cfg.THINKING_BUDGET,
-                include_thoughts=cfg.INCLUDE_THOUGHTS
-            )
+        log.info("💬 User: %s", text)
         
         try:
-            response = self.client.models.generate_content(
-                model=cfg.GEMINI_MODEL,
-                contents=contents,
-                config=generation_config
-            )
-            
-            reply = response.text
-            print(f"🤖 Assistant: {reply}")
-            
-            self.history.add(session_id, "assistant", reply)
-            
-            return reply
-            
+            reply = self.generate_reply(text, session_id=session_id, use_rag=use_rag)
         except Exception as e:
+            self.history.add(session_id, "user", text)
             error_msg = f"❌ LLM Error: {str(e)}"
-            print(error_msg)
-            return f"Xin lỗi, tớ gặp lỗi khi xử lý câu hỏi của cậu. Lỗi: {str(e)}"
+            log.error(error_msg)
+            return cfg.LLM_FALLBACK_REPLY
+        
+        self.commit_turn(session_id, text, reply)
+        return reply
 
 
 def chat_with_llm(text: str, session_id: str = "default") -> str:
@@ -0,0 +1,330 @@
+"""
+LLM Backends
+Giao diện chung cho nơi sinh câu trả lời, chọn bằng llm_settings.LLM_BACKEND:
+- "gemini": Google Gemini (google-genai), cần GEMINI_API_KEY
+- "openai": endpoint tương thích OpenAI /v1/chat/completions (llama.cpp server, vLLM, Ollama,
+  hoặc stand-in `python -m benchmark.llm_server`)
+- "mock": trả lời cố định, TTFT và tốc độ sinh token cấu hình được; không cần mạng
+
+LLMEngine lo prompt, RAG, lịch sử, retry/hedge; backend chỉ stream text cho một request.
+Message có dạng {"role": "user" | "assistant", "content": str}. thinking_budget (token) chỉ
+có tác dụng với backend hỗ trợ thinking (Gemini 2.5); None = theo cấu hình mặc định.
+Backend có supports_cache = True thì nhận thêm `cache` (CachedPrefix, xem prompt_cache.py):
+phần system prompt trùng với cache.text không được gửi lại.
+"""
+import asyncio
+import hashlib
+import json
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import httpx
+
+from settings import llm_settings as cfg
+from .context import estimate_tokens
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+def _pool_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=cfg.LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=cfg.LLM_MAX_CONNECTIONS,
+        keepalive_expiry=cfg.LLM_KEEPALIVE_SECONDS,
+    )
+
+
+class LLMBackend:
+    """Một backend stream được câu trả lời theo cả hai kiểu sync (CLI, process()) và async (server)"""
+
+    name = "base"
+    model = ""
+    supports_cache = False
+
+    def stream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> Iterator[str]:
+        raise NotImplementedError
+
+    def astream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> AsyncIterator[str]:
+        raise NotImplementedError
+
+    def create_cache(self, text: str, ttl_seconds: int) -> Tuple[str, float]:
+        """Tạo cached content cho system prompt `text`; trả về (name, hạn theo time.time())"""
+        raise NotImplementedError
+
+    def refresh_cache(self, name: str, ttl_seconds: int) -> float:
+        raise NotImplementedError
+
+    def delete_cache(self, name: str):
+        raise NotImplementedError
+
+    def is_cache_error(self, error: Exception) -> bool:
+        """Lỗi do cached content không còn (hết hạn, bị xoá): gửi lại không dùng cache"""
+        return False
+
+    def is_retryable(self, error: Exception) -> bool:
+        """Lỗi tạm thời (timeout, mạng, quá tải) đáng để thử lại"""
+        if isinstance(error, (asyncio.TimeoutError, httpx.TransportError)):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in cfg.LLM_RETRY_STATUS_CODES
+        return False
+
+
+class GeminiBackend(LLMBackend):
+    name = "gemini"
+    supports_cache = True
+
+    def __init__(self):
+        # Import tại đây để chạy được backend khác mà không cần cài google-genai
+        from google import genai
+        from google.genai import errors, types
+
+        api_key = cfg.GEMINI_API_KEY
+        if not api_key or api_key == "YOUR_API_KEY_HERE":
+            raise ValueError(
+                "❌ GEMINI_API_KEY chưa được cấu hình!\n"
+                "Vui lòng set environment variable GEMINI_API_KEY "
+                "hoặc cập nhật settings/llm_settings.py (hoặc dùng LLM_BACKEND=mock để chạy offline)"
+            )
+        self._errors = errors
+        self._types = types
+        self.model = cfg.GEMINI_MODEL
+        # Một client (và connection pool httpx) dùng chung cho mọi request, kể cả client.aio
+        self.client = genai.Client(
+            api_key=api_key,
+            http_options=types.HttpOptions(
+                timeout=cfg.LLM_HTTP_TIMEOUT_MS,
+                async_client_args={"limits": _pool_limits()},
+            ),
+        )
+        log.info("✓ Model: %s", cfg.GEMINI_MODEL)
+        log.info("✓ Chain of Thought: %s", "Enabled" if cfg.USE_THINKING else "Disabled")
+
+    def _request(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int], cache=None):
+        contents = [
+            {
+                "role": "user" if msg["role"] == "user" else "model",
+                "parts": [{"text": msg["content"]}],
+            }
+            for msg in messages
+        ]
+        config = self._types.GenerateContentConfig(
+            temperature=cfg.TEMPERATURE,
+            max_output_tokens=cfg.MAX_OUTPUT_TOKENS,
+            top_p=cfg.TOP_P,
+            top_k=cfg.TOP_K,
+        )
+        if cache is not None and system_prompt.startswith(cache.text):
+            # Request dùng cached_content thì không được đặt system_instruction:
+            # phần động (tóm tắt, tài liệu RAG) đi kèm như một lượt user đứng đầu
+            config.cached_content = cache.name
+            dynamic = system_prompt[len(cache.text):].strip()
+            if dynamic:
+                contents.insert(0, {"role": "user", "parts": [{"text": dynamic}]})
+        else:
+            config.system_instruction = system_prompt
+        if cfg.USE_THINKING:
+            if thinking_budget is None:
+                thinking_budget = cfg.THINKING_BUDGET if isinstance(cfg.THINKING_BUDGET, int) else -1
+            config.thinking_config = self._types.ThinkingConfig(
+                thinking_budget=thinking_budget,
+                include_thoughts=cfg.INCLUDE_THOUGHTS,
+            )
+        return contents, config
+
+    def stream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> Iterator[str]:
+        contents, config = self._request(system_prompt, messages, thinking_budget, cache)
+        for chunk in self.client.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    async def astream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> AsyncIterator[str]:
+        contents, config = self._request(system_prompt, messages, thinking_budget, cache)
+        stream = await self.client.aio.models.generate_content_stream(
+            model=self.model, contents=contents, config=config
+        )
+        async for chunk in stream:
+            if chunk.text:
+                yield chunk.text
+
+    def is_retryable(self, error: Exception) -> bool:
+        if isinstance(error, self._errors.APIError):
+            return error.code in cfg.LLM_RETRY_STATUS_CODES
+        return super().is_retryable(error)
+
+    def create_cache(self, text: str, ttl_seconds: int) -> Tuple[str, float]:
+        cached = self.client.caches.create(
+            model=self.model,
+            config=self._types.CreateCachedContentConfig(
+                display_name="tutor-static-prefix",
+                system_instruction=text,
+                ttl=f"{ttl_seconds}s",
+            ),
+        )
+        return cached.name, time.time() + ttl_seconds
+
+    def refresh_cache(self, name: str, ttl_seconds: int) -> float:
+        self.client.caches.update(
+            name=name, config=self._types.UpdateCachedContentConfig(ttl=f"{ttl_seconds}s")
+        )
+        return time.time() + ttl_seconds
+
+    def delete_cache(self, name: str):
+        self.client.caches.delete(name=name)
+
+    def is_cache_error(self, error: Exception) -> bool:
+        if not isinstance(error, self._errors.APIError):
+            return False
+        return error.code == 404 or (error.code in (400, 403) and "cache" in str(error).lower())
+
+
+class OpenAICompatibleBackend(LLMBackend):
+    """
+    POST {base_url}/chat/completions với stream=true, đọc Server-Sent Events.
+    Không có API cache riêng: llama.cpp / vLLM tự dùng lại KV cache khi phần đầu prompt giống hệt.
+    """
+
+    name = "openai"
+
+    def __init__(self, base_url: str = None, model: str = None, api_key: str = None):
+        self.base_url = (base_url or cfg.OPENAI_BASE_URL).rstrip("/")
+        self.model = model or cfg.OPENAI_MODEL
+        api_key = api_key if api_key is not None else cfg.OPENAI_API_KEY
+        headers = {"Authorization": f"Bearer {api_key}"} if api_key else {}
+        timeout = httpx.Timeout(cfg.LLM_HTTP_TIMEOUT_MS / 1000)
+        self.client = httpx.Client(headers=headers, timeout=timeout, limits=_pool_limits())
+        self.aclient = httpx.AsyncClient(headers=headers, timeout=timeout, limits=_pool_limits())
+        log.info("✓ OpenAI-compatible endpoint: %s (model=%s)", self.base_url, self.model)
+
+    def _payload(self, system_prompt: str, messages: List[Dict]) -> dict:
+        return {
+            "model": self.model,
+            "messages": [{"role": "system", "content": system_prompt}] + [
+                {"role": msg["role"], "content": msg["content"]} for msg in messages
+            ],
+            "temperature": cfg.TEMPERATURE,
+            "top_p": cfg.TOP_P,
+            "max_tokens": cfg.MAX_OUTPUT_TOKENS,
+            "stream": True,
+        }
+
+    @staticmethod
+    def _parse_sse_line(line: str):
+        """Trả về đoạn text trong một dòng `data: {...}`; None nếu không có"""
+        if not line.startswith("data:"):
+            return None
+        data = line[5:].strip()
+        if not data or data == "[DONE]":
+            return None
+        choices = json.loads(data).get("choices") or [{}]
+        return choices[0].get("delta", {}).get("content")
+
+    def stream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> Iterator[str]:
+        url = f"{self.base_url}/chat/completions"
+        with self.client.stream("POST", url, json=self._payload(system_prompt, messages)) as response:
+            response.raise_for_status()
+            for line in response.iter_lines():
+                text = self._parse_sse_line(line)
+                if text:
+                    yield text
+
+    async def astream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> AsyncIterator[str]:
+        url = f"{self.base_url}/chat/completions"
+        async with self.aclient.stream("POST", url, json=self._payload(system_prompt, messages)) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                text = self._parse_sse_line(line)
+                if text:
+                    yield text
+
+
+class MockBackend(LLMBackend):
+    """
+    Câu trả lời cố định chọn theo hash của câu hỏi (cùng câu hỏi -> cùng câu trả lời),
+    chờ TTFT rồi stream từng từ với tốc độ tokens_per_second.
+    TTFT = ttft_seconds + thời gian prefill cho phần đầu vào không nằm trong cache;
+    cache được giả lập trong bộ nhớ (có TTL) để thử đường context caching mà không cần mạng.
+    """
+
+    name = "mock"
+    model = "mock"
+    supports_cache = True
+
+    def __init__(self, ttft_seconds: float = None, tokens_per_second: float = None):
+        self.ttft_seconds = cfg.MOCK_TTFT_SECONDS if ttft_seconds is None else ttft_seconds
+        self.tokens_per_second = tokens_per_second or cfg.MOCK_TOKENS_PER_SECOND
+        self.caches: Dict[str, Tuple[str, float]] = {}
+        self._cache_count = 0
+        log.info("✓ Mock LLM: TTFT=%ss, %s tokens/s", self.ttft_seconds, self.tokens_per_second)
+
+    def create_cache(self, text: str, ttl_seconds: int) -> Tuple[str, float]:
+        self._cache_count += 1
+        name = f"cachedContents/mock-{self._cache_count}"
+        expires_at = time.time() + ttl_seconds
+        self.caches[name] = (text, expires_at)
+        return name, expires_at
+
+    def refresh_cache(self, name: str, ttl_seconds: int) -> float:
+        if name not in self.caches:
+            raise LookupError(f"{name} not found")
+        expires_at = time.time() + ttl_seconds
+        self.caches[name] = (self.caches[name][0], expires_at)
+        return expires_at
+
+    def delete_cache(self, name: str):
+        self.caches.pop(name, None)
+
+    def is_cache_error(self, error: Exception) -> bool:
+        return isinstance(error, LookupError)
+
+    def _ttft(self, system_prompt: str, messages: List[Dict], cache) -> float:
+        uncached = system_prompt
+        if cache is not None:
+            text, expires_at = self.caches.get(cache.name, (None, 0.0))
+            if text is None or expires_at < time.time():
+                raise LookupError(f"{cache.name} not found")
+            if system_prompt.startswith(text):
+                uncached = system_prompt[len(text):]
+        tokens = estimate_tokens(uncached) + sum(estimate_tokens(m["content"]) for m in messages)
+        return self.ttft_seconds + tokens / 1000 * cfg.MOCK_PREFILL_SECONDS_PER_1K_TOKENS
+
+    @staticmethod
+    def reply_for(messages: List[Dict]) -> str:
+        question = messages[-1]["content"] if messages else ""
+        digest = hashlib.md5(question.encode("utf-8")).digest()
+        return cfg.MOCK_REPLIES[digest[0] % len(cfg.MOCK_REPLIES)]
+
+    def _tokens(self, messages: List[Dict]) -> List[str]:
+        words = self.reply_for(messages).split(" ")
+        return [w + " " for w in words[:-1]] + words[-1:]
+
+    def stream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> Iterator[str]:
+        time.sleep(self._ttft(system_prompt, messages, cache))
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                time.sleep(1.0 / self.tokens_per_second)
+            yield token
+
+    async def astream(self, system_prompt: str, messages: List[Dict], thinking_budget: Optional[int] = None, cache=None) -> AsyncIterator[str]:
+        await asyncio.sleep(self._ttft(system_prompt, messages, cache))
+        for i, token in enumerate(self._tokens(messages)):
+            if i:
+                await asyncio.sleep(1.0 / self.tokens_per_second)
+            yield token
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    OpenAICompatibleBackend.name: OpenAICompatibleBackend,
+    MockBackend.name: MockBackend,
+}
+
+
+def create_backend(name: str = None) -> LLMBackend:
+    name = (name or cfg.LLM_BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend '{name}', choose one of: {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -0,0 +1,194 @@
+"""
+Logging
+Log có cấp độ đi qua một hàng đợi: log.info(...) trong event loop chỉ tạo LogRecord rồi đưa vào
+queue, một thread nền định dạng và ghi ra console. Mức log theo module (LOG_LEVELS), cảnh báo lặp
+lại bị giới hạn tần suất, LOG_FORMAT=json cho công cụ gom log.
+Dùng format kiểu %: log.debug("x=%s", x) gần như không tốn gì khi DEBUG đang tắt.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from settings import server_settings as cfg
+from modules.metrics import current_trace
+
+FORMATS = ("text", "json")
+
+# Các package của server; thư viện bên ngoài (httpx, websockets...) chỉ ghi từ WARNING
+PACKAGES = ("modules", "server", "benchmark", "__main__")
+
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+
+def parse_levels(spec: str) -> Dict[str, str]:
+    """"modules.tts=DEBUG,server=WARNING" -> {"modules.tts": "DEBUG", "server": "WARNING"}"""
+    levels = {}
+    for item in spec.split(","):
+        name, sep, level = item.partition("=")
+        if sep and name.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+class TraceContextFilter(logging.Filter):
+    """Gắn device_id / request_id của lượt đang chạy (contextvar của modules.metrics) vào bản ghi"""
+
+    def filter(self, record):
+        trace = current_trace()
+        if trace is not None:
+            record.device_id = trace.device_id
+            record.request_id = trace.request_id
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Từ WARNING trở lên: mỗi dòng code chỉ ghi một lần trong `interval` giây (ví dụ cảnh báo
+    lặp lại theo từng frame). Số bản ghi bị bỏ được ghi kèm lần kế tiếp.
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._last: Dict[Tuple[str, int], float] = {}
+        self._pending: Dict[Tuple[str, int], int] = {}
+        self.suppressed = 0
+
+    def filter(self, record):
+        if record.levelno < logging.WARNING or self.interval <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and now - last < self.interval:
+                self._pending[key] = self._pending.get(key, 0) + 1
+                self.suppressed += 1
+                return False
+            self._last[key] = now
+            suppressed = self._pending.pop(key, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def formatMessage(self, record):
+        text = super().formatMessage(record)
+        if getattr(record, "device_id", None):
+            text += f" [{record.device_id}]"
+        if getattr(record, "suppressed", 0):
+            text += f" (+{record.suppressed} similar suppressed)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """Mỗi bản ghi một dòng JSON; các trường truyền qua extra={...} được giữ nguyên"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update((k, v) for k, v in vars(record).items() if k not in _RECORD_ATTRS)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Chạy trong thread gọi log: chỉ ghép message rồi đưa vào queue, không bao giờ chặn"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Ghép message ngay (args có thể bị sửa sau đó); định dạng text/JSON và traceback
+        # được làm trong thread ghi log
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_setup_lock = threading.Lock()
+_queue_handler: Optional[_QueueHandler] = None
+_listener: Optional[logging.handlers.QueueListener] = None
+_rate_limit: Optional[RateLimitFilter] = None
+
+
+def _console_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if cfg.LOG_FORMAT.lower() == "json" else TextFormatter())
+    return handler
+
+
+def _after_fork_in_child():
+    # Process con (STT worker) không có thread ghi log: ghi thẳng ra console
+    root = logging.getLogger()
+    if _queue_handler in root.handlers:
+        root.removeHandler(_queue_handler)
+        handler = _console_handler()
+        handler.addFilter(_rate_limit)
+        root.addHandler(handler)
+
+
+def setup_logging():
+    """Cài handler cho root logger; gọi nhiều lần cũng chỉ cài một lần"""
+    global _queue_handler, _listener, _rate_limit
+    with _setup_lock:
+        if _queue_handler is not None:
+            return
+        if cfg.LOG_FORMAT.lower() not in FORMATS:
+            raise ValueError(f"Unknown log format '{cfg.LOG_FORMAT}', choose one of: {', '.join(FORMATS)}")
+        log_queue = queue.Queue(maxsize=cfg.LOG_QUEUE_SIZE)
+        _rate_limit = RateLimitFilter(cfg.LOG_RATE_LIMIT_SECONDS)
+        _queue_handler = _QueueHandler(log_queue)
+        _queue_handler.addFilter(TraceContextFilter())
+        _queue_handler.addFilter(_rate_limit)
+        _listener = logging.handlers.QueueListener(log_queue, _console_handler())
+        _listener.start()
+        atexit.register(_listener.stop)  # Ghi nốt các bản ghi còn trong queue
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+
+        root = logging.getLogger()
+        root.addHandler(_queue_handler)
+        root.setLevel(logging.WARNING)
+        for name in PACKAGES:
+            logging.getLogger(name).setLevel(cfg.LOG_LEVEL.upper())
+        for name, level in parse_levels(cfg.LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+
+def get_logger(name: str) -> logging.Logger:
+    setup_logging()
+    return logging.getLogger(name)
+
+
+def stats() -> dict:
+    if _queue_handler is None:
+        return {}
+    return {
+        "queued": _queue_handler.queue.qsize(),
+        "dropped": _queue_handler.dropped,
+        "suppressed": _rate_limit.suppressed,
+    }
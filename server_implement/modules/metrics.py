@@ -0,0 +1,272 @@
+"""
+Latency Instrumentation
+Đo thời gian từng giai đoạn (span) của mỗi lượt hỏi-đáp theo device/session,
+gộp thành histogram p50/p95/p99 để xem trên route /metrics. Các giai đoạn tốn CPU còn ghi
+CPU time (và bộ nhớ cấp phát khi tracemalloc đang bật, xem modules.profiler).
+"""
+import contextvars
+import threading
+import time
+import tracemalloc
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+# Các giai đoạn được đo, theo thứ tự xảy ra trong một lượt
+STAGES = (
+    "vad_eos",          # Khoảng im lặng phải chờ trước khi đóng câu nói
+    "stt",              # Decode STT
+    "rag",              # Tìm kiếm tài liệu RAG
+    "llm_ttft",         # Gemini: thời gian tới token đầu tiên
+    "llm_total",        # Gemini: tổng thời gian sinh câu trả lời
+    "history_write",    # Ghi lịch sử hội thoại (JSON) ra đĩa
+    "tts_ttfa",         # Từ lúc bắt đầu TTS tới byte audio đầu tiên gửi đi
+    "tts_total",        # Tổng thời gian TTS
+    "downlink",         # Gửi toàn bộ audio trả lời về thiết bị
+    "e2e_first_audio",  # Từ lúc đóng câu nói tới byte audio đầu tiên gửi đi
+)
+
+PERCENTILES = (50, 95, 99)
+
+
+class LatencyHistogram:
+    """Cửa sổ trượt N mẫu gần nhất; phân vị được tính khi đọc"""
+
+    def __init__(self, window: int = 2048):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def summary(self) -> dict:
+        if not self.samples:
+            return {"count": self.count}
+        values = np.fromiter(self.samples, dtype=np.float64)
+        result = {
+            "count": self.count,
+            "mean": round(self.total / self.count, 4),
+            "max": round(float(values.max()), 4),
+        }
+        for q, v in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            result[f"p{q}"] = round(float(v), 4)
+        return result
+
+
+class RequestTrace:
+    """Các span của một lượt hỏi-đáp"""
+
+    def __init__(self, device_id: str = "unknown", session_id: str = "default"):
+        self.request_id = uuid.uuid4().hex[:12]
+        self.device_id = device_id
+        self.session_id = session_id
+        self.started_at = time.time()
+        self.spans: Dict[str, float] = {}
+        self.marks: Dict[str, float] = {}
+        self.tags: Dict[str, object] = {}
+        self.cpu: Dict[str, float] = {}    # CPU time theo giai đoạn
+        self.alloc: Dict[str, int] = {}    # Bộ nhớ cấp phát thêm lúc cao nhất (byte), chỉ khi tracemalloc bật
+
+    def record(self, stage: str, seconds: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+
+    def usage(self, stage: str, cpu_seconds: float, alloc_bytes: Optional[int] = None):
+        self.cpu[stage] = self.cpu.get(stage, 0.0) + cpu_seconds
+        if alloc_bytes is not None:
+            self.alloc[stage] = max(self.alloc.get(stage, 0), alloc_bytes)
+
+    def mark(self, name: str):
+        """Ghi lại một mốc thời gian (perf_counter) để tính span qua nhiều hàm"""
+        self.marks[name] = time.perf_counter()
+
+    def since(self, name: str) -> Optional[float]:
+        start = self.marks.get(name)
+        return None if start is None else time.perf_counter() - start
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def to_dict(self) -> dict:
+        result = {
+            "request_id": self.request_id,
+            "device_id": self.device_id,
+            "session_id": self.session_id,
+            "started_at": self.started_at,
+            "spans": {k: round(v, 4) for k, v in self.spans.items()},
+            **self.tags,
+        }
+        if self.cpu:
+            result["cpu"] = {k: round(v, 4) for k, v in self.cpu.items()}
+        if self.alloc:
+            result["alloc_kb"] = {k: round(v / 1024, 1) for k, v in self.alloc.items()}
+        return result
+
+
+class MetricsRegistry:
+    """Gộp các trace đã hoàn tất thành histogram theo giai đoạn"""
+
+    def __init__(self, recent_traces: int = 200):
+        self._lock = threading.Lock()
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.recent = deque(maxlen=recent_traces)
+        self.requests = 0
+        self.cpu: Dict[str, List[float]] = {}  # stage -> [tổng CPU giây, số lượt]
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.cpu.clear()
+            self.recent.clear()
+            self.requests = 0
+
+    def finish(self, trace: RequestTrace):
+        with self._lock:
+            self.requests += 1
+            for stage, seconds in trace.spans.items():
+                self.histograms.setdefault(stage, LatencyHistogram()).observe(seconds)
+            for stage, seconds in trace.cpu.items():
+                total = self.cpu.setdefault(stage, [0.0, 0])
+                total[0] += seconds
+                total[1] += 1
+            self.recent.append(trace.to_dict())
+
+    def recent_traces(self, stage: str, since: float) -> List[dict]:
+        """Các trace gần đây bắt đầu từ `since` (time.time()) và có đo giai đoạn `stage`"""
+        with self._lock:
+            return [t for t in self.recent if t["started_at"] >= since and stage in t["spans"]]
+
+    def snapshot(self, recent: int = 20) -> dict:
+        with self._lock:
+            ordered = [s for s in STAGES if s in self.histograms]
+            ordered += sorted(s for s in self.histograms if s not in STAGES)
+            return {
+                "requests": self.requests,
+                "stages": {s: self.histograms[s].summary() for s in ordered},
+                "cpu": {
+                    s: {"total_seconds": round(total, 4), "mean_seconds": round(total / count, 4)}
+                    for s, (total, count) in self.cpu.items()
+                },
+                "recent": list(self.recent)[-recent:] if recent else [],
+            }
+
+    def prometheus(self) -> str:
+        """Định dạng text của Prometheus (kiểu summary) cho các histogram"""
+        lines: List[str] = [
+            "# TYPE voice_stage_latency_seconds summary",
+        ]
+        with self._lock:
+            for stage, hist in self.histograms.items():
+                summary = hist.summary()
+                for q in PERCENTILES:
+                    if f"p{q}" in summary:
+                        lines.append(
+                            f'voice_stage_latency_seconds{{stage="{stage}",quantile="{q / 100}"}} {summary[f"p{q}"]}'
+                        )
+                lines.append(f'voice_stage_latency_seconds_sum{{stage="{stage}"}} {round(hist.total, 4)}')
+                lines.append(f'voice_stage_latency_seconds_count{{stage="{stage}"}} {hist.count}')
+            if self.cpu:
+                lines.append("# TYPE voice_stage_cpu_seconds_total counter")
+                for stage, (total, _) in self.cpu.items():
+                    lines.append(f'voice_stage_cpu_seconds_total{{stage="{stage}"}} {round(total, 4)}')
+            lines.append("# TYPE voice_requests_total counter")
+            lines.append(f"voice_requests_total {self.requests}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+
+
+def start_trace(device_id: str = "unknown", session_id: str = "default") -> RequestTrace:
+    """Tạo trace mới và gắn vào context hiện tại (task asyncio / thread của asyncio.to_thread)"""
+    trace = RequestTrace(device_id, session_id)
+    _current_trace.set(trace)
+    return trace
+
+
+def use_trace(trace: Optional[RequestTrace]):
+    """Gắn một trace đã có vào context hiện tại"""
+    _current_trace.set(trace)
+
+
+def current_trace() -> Optional[RequestTrace]:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(stage: str):
+    """Đo một giai đoạn vào trace hiện tại; không làm gì nếu không có trace"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    with trace.span(stage):
+        yield
+
+
+@contextmanager
+def usage(stage: str):
+    """
+    CPU time của thread hiện tại trong giai đoạn (chỉ đúng khi đoạn code không nhường event loop),
+    và khi tracemalloc đang bật, bộ nhớ cấp phát thêm lúc cao nhất. Peak của tracemalloc là chung
+    cho cả process: nhiều giai đoạn chạy song song thì con số này chỉ là ước lượng.
+    """
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.thread_time()
+    try:
+        yield
+    finally:
+        cpu = time.thread_time() - start
+        trace.usage(stage, cpu, tracemalloc.get_traced_memory()[1] - base if tracing else None)
+
+
+def measure(stage: str, fn, *args):
+    """fn(*args) trong usage(stage); dùng với asyncio.to_thread để đo trong thread thực sự chạy fn"""
+    with usage(stage):
+        return fn(*args)
+
+
+def add_usage(stage: str, cpu_seconds: float):
+    """CPU tiêu tốn ở process khác (STT worker, subprocess TTS)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.usage(stage, cpu_seconds)
+
+
+def record(stage: str, seconds: float):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(stage, seconds)
+
+
+def mark(name: str):
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.mark(name)
+
+
+def tag(key: str, value):
+    """Gắn thông tin phụ (ví dụ phương pháp decode STT) vào trace hiện tại"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.tags[key] = value
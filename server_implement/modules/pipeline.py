@@ -1,10 +1,19 @@
-# from pathlib import Path
-# from typing import Optional
-# import time
+from pathlib import Path
+from typing import Dict, Optional
+import asyncio
+import time
 
-# from .stt import STTEngine
-# from .tts import TTSEngine
-# from .llm import LLMEngine
+from settings import stt_settings
+from .tts import TTSEngine
+from .llm import LLMEngine
+from . import metrics
+from .degradation import degradation
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+ENGINES = ("stt", "llm", "rag", "tts")
 
 
 class VoiceAssistantPipeline:
@@ -12,107 +21,276 @@ class VoiceAssistantPipeline:
     Complete Voice Assistant Pipeline
     Flow: Audio Input -> STT -> LLM -> TTS -> Audio Output
     """
-    
-    def __init__(self):
-        print("\\n" + "="*60)
-        print("🚀 Initializing Voice Assistant Pipeline")
-        print("="*60 + "\\n")
-        
-        # self.stt_engine = STTEngine()
-        # self.llm_engine = LLMEngine()
-        # self.tts_engine = TTSEngine()
-        
-        print("\\n" + "="*60)
-        print("✅ Pipeline Ready!")
-        print("="*60 + "\\n")
-    
-    # def process(
-    #     self,
-    #     audio_input_path: str,
-    #     audio_output_path: Optional[str] = None,
-    #     session_id: str = "default"
-    # ) -> dict:
-    #     """
-    #     Xử lý pipeline hoàn chỉnh
-        
-    #     Args:
-    #         audio_input_path: Đường dẫn file audio input
-    #         audio_output_path: Đường dẫn file audio output (optional)
-    #         session_id: Session ID cho conversation tracking
-            
-    #     Returns:
-    #         dict: {
-    #             "input_text": str,
-    #             "response_text": str,
-    #             "output_audio": Path,
-    #             "processing_time": float
-    #         }
-    #     """
-    #     start_time = time.time()
-        
-    #     print("\\n" + "🔄 " + "="*58)
-    #     print("STARTING PIPELINE PROCESSING")
-    #     print("="*60 + "\\n")
-        
-    #     # Step 1: STT
-    #     print("📍 STEP 1: Speech to Text")
-    #     print("-" * 60)
-    #     input_text = self.stt_engine.transcribe(audio_input_path)
-    #     print(f"✓ Transcribed: {input_text}\\n")
-        
-    #     # Step 2: LLM
-    #     print("📍 STEP 2: Language Model Processing")
-    #     print("-" * 60)
-    #     response_text = self.llm_engine.chat(input_text, session_id=session_id)
-    #     print(f"✓ Generated response\\n")
-        
-    #     # Step 3: TTS
-    #     print("📍 STEP 3: Text to Speech")
-    #     print("-" * 60)
-    #     output_audio = self.tts_engine.synthesize(
-    #         response_text,
-    #         output_path=audio_output_path
-    #     )
-    #     print(f"✓ Audio generated: {output_audio}\\n")
-        
-    #     # Calculate processing time
-    #     processing_time = time.time() - start_time
-        
-    #     print("="*60)
-    #     print(f"✅ PIPELINE COMPLETED in {processing_time:.2f}s")
-    #     print("="*60 + "\\n")
-        
-    #     return {
-    #         "input_text": input_text,
-    #         "response_text": response_text,
-    #         "output_audio": output_audio,
-    #         "processing_time": processing_time
-    #     }
-    
-    # def text_to_speech_only(self, text: str, output_path: Optional[str] = None) -> Path:
-    #     """Chỉ chạy TTS"""
-    #     return self.tts_engine.synthesize(text, output_path)
-    
-    # def speech_to_text_only(self, audio_path: str) -> str:
-    #     """Chỉ chạy STT"""
-    #     return self.stt_engine.transcribe(audio_path)
-    
-    # def chat_only(self, text: str, session_id: str = "default") -> str:
-    #     """Chỉ chạy LLM"""
-    #     return self.llm_engine.chat(text, session_id=session_id)
+
+    def __init__(self, load: bool = True, llm_backend: Optional[str] = None):
+        """
+        Args:
+            load: True = tải tất cả model ngay (chặn); False = để server gọi
+                load_async() trong lifespan và nhận kết nối trong lúc model đang tải
+            llm_backend: "gemini" | "openai" | "mock"; None = llm_settings.LLM_BACKEND
+        """
+        self.llm_backend = llm_backend
+        self.stt_engine = None
+        self.llm_engine = None
+        self.tts_engine = None
+        self._stt_slots: Optional[asyncio.Semaphore] = None
+        self.status: Dict[str, dict] = {name: {"state": "pending"} for name in ENGINES}
+        self._ready = {name: asyncio.Event() for name in ENGINES}
+
+        if not load:
+            return
+
+        log.info("🚀 Initializing Voice Assistant Pipeline")
+
+        self._load_stt()
+        self._mark_ready("stt")
+        self._load_llm()
+        self._mark_ready("llm")
+        self._load_rag()
+        self._mark_ready("rag")
+        self._load_tts()
+        self._mark_ready("tts")
+
+        log.info("✅ Pipeline Ready!")
+
+    def _load_stt(self):
+        # stt_engine đã được gán sẵn khi STT chạy trong process riêng (server.workers)
+        if self.stt_engine is None:
+            from .stt import STTEngine  # sherpa_onnx chỉ được import khi thật sự tải STT
+            self.stt_engine = STTEngine()
+        # Request vượt quá số worker STT chờ ở đây thay vì chiếm thread của executor
+        self._stt_slots = asyncio.Semaphore(self.stt_engine.num_workers)
+
+    def _load_llm(self):
+        self.llm_engine = LLMEngine(backend=self.llm_backend)
+
+    def _load_rag(self):
+        self.llm_engine.rag._load()
+        self.llm_engine.warm_prompt_cache()
+
+    def _load_tts(self):
+        self.tts_engine = TTSEngine()
+
+    def _mark_ready(self, name: str, load_seconds: Optional[float] = None):
+        self.status[name] = {"state": "ready"}
+        if load_seconds is not None:
+            self.status[name]["load_seconds"] = round(load_seconds, 2)
+        if name == "stt":
+            # Cấu hình thread/worker mà STT tự chọn khi warm-up, hiện trên /ready
+            self.status[name]["config"] = self.stt_engine.config
+        self._ready[name].set()
+
+    async def _load_one(self, name: str, loader):
+        self.status[name] = {"state": "loading"}
+        start = time.perf_counter()
+        try:
+            await asyncio.to_thread(loader)
+        except Exception as e:
+            log.error("❌ Failed to load %s: %s", name, e)
+            self.status[name] = {"state": "failed", "error": str(e)}
+            self._ready[name].set()  # Đánh thức các request đang chờ để chúng báo lỗi
+            return False
+        self._mark_ready(name, time.perf_counter() - start)
+        log.info("✅ %s ready in %ss", name.upper(), self.status[name]["load_seconds"])
+        return True
+
+    async def load_async(self):
+        """
+        Tải song song STT, LLM (+ chỉ mục RAG) và TTS trong thread pool.
+        Engine nào xong trước thì các request cần nó được chạy ngay.
+        """
+        async def load_llm_and_rag():
+            if await self._load_one("llm", self._load_llm):
+                await self._load_one("rag", self._load_rag)
+            else:
+                self.status["rag"] = {"state": "failed", "error": "LLM engine failed to load"}
+                self._ready["rag"].set()
+
+        await asyncio.gather(
+            self._load_one("stt", self._load_stt),
+            load_llm_and_rag(),
+            self._load_one("tts", self._load_tts),
+        )
+
+    @property
+    def is_ready(self) -> bool:
+        return all(self.status[name]["state"] == "ready" for name in ENGINES)
+
+    async def wait_ready(self, *names: str):
+        """Chờ (xếp hàng) cho tới khi các engine cần thiết tải xong"""
+        for name in names:
+            await self._ready[name].wait()
+            if self.status[name]["state"] != "ready":
+                raise RuntimeError(f"{name} engine unavailable: {self.status[name].get('error')}")
+
+    def process(
+        self,
+        audio_input_path: str,
+        audio_output_path: Optional[str] = None,
+        session_id: str = "default"
+    ) -> dict:
+        """
+        Xử lý pipeline hoàn chỉnh
+
+        Args:
+            audio_input_path: Đường dẫn file audio input
+            audio_output_path: Đường dẫn file audio output (optional)
+            session_id: Session ID cho conversation tracking
+
+        Returns:
+            dict: {
+                "input_text": str,
+                "response_text": str,
+                "output_audio": Path,
+                "processing_time": float
+            }
+        """
+        start_time = time.time()
+
+        # Step 1: STT
+        input_text = self.stt_engine.transcribe(audio_input_path)
+        log.info("✓ Transcribed: %s", input_text)
+
+        # Step 2: LLM
+        response_text = self.llm_engine.chat(input_text, session_id=session_id)
+
+        # Step 3: TTS
+        output_audio = self.tts_engine.synthesize(
+            response_text,
+            output_path=audio_output_path
+        )
+
+        # Calculate processing time
+        processing_time = time.time() - start_time
+        log.info("✅ PIPELINE COMPLETED in %.2fs", processing_time)
+
+        return {
+            "input_text": input_text,
+            "response_text": response_text,
+            "output_audio": output_audio,
+            "processing_time": processing_time
+        }
+
+    async def process_async(
+        self,
+        audio_input_path: str,
+        audio_output_path: Optional[str] = None,
+        session_id: str = "default"
+    ) -> dict:
+        """
+        Phiên bản bất đồng bộ của process(), dùng trong websocket server.
+
+        Task chạy hàm này có thể bị cancel bất cứ lúc nào (barge-in):
+        STT/LLM chạy trong thread nên kết quả sẽ bị bỏ đi và các bước sau
+        không được khởi chạy; TTS chạy như subprocess nên bị kill ngay.
+        """
+        await self.wait_ready(*ENGINES)
+        return await self._process_async(self.stt_engine.transcribe, audio_input_path, audio_output_path, session_id)
+
+    async def process_pcm_async(
+        self,
+        pcm: bytes,
+        audio_output_path: Optional[str] = None,
+        session_id: str = "default"
+    ) -> dict:
+        """Như process_async() nhưng STT đọc thẳng PCM 16-bit trong bộ nhớ, không phải ghi WAV trước"""
+        await self.wait_ready(*ENGINES)
+        return await self._process_async(self.stt_engine.transcribe_pcm16, pcm, audio_output_path, session_id)
+
+    async def _process_async(self, transcribe, audio, audio_output_path: Optional[str], session_id: str) -> dict:
+        start_time = time.time()
+
+        input_text = await self._run_stt(transcribe, audio)
+        log.info("✓ Transcribed: %s", input_text)
+
+        response_text = await self.llm_engine.chat_async(input_text, session_id=session_id)
+
+        output_audio = await self._synthesize_traced(response_text, audio_output_path)
+
+        processing_time = time.time() - start_time
+        log.info("✅ PIPELINE COMPLETED in %.2fs", processing_time)
+
+        return {
+            "input_text": input_text,
+            "response_text": response_text,
+            "output_audio": output_audio,
+            "processing_time": processing_time
+        }
+
+    async def _synthesize_traced(self, text: str, audio_output_path: Optional[str]):
+        metrics.mark("tts_start")
+        with metrics.span("tts_total"):
+            return await self.tts_engine.synthesize_async(text, output_path=audio_output_path)
+
+    async def _run_stt(self, fn, audio) -> str:
+        # Thời gian chờ worker được tính vào ngân sách độ trễ: tải cao thì STT chuyển sang greedy
+        requested_at = time.perf_counter()
+        method = stt_settings.GREEDY_SEARCH if degradation.tier.stt_greedy else None
+        with metrics.span("stt"):
+            async with self._stt_slots:
+                return await asyncio.to_thread(metrics.measure, "stt", fn, audio, requested_at, method)
+
+    async def transcribe_pcm_async(self, pcm: bytes) -> str:
+        """STT trực tiếp từ PCM 16-bit trong bộ nhớ"""
+        await self.wait_ready("stt")
+        return await self._run_stt(self.stt_engine.transcribe_pcm16, pcm)
+
+    async def generate_reply_async(self, text: str, session_id: str = "default") -> str:
+        """LLM không ghi lịch sử, dùng cho chạy suy đoán (quá SLA thì là câu dự phòng)"""
+        await self.wait_ready("llm", "rag")
+        return await self.llm_engine.generate_reply_or_fallback(text, session_id=session_id)
+
+    async def finish_async(
+        self,
+        input_text: str,
+        response_text: str,
+        audio_output_path: Optional[str] = None,
+        session_id: str = "default"
+    ) -> dict:
+        """
+        Hoàn tất một lượt đã có sẵn transcript và câu trả lời (từ chạy suy đoán):
+        ghi lịch sử rồi chạy TTS.
+        """
+        await self.wait_ready("tts")
+        start_time = time.time()
+        self.llm_engine.commit_turn(session_id, input_text, response_text)
+
+        output_audio = await self._synthesize_traced(response_text, audio_output_path)
+
+        processing_time = time.time() - start_time
+        log.info("✅ PIPELINE COMPLETED (speculative) in %.2fs", processing_time)
+
+        return {
+            "input_text": input_text,
+            "response_text": response_text,
+            "output_audio": output_audio,
+            "processing_time": processing_time
+        }
+
+    def text_to_speech_only(self, text: str, output_path: Optional[str] = None) -> Path:
+        """Chỉ chạy TTS"""
+        return self.tts_engine.synthesize(text, output_path)
+
+    def speech_to_text_only(self, audio_path: str) -> str:
+        """Chỉ chạy STT"""
+        return self.stt_engine.transcribe(audio_path)
+
+    def chat_only(self, text: str, session_id: str = "default") -> str:
+        """Chỉ chạy LLM"""
+        return self.llm_engine.chat(text, session_id=session_id)
 
 
 if __name__ == "__main__":
     import sys
-    
+
     # Example usage
     pipeline = VoiceAssistantPipeline()
-    
+
     # Nếu có argument là file audio
     if len(sys.argv) > 1:
         audio_file = sys.argv[1]
         result = pipeline.process(audio_file)
-        
+
         print("\\n" + "="*60)
         print("RESULT SUMMARY")
         print("="*60)
@@ -0,0 +1,131 @@
+"""
+Profiling
+Bật theo yêu cầu khi độ trễ trong lớp tăng vọt, không cần khởi động lại server:
+- SamplingProfiler: một thread lấy stack của mọi thread (sys._current_frames) mỗi vài ms trong
+  N giây, trả về dạng "collapsed stacks" (flamegraph.pl, speedscope, inferno đều đọc được).
+  Code native (ONNX Runtime, VAD) hiện dưới hàm Python gọi nó.
+- tracemalloc: snapshot các chỗ cấp phát nhiều nhất và chênh lệch so với snapshot trước;
+  khi đang bật, metrics.usage() còn ghi bộ nhớ cấp phát theo từng giai đoạn của pipeline.
+"""
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, Optional
+
+from settings import server_settings as cfg
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Mỗi lần chỉ một phiên lấy mẫu; run() chặn cho tới khi xong (gọi qua asyncio.to_thread)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.running = False
+
+    def run(self, seconds: float, interval: float = cfg.PROFILE_INTERVAL_SECONDS) -> str:
+        """ValueError nếu interval <= 0; seconds và interval được kẹp vào khoảng hợp lý"""
+        if not interval > 0:
+            raise ValueError(f"interval must be > 0, got {interval}")
+        seconds = min(max(seconds, cfg.PROFILE_MIN_SECONDS), cfg.PROFILE_MAX_SECONDS)
+        interval = max(interval, cfg.PROFILE_MIN_INTERVAL_SECONDS)
+        if not self._lock.acquire(blocking=False):
+            raise RuntimeError("A profile is already running")
+        self.running = True
+        try:
+            stacks = self._sample(seconds, interval)
+        finally:
+            self.running = False
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+    def _sample(self, seconds: float, interval: float) -> Counter:
+        me = threading.get_ident()
+        stacks: Counter = Counter()
+        samples = 0
+        deadline = time.perf_counter() + seconds
+        log.info("🔬 Sampling profiler started for %.1fs (every %.1f ms)", seconds, interval * 1000)
+        while time.perf_counter() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                labels = []
+                while frame is not None:
+                    labels.append(_frame_label(frame))
+                    frame = frame.f_back
+                labels.append(names.get(ident, f"thread-{ident}"))
+                # Collapsed stack: gốc trước, các hàm cách nhau bởi ";"
+                stacks[";".join(reversed(labels))] += 1
+            samples += 1
+            time.sleep(interval)
+        log.info("🔬 Sampling profiler finished: %d samples, %d distinct stacks", samples, len(stacks))
+        return stacks
+
+
+class MemoryProfiler:
+    """tracemalloc bật / tắt lúc chạy; top() so với snapshot lần trước để thấy chỗ đang tăng"""
+
+    def __init__(self):
+        self._previous: Optional[tracemalloc.Snapshot] = None
+
+    @staticmethod
+    def _filter(snapshot: tracemalloc.Snapshot) -> tracemalloc.Snapshot:
+        return snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+
+    def start(self, frames: int = cfg.TRACEMALLOC_FRAMES):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._previous = None
+            log.info("🔬 tracemalloc started (%d frame(s) per allocation)", frames)
+
+    def stop(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            self._previous = None
+            log.info("🔬 tracemalloc stopped")
+
+    def top(self, limit: int = 20) -> Dict:
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc is not running")
+        snapshot = self._filter(tracemalloc.take_snapshot())
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "traced_kb": round(current / 1024, 1),
+            "peak_kb": round(peak / 1024, 1),
+            "top": [
+                {"site": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:limit]
+            ],
+        }
+        if self._previous is not None:
+            result["growth"] = [
+                {"site": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self._previous, "lineno")[:limit]
+            ]
+        self._previous = snapshot
+        return result
+
+    def stats(self) -> Dict:
+        if not tracemalloc.is_tracing():
+            return {"tracing": False}
+        current, peak = tracemalloc.get_traced_memory()
+        return {"tracing": True, "traced_kb": round(current / 1024, 1), "peak_kb": round(peak / 1024, 1)}
+
+
+sampling_profiler = SamplingProfiler()
+memory_profiler = MemoryProfiler()
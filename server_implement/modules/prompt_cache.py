@@ -0,0 +1,164 @@
+"""
+Prompt Cache
+Giữ một cached content phía server cho phần đầu tĩnh của prompt (ROLE + SAFETY, có thể kèm
+toàn bộ tài liệu bài học): tạo khi cần, gia hạn TTL trước khi hết hạn, tạo lại khi nội dung
+đổi (fingerprint khác) hoặc khi server báo cache không còn.
+Backend cung cấp create_cache / refresh_cache / delete_cache (GeminiBackend, MockBackend).
+"""
+import hashlib
+import threading
+import time
+from concurrent.futures import Future
+from typing import Optional
+
+from settings import llm_settings as cfg
+from .context import estimate_tokens
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class CachedPrefix:
+    """Một cached content: request có system prompt bắt đầu bằng `text` thì dùng được `name`"""
+
+    def __init__(self, name: str, text: str, fingerprint: str, expires_at: float):
+        self.name = name
+        self.text = text
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.tokens = estimate_tokens(text)
+
+
+class PromptCache:
+    """Một cache cho mỗi backend, dùng chung cho mọi thiết bị; an toàn khi gọi từ nhiều thread"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.entry: Optional[CachedPrefix] = None
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+        self._pending: Optional[Future] = None  # Lời gọi tạo / gia hạn đang chạy (ngoài _lock)
+        self._too_small = None  # Fingerprint của prefix quá ngắn để cache (chỉ log một lần)
+        self.hits = 0
+        self.misses = 0
+        self.creates = 0
+        self.refreshes = 0
+        self.invalidations = 0
+
+    def fingerprint(self, text: str) -> str:
+        key = f"{self.backend.name}:{self.backend.model}\n{text}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+    def get(self, text: str) -> Optional[CachedPrefix]:
+        """
+        Cached content cho prefix `text`; None nếu không cache được (request gửi nguyên prompt).
+        Lời gọi mạng (tạo / gia hạn / xoá cache) chạy ngoài `_lock` và chỉ một lời gọi được chạy
+        một lúc: thread khác gặp lúc đang tạo thì gửi nguyên prompt, lúc đang gia hạn thì vẫn
+        dùng cache cũ nếu chưa hết hạn.
+        """
+        fingerprint = self.fingerprint(text)
+        stale = None
+        with self._lock:
+            now = time.time()
+            entry = self.entry
+            if entry is not None and entry.fingerprint != fingerprint:
+                if self._pending is None:
+                    log.info("🔄 Prompt/tài liệu đã đổi, tạo lại context cache")
+                    stale, entry, self.entry = entry, None, None
+                else:
+                    entry = None  # Thread khác đang tạo / gia hạn: lần sau mới đổi
+            if entry is not None and entry.expires_at - now >= cfg.CONTEXT_CACHE_REFRESH_MARGIN_SECONDS:
+                return self._count(entry)
+            if self._pending is not None:
+                return self._count(entry if entry is not None and entry.expires_at > now else None)
+            create = entry is None and self._should_create(text, fingerprint, now)
+            if entry is None and not create and stale is None:
+                return self._count(None)
+            pending = self._pending = Future()
+        try:
+            if stale is not None:
+                self._delete(stale)
+            if entry is not None:
+                entry = self._refresh(entry)
+                create = entry is None
+            if create:
+                entry = self._create(text, fingerprint)
+        finally:
+            with self._lock:
+                self._pending = None
+                if entry is not None:
+                    self.entry = entry
+                self._count(entry)
+            pending.set_result(entry)
+        return entry
+
+    def _count(self, entry: Optional[CachedPrefix]) -> Optional[CachedPrefix]:
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def _should_create(self, text: str, fingerprint: str, now: float) -> bool:
+        tokens = estimate_tokens(text)
+        if tokens < cfg.CONTEXT_CACHE_MIN_TOKENS:
+            if self._too_small != fingerprint:
+                log.info("ℹ️  Prompt prefix ~%d tokens < %d, không dùng context cache", tokens, cfg.CONTEXT_CACHE_MIN_TOKENS)
+                self._too_small = fingerprint
+            return False
+        return now >= self._retry_at
+
+    def _refresh(self, entry: CachedPrefix) -> Optional[CachedPrefix]:
+        try:
+            entry.expires_at = self.backend.refresh_cache(entry.name, cfg.CONTEXT_CACHE_TTL_SECONDS)
+            self.refreshes += 1
+            return entry
+        except Exception as e:
+            log.warning("⚠️  Context cache refresh failed (%s: %s), recreating", type(e).__name__, e)
+            with self._lock:
+                if self.entry is entry:
+                    self.entry = None
+            self._delete(entry)
+            return None
+
+    def _create(self, text: str, fingerprint: str) -> Optional[CachedPrefix]:
+        try:
+            name, expires_at = self.backend.create_cache(text, cfg.CONTEXT_CACHE_TTL_SECONDS)
+        except Exception as e:
+            log.warning("⚠️  Context cache create failed (%s: %s)", type(e).__name__, e)
+            self._retry_at = time.time() + cfg.CONTEXT_CACHE_RETRY_SECONDS
+            return None
+        entry = CachedPrefix(name, text, fingerprint, expires_at)
+        self.creates += 1
+        log.info("✅ Context cache %s: ~%d tokens, TTL %ss", name, entry.tokens, cfg.CONTEXT_CACHE_TTL_SECONDS)
+        return entry
+
+    def _delete(self, entry: CachedPrefix):
+        try:
+            self.backend.delete_cache(entry.name)
+        except Exception:
+            pass  # Hết hạn hoặc đã bị xoá phía server: không sao
+
+    def invalidate(self, name: str):
+        """Server báo cache `name` không còn dùng được (hết hạn, bị xoá): lần sau tạo lại"""
+        with self._lock:
+            entry = self.entry
+            if entry is None or entry.name != name:
+                return
+            log.warning("⚠️  Context cache %s no longer valid, dropping", name)
+            self.invalidations += 1
+            self.entry = None
+        self._delete(entry)
+
+    def stats(self) -> dict:
+        entry = self.entry
+        return {
+            "name": entry.name if entry else None,
+            "tokens": entry.tokens if entry else 0,
+            "expires_in": round(entry.expires_at - time.time(), 1) if entry else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "creates": self.creates,
+            "refreshes": self.refreshes,
+            "invalidations": self.invalidations,
+        }
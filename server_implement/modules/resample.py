@@ -0,0 +1,118 @@
+"""
+Polyphase Resampler
+Đổi tần số lấy mẫu bằng bộ lọc FIR đa pha (windowed-sinc, cửa sổ Kaiser), tính vector hoá
+bằng NumPy. Bank bộ lọc được cache theo cặp tần số nên mỗi kết nối chỉ tốn chi phí tính toán.
+Dùng cho audio đầu vào STT (file không phải 16 kHz) và audio TTS gửi xuống thiết bị.
+"""
+from functools import lru_cache
+from math import gcd
+from typing import Tuple
+
+import numpy as np
+
+
+TAPS_PER_PHASE = 32     # Độ dài bộ lọc của mỗi pha (tổng = up * TAPS_PER_PHASE)
+ROLLOFF = 0.9           # Tần số cắt so với Nyquist của tần số thấp hơn
+KAISER_BETA = 8.0       # ~80 dB chống alias
+BLOCK_OUTPUTS = 16384   # Số mẫu ra tối đa mỗi lần tính, giới hạn bộ nhớ cho ma trận chỉ số
+
+
+@lru_cache(maxsize=32)
+def polyphase_bank(src_sr: int, dst_sr: int, taps_per_phase: int = TAPS_PER_PHASE) -> Tuple[int, int, np.ndarray, int]:
+    """
+    Trả về (up, down, bank, delay): bank có shape (up, taps_per_phase), bank[p, j] = h[p + j*up];
+    delay là độ trễ nhóm của bộ lọc, tính theo mẫu ở miền đã upsample.
+    """
+    g = gcd(src_sr, dst_sr)
+    up, down = dst_sr // g, src_sr // g
+    n_taps = up * taps_per_phase
+    cutoff = ROLLOFF / max(up, down)
+
+    # Độ dài lẻ để độ trễ nhóm là số nguyên mẫu; tap cuối = 0 cho vừa bank
+    length = n_taps - 1
+    t = np.arange(length, dtype=np.float64) - (length - 1) / 2
+    h = cutoff * np.sinc(cutoff * t) * np.kaiser(length, KAISER_BETA)
+    h *= up / h.sum()  # Bù biên độ bị mất khi chèn 0 lúc upsample
+    h = np.append(h, 0.0)
+    bank = h.reshape(taps_per_phase, up).T.astype(np.float32)
+    bank.setflags(write=False)
+    return up, down, bank, (length - 1) // 2
+
+
+class StreamingResampler:
+    """
+    Resample từng block liên tiếp (ví dụ audio TTS đọc dần từ file) với trạng thái giữa các block,
+    nên kết quả giống hệt resample() trên toàn bộ tín hiệu. Gọi flush() sau block cuối.
+    """
+
+    def __init__(self, src_sr: int, dst_sr: int):
+        self.src_sr = src_sr
+        self.dst_sr = dst_sr
+        self.up, self.down, self.bank, delay = polyphase_bank(src_sr, dst_sr)
+        self.taps = self.bank.shape[1]
+        self._taps_range = np.arange(self.taps)
+        # Mẫu đầu vào trước vị trí 0 coi như bằng 0
+        self._buffer = np.zeros(self.taps - 1, dtype=np.float32)
+        self._buffer_start = -(self.taps - 1)   # Chỉ số tuyệt đối của _buffer[0]
+        self._next = delay                      # Vị trí (miền upsample) của mẫu ra tiếp theo
+        self._received = 0
+        self._emitted = 0
+
+    def _emit(self, limit: int) -> np.ndarray:
+        """Tính mọi mẫu ra có vị trí < limit (miền upsample)"""
+        if self._next >= limit:
+            return np.zeros(0, dtype=np.float32)
+        positions = np.arange(self._next, limit, self.down)
+        out = np.empty(len(positions), dtype=np.float32)
+        for s in range(0, len(positions), BLOCK_OUTPUTS):
+            n = positions[s:s + BLOCK_OUTPUTS]
+            k = n // self.up - self._buffer_start
+            idx = k[:, None] - self._taps_range[None, :]
+            out[s:s + BLOCK_OUTPUTS] = np.einsum("ij,ij->i", self.bank[n % self.up], self._buffer[idx])
+        self._next = int(positions[-1]) + self.down
+        self._emitted += len(out)
+        return out
+
+    def _drop_consumed(self):
+        first_needed = self._next // self.up - (self.taps - 1)
+        drop = first_needed - self._buffer_start
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._buffer_start += drop
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        """Nhận một block float32/int16, trả về các mẫu ra đã tính được (cùng dtype)"""
+        dtype = samples.dtype
+        x = samples.astype(np.float32, copy=False)
+        self._buffer = np.concatenate([self._buffer, x])
+        self._received += len(x)
+        # Mẫu ra ở vị trí n cần đầu vào tới chỉ số n // up
+        out = self._emit(self._received * self.up)
+        self._drop_consumed()
+        return _to_dtype(out, dtype)
+
+    def flush(self, dtype=np.float32) -> np.ndarray:
+        """Đệm 0 phía sau để lấy nốt các mẫu còn bị giữ lại bởi độ trễ của bộ lọc"""
+        total = -(-self._received * self.up // self.down)
+        remaining = total - self._emitted
+        if remaining <= 0:
+            return np.zeros(0, dtype=dtype)
+        self._buffer = np.concatenate([self._buffer, np.zeros(self.taps, dtype=np.float32)])
+        out = self._emit(self._next + remaining * self.down)
+        self._drop_consumed()
+        return _to_dtype(out, dtype)
+
+
+def _to_dtype(x: np.ndarray, dtype) -> np.ndarray:
+    if np.dtype(dtype) == np.int16:
+        return np.clip(np.rint(x), -32768, 32767).astype(np.int16)
+    return x.astype(dtype, copy=False)
+
+
+def resample(samples: np.ndarray, src_sr: int, dst_sr: int) -> np.ndarray:
+    """Resample toàn bộ một mảng float32/int16 mono; trả về cùng dtype"""
+    if src_sr == dst_sr:
+        return samples
+    resampler = StreamingResampler(src_sr, dst_sr)
+    head = resampler.process(samples)
+    return np.concatenate([head, resampler.flush(samples.dtype)])
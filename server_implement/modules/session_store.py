@@ -0,0 +1,284 @@
+"""
+Session Store Module
+Trạng thái phiên của thiết bị (lịch sử hội thoại, tóm tắt, thống kê khoảng ngừng) nằm ngoài
+gateway để nhiều node cùng phục vụ được. Mỗi phiên có một lease: chỉ node đang giữ lease mới
+được ghi, nên khi bàn giao (drain / node chết) hai node không ghi đè lên nhau.
+Cùng một interface: MemorySessionStore (một server), SQLiteSessionStore (các gateway trên cùng
+máy, cũng dùng thay Redis khi thử nghiệm), RedisSessionStore (nhiều máy).
+"""
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from settings import cluster_settings as cfg
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+class SessionStore:
+    name = "base"
+    shared = True  # False: trạng thái chỉ nằm trong process này, không cần nạp / ghi lại
+
+    def load(self, session_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def save(self, session_id: str, state: dict, node: str, ttl: float) -> bool:
+        """Ghi trạng thái và gia hạn lease; False nếu node khác đang giữ lease"""
+        raise NotImplementedError
+
+    def claim(self, session_id: str, node: str, ttl: float, force: bool = False) -> bool:
+        """Lấy / gia hạn lease; force = nhận luôn phiên của một node đã chết"""
+        raise NotImplementedError
+
+    def release(self, session_id: str, node: str):
+        raise NotImplementedError
+
+    def owner(self, session_id: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def heartbeat(self, node: str, url: str, draining: bool):
+        raise NotImplementedError
+
+    def nodes(self) -> Dict[str, dict]:
+        """Các node còn heartbeat trong NODE_TTL_SECONDS: {node: {"url", "draining"}}"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    """Mặc định: một server giữ mọi phiên trong bộ nhớ như trước"""
+
+    name = "memory"
+    shared = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states: Dict[str, dict] = {}
+        self._leases: Dict[str, tuple] = {}
+        self._nodes: Dict[str, dict] = {}
+
+    def _holder(self, session_id: str) -> Optional[str]:
+        lease = self._leases.get(session_id)
+        return lease[0] if lease and lease[1] > time.monotonic() else None
+
+    def load(self, session_id):
+        return self._states.get(session_id)
+
+    def save(self, session_id, state, node, ttl):
+        with self._lock:
+            if self._holder(session_id) not in (None, node):
+                return False
+            self._leases[session_id] = (node, time.monotonic() + ttl)
+            self._states[session_id] = state
+            return True
+
+    def claim(self, session_id, node, ttl, force=False):
+        with self._lock:
+            if not force and self._holder(session_id) not in (None, node):
+                return False
+            self._leases[session_id] = (node, time.monotonic() + ttl)
+            return True
+
+    def release(self, session_id, node):
+        with self._lock:
+            if self._holder(session_id) == node:
+                del self._leases[session_id]
+
+    def owner(self, session_id):
+        return self._holder(session_id)
+
+    def heartbeat(self, node, url, draining):
+        self._nodes[node] = {"url": url, "draining": draining, "seen_at": time.monotonic()}
+
+    def nodes(self):
+        cutoff = time.monotonic() - cfg.NODE_TTL_SECONDS
+        return {
+            node: {"url": info["url"], "draining": info["draining"]}
+            for node, info in self._nodes.items() if info["seen_at"] > cutoff
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """Một file SQLite dùng chung; mọi thao tác đọc-rồi-ghi lease nằm trong BEGIN IMMEDIATE"""
+
+    name = "sqlite"
+
+    def __init__(self, path=None):
+        self.path = str(path or cfg.SQLITE_PATH)
+        self._lock = threading.Lock()
+        # isolation_level=None: tự quản lý transaction; WAL cho nhiều process đọc song song
+        self._db = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, state TEXT NOT NULL, updated_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS leases (session_id TEXT PRIMARY KEY, node TEXT NOT NULL, expires_at REAL NOT NULL);
+            CREATE TABLE IF NOT EXISTS nodes (node TEXT PRIMARY KEY, url TEXT NOT NULL, draining INTEGER NOT NULL, seen_at REAL NOT NULL);
+        """)
+        log.info("✅ Session store: SQLite %s", self.path)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._db
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+
+    @staticmethod
+    def _holder(db, session_id: str, now: float) -> Optional[str]:
+        row = db.execute(
+            "SELECT node FROM leases WHERE session_id = ? AND expires_at > ?", (session_id, now)
+        ).fetchone()
+        return row[0] if row else None
+
+    def load(self, session_id):
+        with self._lock:
+            row = self._db.execute("SELECT state FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session_id, state, node, ttl):
+        now = time.time()
+        with self._transaction() as db:
+            if self._holder(db, session_id, now) not in (None, node):
+                return False
+            db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (session_id, node, now + ttl))
+            db.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)",
+                (session_id, json.dumps(state, ensure_ascii=False), now),
+            )
+            return True
+
+    def claim(self, session_id, node, ttl, force=False):
+        now = time.time()
+        with self._transaction() as db:
+            if not force and self._holder(db, session_id, now) not in (None, node):
+                return False
+            db.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (session_id, node, now + ttl))
+            return True
+
+    def release(self, session_id, node):
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE session_id = ? AND node = ?", (session_id, node))
+
+    def owner(self, session_id):
+        with self._lock:
+            return self._holder(self._db, session_id, time.time())
+
+    def heartbeat(self, node, url, draining):
+        now = time.time()
+        with self._transaction() as db:
+            db.execute("INSERT OR REPLACE INTO nodes VALUES (?, ?, ?, ?)", (node, url, int(draining), now))
+            db.execute("DELETE FROM sessions WHERE updated_at < ?", (now - cfg.SESSION_TTL_SECONDS,))
+            db.execute("DELETE FROM leases WHERE expires_at < ?", (now,))
+
+    def nodes(self):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT node, url, draining FROM nodes WHERE seen_at > ?", (time.time() - cfg.NODE_TTL_SECONDS,)
+            ).fetchall()
+        return {node: {"url": url, "draining": bool(draining)} for node, url, draining in rows}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+# Lease được kiểm tra và ghi trong cùng một script Lua (nguyên tử phía Redis)
+_CLAIM_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] and ARGV[3] ~= '1' then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+_SAVE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+redis.call('SET', KEYS[2], ARGV[3], 'EX', ARGV[4])
+return 1
+"""
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+
+class RedisSessionStore(SessionStore):
+    """Nhiều máy; lease và node hết hạn bằng TTL của Redis nên không phụ thuộc đồng hồ của các node"""
+
+    name = "redis"
+
+    def __init__(self, url: str = None):
+        # Import tại đây: chỉ cần gói redis khi SESSION_STORE = "redis"
+        import redis
+
+        self.client = redis.Redis.from_url(url or cfg.REDIS_URL, decode_responses=True)
+        self.client.ping()
+        self.prefix = cfg.REDIS_KEY_PREFIX
+        self._claim = self.client.register_script(_CLAIM_SCRIPT)
+        self._save = self.client.register_script(_SAVE_SCRIPT)
+        self._release = self.client.register_script(_RELEASE_SCRIPT)
+        log.info("✅ Session store: Redis %s", url or cfg.REDIS_URL)
+
+    def _key(self, kind: str, name: str) -> str:
+        return f"{self.prefix}{kind}:{name}"
+
+    def load(self, session_id):
+        raw = self.client.get(self._key("session", session_id))
+        return json.loads(raw) if raw else None
+
+    def save(self, session_id, state, node, ttl):
+        return bool(self._save(
+            keys=[self._key("lease", session_id), self._key("session", session_id)],
+            args=[node, int(ttl * 1000), json.dumps(state, ensure_ascii=False), cfg.SESSION_TTL_SECONDS],
+        ))
+
+    def claim(self, session_id, node, ttl, force=False):
+        return bool(self._claim(keys=[self._key("lease", session_id)], args=[node, int(ttl * 1000), int(force)]))
+
+    def release(self, session_id, node):
+        self._release(keys=[self._key("lease", session_id)], args=[node])
+
+    def owner(self, session_id):
+        return self.client.get(self._key("lease", session_id))
+
+    def heartbeat(self, node, url, draining):
+        self.client.set(
+            self._key("node", node),
+            json.dumps({"url": url, "draining": draining}),
+            ex=cfg.NODE_TTL_SECONDS,
+        )
+
+    def nodes(self):
+        result = {}
+        for key in self.client.scan_iter(match=self._key("node", "*")):
+            raw = self.client.get(key)
+            if raw:
+                result[key[len(self._key("node", "")):]] = json.loads(raw)
+        return result
+
+    def close(self):
+        self.client.close()
+
+
+STORES = {
+    MemorySessionStore.name: MemorySessionStore,
+    SQLiteSessionStore.name: SQLiteSessionStore,
+    RedisSessionStore.name: RedisSessionStore,
+}
+
+
+def create_store(name: str = None) -> SessionStore:
+    name = (name or cfg.SESSION_STORE).lower()
+    if name not in STORES:
+        raise ValueError(f"Unknown session store '{name}', choose one of: {', '.join(STORES)}")
+    return STORES[name]()
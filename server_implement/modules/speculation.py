@@ -0,0 +1,126 @@
+"""
+Speculative Pipeline Start
+Chạy trước STT + LLM khi mới im lặng một chút, trước khi endpointer chính thức đóng câu nói.
+Nếu trẻ nói tiếp thì bỏ kết quả; nếu câu nói kết thúc thì dùng luôn, tiết kiệm thời gian chờ.
+"""
+import asyncio
+import time
+from typing import Callable, Optional, Tuple
+
+from . import metrics
+
+
+class SpeculationStats:
+    """Bộ đếm để cân nhắc lợi ích (độ trễ tiết kiệm) với chi phí (compute bỏ đi)"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = 0
+        self.committed = 0
+        self.discarded = 0
+        self.aborted = 0  # Câu nói đúng là đã kết thúc nhưng lượt không được chạy (QoS): không tính vào hit rate
+        self.failed = 0
+        self.wasted_llm_calls = 0
+        self.wasted_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def snapshot(self) -> dict:
+        decided = self.committed + self.discarded
+        return {
+            "started": self.started,
+            "committed": self.committed,
+            "discarded": self.discarded,
+            "aborted": self.aborted,
+            "failed": self.failed,
+            "hit_rate": self.committed / decided if decided else None,
+            "wasted_llm_calls": self.wasted_llm_calls,
+            # Thời gian thực (wall) của các lần chạy bị bỏ, không phải CPU time: STT / LLM chạy ở
+            # worker process và API bên ngoài nên không đo được CPU time của chúng tại đây
+            "wasted_wall_seconds": round(self.wasted_seconds, 3),
+            "saved_latency_seconds": round(self.saved_seconds, 3),
+            "avg_saved_latency_seconds": (
+                round(self.saved_seconds / self.committed, 3) if self.committed else None
+            ),
+        }
+
+
+speculation_stats = SpeculationStats()
+
+
+class SpeculativeRun:
+    """
+    Một lần chạy suy đoán STT -> LLM trên phần câu nói đã thu.
+
+    LLM được gọi qua generate_reply() nên lịch sử hội thoại không bị ghi;
+    phía gọi phải commit_turn() sau khi commit() thành công.
+    """
+
+    def __init__(
+        self,
+        pipeline,
+        audio_data: bytes,
+        session_id: str = "default",
+        on_transcript: Optional[Callable[[str], None]] = None,
+    ):
+        self.pipeline = pipeline
+        self.session_id = session_id
+        self.on_transcript = on_transcript
+        self.started_at = time.perf_counter()
+        self.finished_at: Optional[float] = None
+        self.llm_started = False
+        self.trace = metrics.RequestTrace(session_id=session_id)
+        self.task = asyncio.create_task(self._run(audio_data))
+        speculation_stats.started += 1
+
+    async def _run(self, audio_data: bytes) -> Tuple[str, Optional[str]]:
+        # Span STT/RAG/LLM được ghi vào trace riêng; respond() gộp vào trace của lượt khi commit
+        metrics.use_trace(self.trace)
+        try:
+            text = await self.pipeline.transcribe_pcm_async(audio_data)
+            if self.on_transcript:
+                self.on_transcript(text)
+            reply = None
+            if text.strip():
+                self.llm_started = True
+                reply = await self.pipeline.generate_reply_async(text, session_id=self.session_id)
+            return text, reply
+        finally:
+            self.finished_at = time.perf_counter()
+
+    def _elapsed(self) -> float:
+        end = self.finished_at or time.perf_counter()
+        return end - self.started_at
+
+    def discard(self):
+        """Người nói đã nói tiếp: huỷ và ghi nhận phần compute bị bỏ đi (đoán sai)"""
+        speculation_stats.discarded += 1
+        self._cancel()
+
+    def abort(self):
+        """Lượt bị từ chối vì lý do khác (QoS): huỷ, compute vẫn bị bỏ đi nhưng không phải đoán sai"""
+        speculation_stats.aborted += 1
+        self._cancel()
+
+    def _cancel(self):
+        self.task.cancel()
+        speculation_stats.wasted_seconds += self._elapsed()
+        if self.llm_started:
+            # Request Gemini đã gửi vẫn tính quota dù stream bị huỷ giữa chừng
+            speculation_stats.wasted_llm_calls += 1
+
+    async def commit(self) -> Tuple[str, Optional[str]]:
+        """
+        Câu nói đã kết thúc đúng như dự đoán: chờ kết quả (nếu chưa xong) và trả về
+        (transcript, reply). Raise lại lỗi nếu lần chạy thất bại để phía gọi chạy lại bình thường.
+        """
+        saved = self._elapsed()
+        try:
+            result = await self.task
+        except Exception:
+            speculation_stats.failed += 1
+            raise
+        speculation_stats.committed += 1
+        speculation_stats.saved_seconds += saved
+        return result
@@ -1,16 +1,60 @@
 """
-Speech-to-Text Module with Debug Logging
+Speech-to-Text Module
 Model: ZipFormer with sherpa_onnx
 """
+import os
+import queue
+import time
+from collections import Counter
+from typing import Dict, Optional
 import numpy as np
 import soundfile as sf
 import sherpa_onnx
 from pathlib import Path
 from settings import stt_settings as cfg
+from .resample import resample
+from .hotwords import build_hotwords_file
+from . import metrics
+from .log import get_logger
+
+log = get_logger(__name__)
+
+GREEDY = cfg.GREEDY_SEARCH
+
+
+def available_cores() -> int:
+    """Số core process được phép dùng (tôn trọng taskset / cgroup cpuset)"""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def synthetic_clip(seconds: float, sr: int = cfg.SAMPLE_RATE) -> np.ndarray:
+    """
+    Clip giả lập giọng nói (các hài bậc thấp, cao độ và biên độ thay đổi theo âm tiết)
+    để warm-up: đủ giống tiếng nói để encoder/decoder chạy hết các nhánh thường gặp.
+    """
+    t = np.arange(int(seconds * sr), dtype=np.float32) / sr
+    rng = np.random.default_rng(0)
+    f0 = 180.0 + 40.0 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / sr
+    voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = 0.5 * (1 + np.sin(2 * np.pi * 4.0 * t))
+    clip = 0.3 * voiced * syllables + 0.01 * rng.standard_normal(len(t))
+    return clip.astype(np.float32)
+
 
 class STTEngine:
     def __init__(self):
         self.recognizer = None
+        self.num_threads = 1
+        self.num_workers = 1
+        self.config = {}
+        self.method = cfg.DECODING_METHOD
+        self.rtf: Dict[str, float] = {}       # EWMA của RTF theo phương pháp decode
+        self.decodes: Counter = Counter()
+        self._pools: Dict[str, queue.Queue] = {}
+        self._beam_options = {}
         self._initialize_model()
 
     def _find_model_file(self, patterns):
@@ -18,73 +62,213 @@ class STTEngine:
             if '*' in pattern:
                 files = list(cfg.MODEL_DIR.glob(pattern))
                 if files:
-                    print(f"DEBUG: Found model file {files[0]}")
+                    log.debug("Found model file %s", files[0])
                     return str(files[0])
             else:
                 file_path = cfg.MODEL_DIR / pattern
                 if file_path.exists():
-                    print(f"DEBUG: Found model file {file_path}")
+                    log.debug("Found model file %s", file_path)
                     return str(file_path)
         raise FileNotFoundError(f"Model file not found for patterns: {patterns}")
 
-    def _initialize_model(self):
-        print("🔧 Initializing STT model...")
-        print(f"DEBUG: MODEL_DIR = {cfg.MODEL_DIR}")
-        tokens = self._find_model_file(cfg.TOKENS_FILE_PATTERNS)
-        encoder = self._find_model_file(cfg.ENCODER_FILE_PATTERNS)
-        decoder = self._find_model_file(cfg.DECODER_FILE_PATTERNS)
-        joiner = self._find_model_file(cfg.JOINER_FILE_PATTERNS)
-
-        self.recognizer = sherpa_onnx.OfflineRecognizer.from_transducer(
-            tokens=tokens,
-            encoder=encoder,
-            decoder=decoder,
-            joiner=joiner,
-            num_threads=cfg.NUM_THREADS,
+    def _create_recognizer(self, num_threads: int, method: str = None):
+        method = method or self.method
+        options = self._beam_options if method != GREEDY else {}
+        return sherpa_onnx.OfflineRecognizer.from_transducer(
+            tokens=self._files["tokens"],
+            encoder=self._files["encoder"],
+            decoder=self._files["decoder"],
+            joiner=self._files["joiner"],
+            num_threads=num_threads,
             sample_rate=cfg.SAMPLE_RATE,
             feature_dim=cfg.FEATURE_DIM,
-            decoding_method=cfg.DECODING_METHOD,
+            decoding_method=method,
             provider=cfg.PROVIDER,
+            **options,
         )
-        print("✅ STT model initialized successfully")
 
-    def transcribe_from_file(self, audio_path):
+    def _prepare_beam_search(self) -> int:
+        """Tham số cho modified_beam_search; tạo file hotwords từ từ vựng bài học. Trả về số hotwords."""
+        self._beam_options = {"max_active_paths": cfg.MAX_ACTIVE_PATHS}
+        if not cfg.HOTWORDS_ENABLED:
+            return 0
+        try:
+            bpe_vocab = self._find_model_file(cfg.BPE_VOCAB_PATTERNS)
+        except FileNotFoundError:
+            log.warning("⚠️  bpe.vocab not found, hotwords disabled")
+            return 0
+        count = build_hotwords_file(cfg.HOTWORDS_FILE)
+        self._beam_options.update(
+            hotwords_file=str(cfg.HOTWORDS_FILE),
+            hotwords_score=cfg.HOTWORDS_SCORE,
+            modeling_unit=cfg.HOTWORDS_MODELING_UNIT,
+            bpe_vocab=bpe_vocab,
+        )
+        return count
+
+    def _fill_pool(self, method: str, first_recognizer, clip):
+        """Warm-up đủ num_workers recognizer để câu nói đầu tiên không bị chậm"""
+        pool = queue.Queue()
+        pool.put(first_recognizer)
+        for _ in range(self.num_workers - 1):
+            recognizer = self._create_recognizer(self.num_threads, method)
+            self._warm_up(recognizer, clip)
+            pool.put(recognizer)
+        self._pools[method] = pool
+
+    def _decode(self, recognizer, wav, sr):
+        stream = recognizer.create_stream()
+        stream.accept_waveform(sr, wav)
+        recognizer.decode_stream(stream)
+        return stream.result
+
+    def _warm_up(self, recognizer, clip) -> float:
+        """Decode clip hai lần: lần đầu cấp phát arena / chọn kernel, lần sau đo RTF"""
+        self._decode(recognizer, clip, cfg.SAMPLE_RATE)
+        start = time.perf_counter()
+        self._decode(recognizer, clip, cfg.SAMPLE_RATE)
+        return (time.perf_counter() - start) / (len(clip) / cfg.SAMPLE_RATE)
+
+    def _workers_for(self, num_threads: int, cores: int) -> int:
+        if cfg.NUM_WORKERS != "auto":
+            return int(cfg.NUM_WORKERS)
+        return max(1, min(cfg.AUTOTUNE_MAX_WORKERS, cores // num_threads))
+
+    def _autotune(self, clip, cores: int):
+        """
+        Thử từng số thread, chọn cấu hình có throughput (workers / RTF) cao nhất
+        trong số các cấu hình đạt AUTOTUNE_TARGET_RTF; nếu không cái nào đạt thì chọn RTF thấp nhất.
+        Trả về (num_threads, recognizer đã warm-up, RTF đo được của từng ứng viên).
+        """
+        if cfg.NUM_THREADS != "auto":
+            candidates = [int(cfg.NUM_THREADS)]
+        else:
+            candidates = [t for t in cfg.AUTOTUNE_THREAD_CANDIDATES if t <= cores] or [1]
+
+        measured = {}
+        best = None
+        for num_threads in candidates:
+            recognizer = self._create_recognizer(num_threads)
+            rtf = self._warm_up(recognizer, clip)
+            measured[num_threads] = round(rtf, 4)
+            throughput = self._workers_for(num_threads, cores) / rtf
+            key = (rtf <= cfg.AUTOTUNE_TARGET_RTF, throughput if rtf <= cfg.AUTOTUNE_TARGET_RTF else -rtf)
+            log.debug("STT num_threads=%d RTF=%.3f throughput=%.1fx", num_threads, rtf, throughput)
+            if best is None or key > best[0]:
+                best = (key, num_threads, recognizer)
+        return best[1], best[2], measured
+
+    def _initialize_model(self):
+        log.info("🔧 Initializing STT model...")
+        log.debug("MODEL_DIR = %s", cfg.MODEL_DIR)
+        self._files = {
+            "tokens": self._find_model_file(cfg.TOKENS_FILE_PATTERNS),
+            "encoder": self._find_model_file(cfg.ENCODER_FILE_PATTERNS),
+            "decoder": self._find_model_file(cfg.DECODER_FILE_PATTERNS),
+            "joiner": self._find_model_file(cfg.JOINER_FILE_PATTERNS),
+        }
+
+        hotwords = self._prepare_beam_search() if self.method != GREEDY else 0
+
+        cores = max(1, available_cores() - cfg.RESERVED_CORES)
+        clip = synthetic_clip(cfg.WARMUP_SECONDS)
+        self.num_threads, self.recognizer, measured = self._autotune(clip, cores)
+        self.num_workers = self._workers_for(self.num_threads, cores)
+        self.rtf[self.method] = measured[self.num_threads]
+        self._fill_pool(self.method, self.recognizer, clip)
+
+        if self.method != GREEDY and cfg.GREEDY_FALLBACK:
+            greedy = self._create_recognizer(self.num_threads, GREEDY)
+            self.rtf[GREEDY] = self._warm_up(greedy, clip)
+            self._fill_pool(GREEDY, greedy, clip)
+
+        self.config = {
+            "cores": cores,
+            "num_threads": self.num_threads,
+            "num_workers": self.num_workers,
+            "rtf": measured[self.num_threads],
+            "measured_rtf": measured,
+            "decoding_method": self.method,
+            "greedy_fallback": GREEDY in self._pools and self.method != GREEDY,
+            "latency_budget_seconds": cfg.LATENCY_BUDGET_SECONDS,
+            "hotwords": hotwords,
+        }
+        log.info("✅ STT model initialized successfully: %d worker(s) x %d thread(s), %s, RTF=%.3f",
+                 self.num_workers, self.num_threads, self.method, measured[self.num_threads])
+
+    def choose_method(
+        self, audio_seconds: float, requested_at: Optional[float] = None, method: Optional[str] = None
+    ) -> str:
+        """
+        Beam search nếu ước lượng thời gian decode còn nằm trong ngân sách độ trễ của request
+        (đã trừ thời gian chờ worker); nếu không thì greedy. `method` (nếu có model) được dùng luôn.
+        """
+        if method in self._pools:
+            return method
+        if GREEDY not in self._pools or self.method == GREEDY:
+            return self.method
+        waited = time.perf_counter() - requested_at if requested_at else 0.0
+        estimate = audio_seconds * self.rtf[self.method]
+        if waited + estimate > cfg.LATENCY_BUDGET_SECONDS:
+            return GREEDY
+        return self.method
+
+    def transcribe_from_file(self, audio_path, requested_at: Optional[float] = None, method: Optional[str] = None):
         path = Path(audio_path)
-        print(f"DEBUG: Checking audio path {path}")
-        print("DEBUG: Exists?", path.exists())
         if not path.exists():
             raise FileNotFoundError(f"Audio file not found: {path}")
 
-        try:
-            wav, sr = sf.read(str(path), dtype='float32')
-            print(f"DEBUG: Loaded audio, shape={wav.shape}, sr={sr}")
-        except Exception as e:
-            print("ERROR reading audio:", e)
-            raise
+        wav, sr = sf.read(str(path), dtype='float32')
+        log.debug("Loaded audio %s, shape=%s, sr=%d", path, wav.shape, sr)
 
         if wav.ndim > 1:
             wav = wav[:, 0]
         if sr != cfg.SAMPLE_RATE:
-            print(f"DEBUG: Resampling from {sr} to {cfg.SAMPLE_RATE}")
-            new_len = int(len(wav) * cfg.SAMPLE_RATE / sr)
-            wav = np.interp(
-                np.linspace(0,1,new_len),
-                np.linspace(0,1,len(wav)),
-                wav
-            ).astype('float32')
+            log.debug("Resampling from %d to %d", sr, cfg.SAMPLE_RATE)
+            wav = resample(wav, sr, cfg.SAMPLE_RATE)
             sr = cfg.SAMPLE_RATE
 
-        stream = self.recognizer.create_stream()
-        stream.accept_waveform(sr, wav)
-        self.recognizer.decode_stream(stream)
+        return self.transcribe_samples(wav, sr, requested_at, method)
+
+    def transcribe_samples(self, wav, sr=None, requested_at: Optional[float] = None, method: Optional[str] = None):
+        """
+        Nhận dạng trực tiếp từ mảng float32 trong bộ nhớ (không cần ghi file WAV).
+        requested_at: thời điểm (perf_counter) request bắt đầu chờ STT, để tính ngân sách độ trễ.
+        method: ép phương pháp decode (vd. greedy khi server quá tải); None = tự chọn.
+        """
+        sr = sr or cfg.SAMPLE_RATE
+        audio_seconds = len(wav) / sr
+        method = self.choose_method(audio_seconds, requested_at, method)
+        metrics.tag("stt_method", method)
 
-        res = stream.result
-        print(f"DEBUG: Recognition result: {res}")
+        pool = self._pools[method]
+        recognizer = pool.get()
+        start = time.perf_counter()
+        try:
+            res = self._decode(recognizer, wav, sr)
+        finally:
+            pool.put(recognizer)
+        if audio_seconds > 0:
+            rtf = (time.perf_counter() - start) / audio_seconds
+            self.rtf[method] += cfg.RTF_SMOOTHING * (rtf - self.rtf[method])
+        self.decodes[method] += 1
+        log.debug("Recognition result (%s): %s", method, res)
         return res.text
 
-    def transcribe(self, audio_input_path):
+    def transcribe_pcm16(self, pcm: bytes, requested_at: Optional[float] = None, method: Optional[str] = None):
+        """Nhận dạng từ PCM 16-bit mono (định dạng ESP32 gửi lên), không cần ghi ra WAV"""
+        wav = np.frombuffer(pcm, dtype=np.int16).astype(np.float32) / 32768.0
+        return self.transcribe_samples(wav, cfg.SAMPLE_RATE, requested_at, method)
+
+    def stats(self) -> dict:
+        return {
+            "decodes": dict(self.decodes),
+            "rtf": {method: round(rtf, 4) for method, rtf in self.rtf.items()},
+        }
+
+    def transcribe(self, audio_input_path, requested_at: Optional[float] = None, method: Optional[str] = None):
         """Alias kept for compatibility with pipeline.py"""
-        return self.transcribe_from_file(audio_input_path)
+        return self.transcribe_from_file(audio_input_path, requested_at, method)
 
 if __name__ == '__main__':
     print("\n=== STT Debug Run ===")
@@ -1,37 +1,53 @@
 """
-Text-to-Speech Module with Debug Logging
+Text-to-Speech Module
 Model: ZipVoice
 """
 import sys
+import asyncio
+import logging
+import resource
 import subprocess
 from pathlib import Path
 from settings import tts_settings as cfg
+from . import metrics
+from .degradation import degradation
+from .log import get_logger
+
+log = get_logger(__name__)
+
+STDERR_TAIL_CHARS = 2000  # Phần cuối stderr của ZipVoice ghi kèm khi TTS lỗi
+
+
+def _stderr_tail(stderr: str) -> str:
+    return stderr[-STDERR_TAIL_CHARS:].strip()
+
+
+def _children_cpu() -> float:
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
 
 class TTSEngine:
     def __init__(self):
         self._validate_setup()
-        print(f"DEBUG: Ensuring output dir {cfg.OUTPUT_AUDIO_DIR}")
         cfg.OUTPUT_AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
     def _validate_setup(self):
-        print("🔧 Validating TTS setup...")
+        log.info("🔧 Validating TTS setup...")
         if not cfg.ZIPVOICE_CODE_DIR.exists():
             raise FileNotFoundError(f"Code dir not found: {cfg.ZIPVOICE_CODE_DIR}")
         if not cfg.MODEL_DIR.exists():
             raise FileNotFoundError(f"Model dir not found: {cfg.MODEL_DIR}")
-        print("✅ TTS setup validated")
+        log.info("✅ TTS setup validated")
 
     def _find_checkpoint(self):
         for ext in cfg.CHECKPOINT_EXTENSIONS:
             files = list(cfg.MODEL_DIR.glob(f"*{ext}"))
             if files:
-                print(f"DEBUG: Found checkpoint {files[0].name}")
                 return files[0].name
-        print("DEBUG: No checkpoint found")
         return None
 
-    def synthesize(self, text, output_path=None, ref_audio=None, prompt_text=None):
-        print(f"🔊 Synthesizing: {text[:30]}...")
+    def _build_command(self, text, output_path=None, ref_audio=None, prompt_text=None):
         checkpoint = self._find_checkpoint()
         if not checkpoint:
             raise FileNotFoundError(f"Checkpoint missing in {cfg.MODEL_DIR}")
@@ -40,6 +56,9 @@ class TTSEngine:
         prompt_text = prompt_text or cfg.DEFAULT_PROMPT_TEXT
         output_path = Path(output_path) if output_path else cfg.OUTPUT_AUDIO_DIR / "output.wav"
         output_path.parent.mkdir(parents=True, exist_ok=True)
+        # Quá tải: ít bước flow matching hơn (nhanh hơn, chất lượng giọng giảm nhẹ)
+        steps = degradation.tier.tts_steps
+        num_step = min(steps, cfg.NUM_STEP) if steps else cfg.NUM_STEP
 
         cmd = [
             sys.executable, "-m", "zipvoice.bin.infer_zipvoice",
@@ -50,24 +69,67 @@ class TTSEngine:
             "--prompt-text", prompt_text,
             "--text", text,
             "--res-wav-path", str(output_path),
-            "--num-step", str(cfg.NUM_STEP),
+            "--num-step", str(num_step),
             "--remove-long-sil", str(cfg.REMOVE_LONG_SIL),
             "--tokenizer", cfg.TOKENIZER,
             "--lang", cfg.LANG,
         ]
+        return cmd, output_path
 
-        print("DEBUG: Command:", cmd)
+    def synthesize(self, text, output_path=None, ref_audio=None, prompt_text=None):
+        log.info("🔊 Synthesizing: %s...", text[:30])
+        cmd, output_path = self._build_command(text, output_path, ref_audio, prompt_text)
+
+        log.debug("Command: %s", cmd)
         result = subprocess.run(cmd, cwd=str(cfg.ZIPVOICE_CODE_DIR), capture_output=True, text=True)
-        print("DEBUG: returncode", result.returncode)
-        print("DEBUG: stdout", result.stdout)
-        print("DEBUG: stderr", result.stderr)
+        log.debug("ZipVoice returncode=%d\nstdout: %s\nstderr: %s", result.returncode, result.stdout, result.stderr)
 
         if result.returncode != 0:
+            log.error("ZipVoice failed (code %d): %s", result.returncode, _stderr_tail(result.stderr))
             raise RuntimeError(f"TTS failed, code {result.returncode}")
         if not output_path.exists():
             raise RuntimeError(f"Output missing: {output_path}")
 
-        print(f"✅ Audio generated: {output_path}")
+        log.info("✅ Audio generated: %s", output_path)
+        return output_path
+
+    async def synthesize_async(self, text, output_path=None, ref_audio=None, prompt_text=None):
+        """Như synthesize() nhưng không chặn event loop; cancel task sẽ kill tiến trình ZipVoice."""
+        log.info("🔊 Synthesizing (async): %s...", text[:30])
+        cmd, output_path = self._build_command(text, output_path, ref_audio, prompt_text)
+
+        # stdout của ZipVoice chỉ được đọc khi bật DEBUG cho module này
+        debug = log.isEnabledFor(logging.DEBUG)
+        cpu_before = _children_cpu()
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            cwd=str(cfg.ZIPVOICE_CODE_DIR),
+            stdout=asyncio.subprocess.PIPE if debug else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await proc.communicate()
+        except asyncio.CancelledError:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+            log.info("🛑 TTS cancelled, ZipVoice process killed")
+            raise
+
+        # CPU của process ZipVoice (đã được reap sau communicate); nếu nhiều câu được tổng hợp
+        # cùng lúc, các process kết thúc trong khoảng này cũng bị tính vào
+        metrics.add_usage("tts", _children_cpu() - cpu_before)
+        stderr = stderr.decode(errors="replace")
+        if debug:
+            log.debug("ZipVoice returncode=%d\nstdout: %s\nstderr: %s",
+                      proc.returncode, stdout.decode(errors="replace"), stderr)
+        if proc.returncode != 0:
+            log.error("ZipVoice failed (code %d): %s", proc.returncode, _stderr_tail(stderr))
+            raise RuntimeError(f"TTS failed, code {proc.returncode}")
+        if not output_path.exists():
+            raise RuntimeError(f"Output missing: {output_path}")
+
+        log.info("✅ Audio generated: %s", output_path)
         return output_path
 
 if __name__ == '__main__':
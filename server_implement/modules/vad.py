@@ -0,0 +1,173 @@
+"""
+Voice Activity Detection Module
+Model: Silero VAD (ONNX) chạy trực tiếp bằng onnxruntime trên mảng NumPy,
+không cần torch / torch.hub (model đặt sẵn trong thư mục models/, chạy được offline).
+"""
+from pathlib import Path
+
+import numpy as np
+import onnxruntime as ort
+
+from .log import get_logger
+
+log = get_logger(__name__)
+
+
+SAMPLE_RATE = 16000
+WINDOW_SAMPLES = 512     # Silero v5 ở 16 kHz chỉ nhận đúng 512 mẫu mỗi lần
+CONTEXT_SAMPLES = 64     # v5 ghép 64 mẫu cuối của cửa sổ trước vào đầu cửa sổ sau
+
+MODEL_DOWNLOAD_HINT = (
+    "Tải silero_vad.onnx từ https://github.com/snakers4/silero-vad "
+    "(src/silero_vad/data/silero_vad.onnx) và đặt vào {path}"
+)
+
+
+class SileroVADModel:
+    """
+    Một InferenceSession dùng chung cho mọi kết nối.
+    Trạng thái RNN nằm trong từng VADStream nên các thiết bị không ảnh hưởng lẫn nhau.
+    """
+
+    def __init__(self, model_path, num_threads: int = 1):
+        model_path = Path(model_path)
+        if not model_path.exists():
+            raise FileNotFoundError(
+                f"Silero VAD model not found: {model_path}. "
+                + MODEL_DOWNLOAD_HINT.format(path=model_path)
+            )
+
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        options.log_severity_level = 3
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+
+        input_names = {i.name for i in self.session.get_inputs()}
+        # v5 dùng một tensor "state"; v4 dùng cặp "h"/"c"
+        self.version = "v5" if "state" in input_names else "v4"
+        log.info("✅ Silero VAD %s loaded from %s", self.version, model_path)
+
+    def new_stream(self) -> "VADStream":
+        return VADStream(self)
+
+
+class VADStream:
+    """
+    Trạng thái VAD của một kết nối.
+
+    Frame 30ms của ESP32 (480 mẫu) không khớp cửa sổ 512 mẫu của Silero, nên mẫu
+    được dồn vào bộ đệm và model chạy mỗi khi đủ một cửa sổ. Các bộ đệm được cấp
+    phát sẵn để mỗi frame không phải tạo mảng mới.
+    """
+
+    def __init__(self, model: SileroVADModel):
+        self.model = model
+        self._pending = np.zeros(WINDOW_SAMPLES * 2, dtype=np.float32)
+        self._pending_len = 0
+        self._sr = np.array(SAMPLE_RATE, dtype=np.int64)
+        if model.version == "v5":
+            self._input = np.zeros((1, CONTEXT_SAMPLES + WINDOW_SAMPLES), dtype=np.float32)
+        else:
+            self._input = np.zeros((1, WINDOW_SAMPLES), dtype=np.float32)
+        self.reset()
+
+    def reset(self):
+        if self.model.version == "v5":
+            self._state = np.zeros((2, 1, 128), dtype=np.float32)
+            self._input[:, :CONTEXT_SAMPLES] = 0.0
+        else:
+            self._h = np.zeros((2, 1, 64), dtype=np.float32)
+            self._c = np.zeros((2, 1, 64), dtype=np.float32)
+        self._pending_len = 0
+        self.last_prob = 0.0
+
+    def _run_window(self, window: np.ndarray) -> float:
+        session = self.model.session
+        if self.model.version == "v5":
+            self._input[0, CONTEXT_SAMPLES:] = window
+            out, self._state = session.run(
+                None, {"input": self._input, "state": self._state, "sr": self._sr}
+            )
+            self._input[0, :CONTEXT_SAMPLES] = window[-CONTEXT_SAMPLES:]
+        else:
+            self._input[0, :] = window
+            out, self._h, self._c = session.run(
+                None, {"input": self._input, "sr": self._sr, "h": self._h, "c": self._c}
+            )
+        return float(out[0, 0])
+
+    def __call__(self, pcm: bytes) -> float:
+        """Xác suất có tiếng nói cho một frame PCM 16-bit mono (cửa sổ mới nhất đã chạy)"""
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        n = len(samples)
+        if self._pending_len + n > len(self._pending):
+            self._pending = np.concatenate(
+                [self._pending[:self._pending_len], np.zeros(n, dtype=np.float32)]
+            )
+        np.multiply(
+            samples, 1.0 / 32768.0,
+            out=self._pending[self._pending_len:self._pending_len + n],
+            casting="unsafe",
+        )
+        self._pending_len += n
+
+        start = 0
+        while self._pending_len - start >= WINDOW_SAMPLES:
+            self.last_prob = self._run_window(self._pending[start:start + WINDOW_SAMPLES])
+            start += WINDOW_SAMPLES
+        if start:
+            remaining = self._pending_len - start
+            self._pending[:remaining] = self._pending[start:self._pending_len]
+            self._pending_len = remaining
+        return self.last_prob
+
+
+class EnergyGate:
+    """
+    Cổng năng lượng rất rẻ đặt trước front-end và VAD: frame có RMS dưới FLOOR_DBFS, hoặc
+    không to hơn nền nhiễu quá MARGIN_DB, là im lặng chắc chắn và không cần gọi Silero.
+    Nền nhiễu bám theo mức nhỏ nhất (giảm ngay, tăng chậm) nên lớp ồn thì ngưỡng tự nâng lên.
+    Sau một frame to, HANGOVER_FRAMES frame tiếp theo vẫn được đưa vào VAD.
+    Mức được đo sau khi trừ trung bình của frame: gate đứng trước bộ lọc DC của front-end, và
+    micro có offset DC (INMP441) sẽ kéo nền nhiễu lên bằng mức DC, nuốt mất tiếng nói.
+    """
+
+    def __init__(
+        self,
+        floor_dbfs: float = -50.0,
+        margin_db: float = 6.0,
+        noise_rise_db: float = 0.02,
+        hangover_frames: int = 10,
+    ):
+        self.floor_dbfs = floor_dbfs
+        self.margin_db = margin_db
+        self.noise_rise_db = noise_rise_db
+        self.hangover_frames = hangover_frames
+        self.noise_dbfs = None
+        self._hangover = 0
+
+    @staticmethod
+    def level_dbfs(pcm: bytes) -> float:
+        samples = np.frombuffer(pcm, dtype=np.int16).astype(np.float32)
+        if len(samples) == 0:
+            return -120.0
+        samples -= samples.mean()  # Bỏ DC
+        energy = float(np.dot(samples, samples)) / (len(samples) * 32768.0 * 32768.0)
+        return 10.0 * np.log10(energy + 1e-12)
+
+    def is_silence(self, pcm: bytes) -> bool:
+        level = self.level_dbfs(pcm)
+        if self.noise_dbfs is None or level < self.noise_dbfs:
+            self.noise_dbfs = level
+        else:
+            self.noise_dbfs += self.noise_rise_db
+        if level < max(self.floor_dbfs, self.noise_dbfs + self.margin_db):
+            if self._hangover > 0:
+                self._hangover -= 1
+                return False
+            return True
+        self._hangover = self.hangover_frames
+        return False
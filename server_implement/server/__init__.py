@@ -0,0 +1,5 @@
+"""
+Server websocket cho ESP32: ingest audio, endpointing (timeout / VAD / wake word), trả lời.
+Chạy từ thư mục server_implement: uvicorn server.app:app --host 0.0.0.0 --port 8000
+Nhiều core: python -m server.workers --host 0.0.0.0 --port 8000 (STT trong các process riêng)
+"""
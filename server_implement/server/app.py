@@ -0,0 +1,237 @@
+"""
+FastAPI app: tải model trong lifespan, endpoint /ws dùng chung cho mọi firmware
+(chọn endpointing theo settings hoặc ?endpointing=), cùng /health, /ready, /metrics.
+Nhiều gateway: /route và /drain (xem server.cluster).
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from settings import server_settings as cfg
+from settings import kws_settings
+from modules.pipeline import VoiceAssistantPipeline
+from modules.speculation import speculation_stats
+from modules.metrics import metrics
+from modules.vad import SileroVADModel
+from modules.kws import KeywordSpotterModel
+from modules import log as logs
+from modules.profiler import memory_profiler, sampling_profiler
+from modules.degradation import degradation
+from modules.session_store import create_store
+from .archive import archiver
+from .cluster import Cluster
+from .qos import qos
+from .session import DeviceSession, connection_stats
+from .strategies import get_strategy
+
+log = logs.get_logger(__name__)
+
+# --- Khởi tạo model ---
+# Không tải gì lúc import: uvicorn nhận kết nối ngay, các model được tải song song
+# trong lifespan. Thiết bị được nhận kết nối khi VAD sẵn sàng; các câu nói đến
+# trước khi STT/LLM/TTS tải xong sẽ xếp hàng chờ trong pipeline.
+pipeline = VoiceAssistantPipeline(load=False)
+cluster = Cluster(create_store(), pipeline)
+
+vad_model: Optional[SileroVADModel] = None
+vad_status = {"state": "pending"}
+vad_ready = asyncio.Event()
+
+async def load_vad():
+    global vad_model, vad_status
+    vad_status = {"state": "loading"}
+    start = time.perf_counter()
+    try:
+        vad_model = await asyncio.to_thread(SileroVADModel, cfg.VAD_MODEL_PATH)
+        vad_status = {"state": "ready", "version": vad_model.version, "load_seconds": round(time.perf_counter() - start, 2)}
+        log.info("Silero VAD model loaded successfully.")
+    except Exception as e:
+        log.error("Error loading Silero VAD model: %s", e)
+        vad_status = {"state": "failed", "error": str(e)}
+    vad_ready.set()
+
+# Keyword spotter chỉ được tải khi server dùng endpointing "wakeword"
+kws_model: Optional[KeywordSpotterModel] = None
+kws_status = {"state": "disabled"}
+kws_ready = asyncio.Event()
+
+async def load_kws():
+    global kws_model, kws_status
+    if not (kws_settings.KWS_ENABLED and cfg.ENDPOINTING == "wakeword"):
+        kws_ready.set()
+        return
+    kws_status = {"state": "loading"}
+    start = time.perf_counter()
+    try:
+        kws_model = await asyncio.to_thread(KeywordSpotterModel)
+        kws_status = {"state": "ready", "load_seconds": round(time.perf_counter() - start, 2)}
+    except Exception as e:
+        # Vẫn phục vụ được: thiết bị tự gửi "WAKE" (wake word trên ESP32)
+        log.warning("⚠️  Keyword spotter failed to load, only device-side wake word will work: %s", e)
+        kws_status = {"state": "failed", "error": str(e)}
+    kws_ready.set()
+
+async def load_busy_reply():
+    """Tổng hợp sẵn câu "đợi chút" của QoS (và bậc giảm tải "canned") ngay khi TTS sẵn sàng"""
+    if not (cfg.QOS_ENABLED or cfg.DEGRADATION_ENABLED):
+        return
+    try:
+        await qos.busy_reply(pipeline)
+    except Exception as e:
+        log.warning("⚠️  Busy reply not cached yet, will retry when needed: %s", e)
+
+async def load_models():
+    await asyncio.gather(load_vad(), load_kws(), pipeline.load_async(), load_busy_reply())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await cluster.start()
+    loader = asyncio.create_task(load_models())
+    degradation.start(lambda: qos.admission.waiting)
+    yield
+    degradation.stop()
+    loader.cancel()
+    await cluster.stop()
+    await archiver.stop()
+
+app = FastAPI(lifespan=lifespan)
+
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    if cluster.draining:
+        # Node đang drain: thiết bị thử lại, load balancer đưa sang node khác
+        await websocket.close(code=1013)
+        return
+    try:
+        strategy = get_strategy(websocket.query_params.get("endpointing"))
+        priority = qos.priority(websocket.query_params.get("priority"))
+    except ValueError as e:
+        log.warning("❌ %s", e)
+        await websocket.close(code=1008)  # Policy Violation: tham số không hợp lệ
+        return
+    if strategy.needs_vad:
+        await vad_ready.wait()
+        if vad_model is None:
+            # VAD lỗi: không thể phục vụ, báo thiết bị thử lại sau (1013 = Try Again Later)
+            await websocket.close(code=1013)
+            return
+    if strategy.needs_kws:
+        await kws_ready.wait()
+
+    session = DeviceSession(
+        websocket,
+        pipeline,
+        vad_model if strategy.needs_vad else None,
+        kws_model if strategy.needs_kws else None,
+        cluster,
+        priority,
+    )
+    if not await cluster.attach(session):
+        # Node khác vẫn đang giữ phiên của thiết bị này (đang bàn giao): thử lại sau
+        log.info("Session is held by another node, rejecting connection.", extra=session.log_extra)
+        await websocket.close(code=1013)
+        return
+    try:
+        await websocket.accept()
+        log.info("Client connected from: %s (endpointing=%s)", websocket.client.host, strategy.name, extra=session.log_extra)
+        await session.run(strategy(session))
+    finally:
+        await cluster.detach(session)
+
+@app.get("/")
+def read_root():
+    return {"status": "Voice Assistant Server is running"}
+
+@app.get("/health")
+def health_check():
+    """Liveness: process còn sống và event loop còn phản hồi"""
+    return {"status": "ok"}
+
+@app.get("/ready")
+def readiness_check():
+    """Readiness theo từng engine; 503 cho tới khi tất cả đã tải xong"""
+    engines = {"vad": vad_status, "kws": kws_status, **pipeline.status}
+    ready = all(engine["state"] in ("ready", "disabled") for engine in engines.values())
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"ready": ready, "accepting_connections": vad_model is not None, "engines": engines},
+    )
+
+@app.get("/metrics")
+def read_metrics(format: str = "json", recent: int = 20):
+    """Histogram độ trễ theo giai đoạn (p50/p95/p99); ?format=prometheus cho Prometheus scrape"""
+    if format == "prometheus":
+        return PlainTextResponse(metrics.prometheus() + degradation.prometheus())
+    result = {**metrics.snapshot(recent=recent), "speculation": speculation_stats.snapshot()}
+    if pipeline.stt_engine is not None:
+        # Số lần decode theo phương pháp (beam / greedy fallback) và RTF hiện tại
+        result["stt"] = pipeline.stt_engine.stats()
+    if pipeline.llm_engine is not None and pipeline.llm_engine.prompt_cache is not None:
+        result["llm_cache"] = pipeline.llm_engine.prompt_cache.stats()
+    if kws_model is not None:
+        result["kws"] = kws_model.stats()
+    result["connections"] = connection_stats.snapshot()
+    result["cluster"] = cluster.stats()
+    result["archive"] = archiver.stats()
+    result["qos"] = qos.stats()
+    result["degradation"] = degradation.stats()
+    result["logging"] = logs.stats()
+    result["profiler"] = {"sampling": sampling_profiler.running, "memory": memory_profiler.stats()}
+    return result
+
+@app.get("/route")
+def route_device(device_id: str):
+    """Node phụ trách thiết bị theo consistent hash (cho load balancer / cấu hình thiết bị)"""
+    return cluster.route(device_id)
+
+@app.post("/drain")
+async def drain_node():
+    """Bàn giao mọi phiên sang node khác trước khi dừng / cập nhật node này"""
+    drained = await cluster.drain()
+    return {"node": cluster.node_id, "drained": drained}
+
+@app.post("/degradation")
+def force_degradation(tier: str = "auto"):
+    """Ép một bậc giảm tải (vd. trước giờ ra chơi); tier=auto trả lại cho bộ điều khiển"""
+    try:
+        degradation.force(tier)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    return degradation.stats()
+
+@app.post("/profile/cpu")
+async def profile_cpu(seconds: float = 10.0, interval_ms: float = cfg.PROFILE_INTERVAL_SECONDS * 1000):
+    """Lấy mẫu stack trong `seconds` giây; kết quả dạng collapsed cho flamegraph.pl / speedscope"""
+    try:
+        stacks = await asyncio.to_thread(sampling_profiler.run, seconds, interval_ms / 1000)
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e)})
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+    return PlainTextResponse(stacks)
+
+@app.post("/profile/memory/start")
+def start_memory_profile(frames: int = cfg.TRACEMALLOC_FRAMES):
+    memory_profiler.start(frames)
+    return memory_profiler.stats()
+
+@app.post("/profile/memory/stop")
+def stop_memory_profile():
+    memory_profiler.stop()
+    return memory_profiler.stats()
+
+@app.get("/profile/memory")
+def read_memory_profile(top: int = 20):
+    """Chỗ cấp phát nhiều nhất và phần tăng thêm so với lần gọi trước"""
+    try:
+        return memory_profiler.top(top)
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e)})
+
+@app.get("/speculation")
+def read_speculation_stats():
+    return speculation_stats.snapshot()
@@ -0,0 +1,153 @@
+"""
+Lưu câu nói đã thu để nghe lại / gán nhãn, ngoài đường găng của câu trả lời:
+hàng đợi có giới hạn + vài worker ghi file trong thread, tên file duy nhất theo thiết bị,
+nén FLAC/Opus tuỳ chọn, lấy mẫu (chỉ x% hoặc chỉ câu lỗi) và dọn theo dung lượng / tuổi.
+"""
+import asyncio
+import random
+import re
+import shutil
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+import soundfile as sf
+
+from settings import server_settings as cfg
+from modules.log import get_logger
+
+log = get_logger(__name__)
+
+# ARCHIVE_FORMAT -> (format, subtype, đuôi file) của soundfile / libsndfile
+FORMATS = {
+    "wav": ("WAV", "PCM_16", ".wav"),
+    "flac": ("FLAC", "PCM_16", ".flac"),
+    "opus": ("OGG", "OPUS", ".ogg"),
+}
+
+_UNSAFE_CHARS_RE = re.compile(r"[^\w.-]+")
+
+
+@dataclass
+class ArchiveJob:
+    device_id: str
+    pcm: bytes
+    failed: bool
+    created_at: datetime
+
+
+class AudioArchiver:
+    def __init__(self):
+        self.root = Path(cfg.ARCHIVE_DIR)
+        self.format = cfg.ARCHIVE_FORMAT.lower()
+        if self.format not in FORMATS:
+            raise ValueError(f"Unknown archive format '{cfg.ARCHIVE_FORMAT}', choose one of: {', '.join(FORMATS)}")
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._last_sweep = 0.0
+        self.counts = {"written": 0, "failures": 0, "sampled_out": 0, "dropped": 0, "errors": 0, "removed": 0}
+        self.bytes_written = 0
+
+    def _start(self):
+        # Tạo lười trong event loop đang chạy (không cần lifespan khi chạy test / benchmark)
+        self._queue = asyncio.Queue(maxsize=cfg.ARCHIVE_QUEUE_SIZE)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(cfg.ARCHIVE_WORKERS)]
+
+    def submit(self, device_id: str, pcm: bytes, failed: bool = False) -> bool:
+        """Không chặn: True nếu câu nói được đưa vào hàng đợi"""
+        if not cfg.ARCHIVE_ENABLED or not pcm:
+            return False
+        if not (failed and cfg.ARCHIVE_FAILURES) and random.random() >= cfg.ARCHIVE_SAMPLE_RATIO:
+            self.counts["sampled_out"] += 1
+            return False
+        if self._queue is None:
+            self._start()
+        try:
+            self._queue.put_nowait(ArchiveJob(device_id, pcm, failed, datetime.now()))
+        except asyncio.QueueFull:
+            self.counts["dropped"] += 1
+            return False
+        return True
+
+    async def _worker(self):
+        while True:
+            job = await self._queue.get()
+            try:
+                size = await asyncio.to_thread(self._write, job)
+                self.counts["written"] += 1
+                self.counts["failures"] += job.failed
+                self.bytes_written += size
+                if time.monotonic() - self._last_sweep > cfg.ARCHIVE_RETENTION_INTERVAL_SECONDS:
+                    self._last_sweep = time.monotonic()
+                    self.counts["removed"] += await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                self.counts["errors"] += 1
+                log.warning("⚠️  Failed to archive utterance from %s: %s", job.device_id, e)
+            finally:
+                self._queue.task_done()
+
+    def path_for(self, job: ArchiveJob) -> Path:
+        """<thiết bị>/<ngày>/<giờ>_<id>: không trùng kể cả khi nhiều thiết bị / gateway ghi cùng lúc"""
+        device = _UNSAFE_CHARS_RE.sub("_", job.device_id) or "unknown"
+        name = f"{job.created_at.strftime('%H-%M-%S.%f')[:-3]}_{uuid.uuid4().hex[:8]}"
+        if job.failed:
+            name += "_failed"
+        return self.root / device / job.created_at.strftime("%Y-%m-%d") / (name + FORMATS[self.format][2])
+
+    def _write(self, job: ArchiveJob) -> int:
+        path = self.path_for(job)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fmt, subtype, _ = FORMATS[self.format]
+        samples = np.frombuffer(job.pcm, dtype=np.int16)
+        sf.write(str(path), samples, cfg.SAMPLE_RATE, format=fmt, subtype=subtype)
+        return path.stat().st_size
+
+    def sweep(self) -> int:
+        """Xoá file quá ARCHIVE_MAX_AGE_DAYS, rồi file cũ nhất cho tới khi tổng dung lượng ≤ ARCHIVE_MAX_BYTES"""
+        if not self.root.exists():
+            return 0
+        cutoff = time.time() - cfg.ARCHIVE_MAX_AGE_DAYS * 86400
+        files = []
+        for path in self.root.rglob("*"):
+            if path.is_file():
+                st = path.stat()
+                files.append((st.st_mtime, st.st_size, path))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        removed = 0
+        for mtime, size, path in files:
+            if mtime >= cutoff and total <= cfg.ARCHIVE_MAX_BYTES:
+                break
+            path.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        # Thư mục ngày / thiết bị đã trống
+        for directory in sorted((p for p in self.root.rglob("*") if p.is_dir()), reverse=True):
+            if not any(directory.iterdir()):
+                shutil.rmtree(directory, ignore_errors=True)
+        if removed:
+            log.info("🧹 Archive retention removed %d file(s), %.1f MB kept", removed, total / 1024 ** 2)
+        return removed
+
+    async def stop(self):
+        """Ghi nốt các câu nói đang chờ trước khi tắt server"""
+        if self._queue is not None:
+            await self._queue.join()
+        for task in self._tasks:
+            task.cancel()
+        self._queue, self._tasks = None, []
+
+    def stats(self) -> dict:
+        return {
+            **self.counts,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "bytes_written": self.bytes_written,
+            "format": self.format,
+        }
+
+
+archiver = AudioArchiver()
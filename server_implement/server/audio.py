@@ -0,0 +1,63 @@
+"""
+Audio ingest / downlink dùng chung cho mọi kiểu endpointing:
+ghép các gói PCM có kích thước bất kỳ thành frame 30ms, và đọc WAV trả lời
+thành các chunk PCM 16 kHz cho thiết bị. Câu nói đã thu được lưu bởi server.archive.
+"""
+from typing import Iterator, List
+
+import numpy as np
+import soundfile as sf
+
+from settings import server_settings as cfg
+from modules.resample import StreamingResampler
+
+
+class FrameAssembler:
+    """
+    Cắt luồng bytes thành các frame frame_bytes byte. Firmware vad/ gửi đúng 960 byte/gói
+    (đi thẳng, không copy); firmware khác gửi 512-2048 byte/gói thì được ghép lại.
+    """
+
+    def __init__(self, frame_bytes: int = cfg.VAD_CHUNK_SIZE):
+        self.frame_bytes = frame_bytes
+        self._pending = bytearray()
+
+    def push(self, data: bytes) -> List[bytes]:
+        if not self._pending and len(data) == self.frame_bytes:
+            return [data]
+        self._pending += data
+        n = len(self._pending) // self.frame_bytes * self.frame_bytes
+        if n == 0:
+            return []
+        frames = [bytes(self._pending[i:i + self.frame_bytes]) for i in range(0, n, self.frame_bytes)]
+        del self._pending[:n]
+        return frames
+
+    def flush(self) -> bytes:
+        """Phần lẻ còn lại (ngắn hơn một frame, số mẫu chẵn)"""
+        n = len(self._pending) // cfg.BIT_DEPTH_BYTES * cfg.BIT_DEPTH_BYTES
+        tail = bytes(self._pending[:n])
+        self._pending.clear()
+        return tail
+
+
+def iter_reply_chunks(path: str, block_frames: int = 4096) -> Iterator[bytes]:
+    """
+    Đọc WAV trả lời theo block, chuyển về mono PCM 16-bit ở SAMPLE_RATE của thiết bị
+    (ZipVoice xuất 24 kHz) và cắt thành các chunk AUDIO_CHUNK_SIZE byte.
+    """
+    src_sr = sf.info(path).samplerate
+    resampler = StreamingResampler(src_sr, cfg.SAMPLE_RATE) if src_sr != cfg.SAMPLE_RATE else None
+    pending = bytearray()
+    for block in sf.blocks(path, blocksize=block_frames, dtype="int16", always_2d=True):
+        samples = block[:, 0]
+        if resampler:
+            samples = resampler.process(samples)
+        pending += samples.tobytes()
+        while len(pending) >= cfg.AUDIO_CHUNK_SIZE:
+            yield bytes(pending[:cfg.AUDIO_CHUNK_SIZE])
+            del pending[:cfg.AUDIO_CHUNK_SIZE]
+    if resampler:
+        pending += resampler.flush(np.int16).tobytes()
+    for i in range(0, len(pending), cfg.AUDIO_CHUNK_SIZE):
+        yield bytes(pending[i:i + cfg.AUDIO_CHUNK_SIZE])
@@ -0,0 +1,239 @@
+"""
+Chạy nhiều gateway cho một trường: trạng thái phiên nằm trong session store dùng chung,
+thiết bị được gán cho node bằng consistent hashing, phiên được bàn giao an toàn khi node drain.
+- Node chỉ giữ phiên trong lúc thiết bị đang kết nối (có lease trong store, gia hạn theo
+  heartbeat); ngắt kết nối = ghi trạng thái lại, trả lease và bỏ khỏi bộ nhớ.
+- GET /route?device_id=... cho load balancer / bước cấu hình thiết bị biết node phụ trách.
+  Node khác vẫn phục vụ được thiết bị (trạng thái dùng chung), nhưng chỉ một node giữ lease.
+- POST /drain: ngừng nhận kết nối mới, chờ câu trả lời đang phát, ghi trạng thái, trả lease rồi
+  đóng kết nối (1012 Service Restart) để thiết bị kết nối lại vào node khác.
+Với SESSION_STORE = "memory" không có gì được nạp / ghi: một server như trước.
+"""
+import asyncio
+import bisect
+import hashlib
+import time
+from typing import Dict, List, Optional
+
+from settings import cluster_settings as cfg
+from modules.endpointing import forget_pause_stats, get_pause_stats
+from modules.log import get_logger
+from modules.session_store import SessionStore
+
+log = get_logger(__name__)
+
+
+class HashRing:
+    """Consistent hash: thêm / bớt một node chỉ chuyển ~1/N thiết bị sang node khác"""
+
+    def __init__(self, nodes: List[str] = (), vnodes: int = cfg.HASH_RING_VNODES):
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        self.set_nodes(nodes)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def set_nodes(self, nodes: List[str]):
+        points = sorted((self._hash(f"{node}#{i}"), node) for node in nodes for i in range(self.vnodes))
+        self._points = [point for point, _ in points]
+        self._owners = [node for _, node in points]
+
+    def node_for(self, key: str) -> Optional[str]:
+        if not self._points:
+            return None
+        index = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[index]
+
+
+def export_session(pipeline, device_id: str) -> Optional[dict]:
+    """Trạng thái một thiết bị để ghi vào store; None khi LLM chưa tải (chưa có gì để ghi)"""
+    llm = pipeline.llm_engine
+    if llm is None:
+        return None
+    return {
+        "messages": llm.history.get_history(device_id),
+        **llm.context.export(device_id),
+        "pauses": list(get_pause_stats(device_id).pauses),
+    }
+
+
+def restore_pauses(device_id: str, state: dict):
+    pauses = get_pause_stats(device_id).pauses
+    pauses.clear()
+    pauses.extend(state.get("pauses", []))
+
+
+def restore_history(pipeline, device_id: str, state: dict):
+    """Lịch sử hội thoại và tóm tắt; cần LLM đã tải"""
+    llm = pipeline.llm_engine
+    llm.history.restore(device_id, state.get("messages", []))
+    llm.context.restore(device_id, state)
+
+
+def drop_session(pipeline, device_id: str):
+    llm = pipeline.llm_engine
+    if llm is not None:
+        llm.history.clear(device_id)
+        llm.context.forget(device_id)
+    forget_pause_stats(device_id)
+
+
+class Cluster:
+    def __init__(self, store: SessionStore, pipeline, node_id: str = cfg.NODE_ID, node_url: str = cfg.NODE_URL):
+        self.store = store
+        self.pipeline = pipeline
+        self.node_id = node_id
+        self.node_url = node_url
+        self.draining = False
+        self.sessions: Dict[str, object] = {}  # device_id -> DeviceSession đang kết nối vào node này
+        self.nodes: Dict[str, dict] = {node_id: {"url": node_url, "draining": False}}
+        self.ring = HashRing([node_id])
+        self._heartbeat_task: Optional[asyncio.Task] = None
+        self._restores: Dict[str, asyncio.Task] = {}  # device_id -> nạp lịch sử đang chờ LLM tải xong
+
+    async def start(self):
+        await self.heartbeat()
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        """Tắt server: bàn giao các phiên còn kết nối trước khi process dừng"""
+        if self.sessions:
+            await self.drain()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+        self.store.close()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(cfg.NODE_HEARTBEAT_SECONDS)
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                log.warning("⚠️  Cluster heartbeat failed: %s", e)
+
+    async def heartbeat(self):
+        """Báo node còn sống, cập nhật vòng hash và gia hạn lease của các phiên đang kết nối"""
+        store = self.store
+        await asyncio.to_thread(store.heartbeat, self.node_id, self.node_url, self.draining)
+        self.nodes = await asyncio.to_thread(store.nodes)
+        self.ring.set_nodes([node for node, info in self.nodes.items() if not info["draining"]])
+        for device_id, session in list(self.sessions.items()):
+            if not await asyncio.to_thread(store.claim, device_id, self.node_id, cfg.SESSION_LEASE_SECONDS):
+                # Node khác đã nhận phiên (node này bị coi là chết một lúc): không được ghi nữa
+                log.warning("⚠️  Lost session lease for %s, closing connection", device_id)
+                self.sessions.pop(device_id, None)
+                drop_session(self.pipeline, device_id)
+                await self._close(session, 1012)
+
+    def route(self, device_id: str) -> dict:
+        node = self.ring.node_for(device_id)
+        return {"device_id": device_id, "node": node, "url": self.nodes.get(node, {}).get("url")}
+
+    async def attach(self, session) -> bool:
+        """
+        Nhận phiên của thiết bị: lấy lease rồi nạp trạng thái từ store.
+        False = một node khác còn sống đang giữ phiên (đang phục vụ hoặc đang bàn giao).
+        Không chờ LLM: khi LLM chưa tải xong, lịch sử được nạp trong nền ngay khi LLM sẵn sàng
+        (trước mọi lượt của thiết bị, vì lượt nào cũng phải chờ LLM sau task này).
+        """
+        store, device_id = self.store, session.device_id
+        claimed = await asyncio.to_thread(store.claim, device_id, self.node_id, cfg.SESSION_LEASE_SECONDS)
+        if not claimed:
+            owner = await asyncio.to_thread(store.owner, device_id)
+            if owner in self.nodes:
+                return False
+            # Node giữ lease đã ngừng heartbeat: nhận luôn, không chờ lease hết hạn
+            log.warning("⚠️  Taking over session %s from dead node %s", device_id, owner)
+            await asyncio.to_thread(store.claim, device_id, self.node_id, cfg.SESSION_LEASE_SECONDS, True)
+        self.sessions[device_id] = session
+        if not store.shared:
+            return True
+        state = await asyncio.to_thread(store.load, device_id)
+        if state:
+            restore_pauses(device_id, state)
+            if self.pipeline.llm_engine is not None:
+                restore_history(self.pipeline, device_id, state)
+            else:
+                self._restores[device_id] = asyncio.create_task(self._restore_when_ready(device_id, state))
+        return True
+
+    async def _restore_when_ready(self, device_id: str, state: dict):
+        try:
+            await self.pipeline.wait_ready("llm")
+            restore_history(self.pipeline, device_id, state)
+        except RuntimeError:
+            pass  # LLM lỗi: không có gì để nạp
+        finally:
+            self._restores.pop(device_id, None)
+
+    async def save(self, device_id: str) -> bool:
+        if not self.store.shared or self.sessions.get(device_id) is None:
+            return True
+        state = export_session(self.pipeline, device_id)
+        if state is None:
+            return True
+        saved = await asyncio.to_thread(
+            self.store.save, device_id, state, self.node_id, cfg.SESSION_LEASE_SECONDS
+        )
+        if not saved:
+            log.warning("⚠️  Session %s is owned by another node, state not saved", device_id)
+        return saved
+
+    async def detach(self, session):
+        """Thiết bị ngắt kết nối: ghi trạng thái, trả lease, bỏ khỏi bộ nhớ của node"""
+        device_id = session.device_id
+        if self.sessions.get(device_id) is not session:
+            return  # Đã được bàn giao, hoặc thiết bị đã kết nối lại bằng một kết nối mới
+        restore = self._restores.pop(device_id, None)
+        if restore is not None:
+            restore.cancel()
+        try:
+            if restore is None:
+                # Lịch sử chưa kịp nạp thì bản trong store vẫn là bản mới nhất: không ghi đè
+                await self.save(device_id)
+        finally:
+            del self.sessions[device_id]
+            await asyncio.to_thread(self.store.release, device_id, self.node_id)
+            if self.store.shared:
+                drop_session(self.pipeline, device_id)
+
+    @staticmethod
+    async def _close(session, code: int):
+        try:
+            await session.websocket.close(code=code)
+        except Exception:
+            pass  # Kết nối đã đóng
+
+    async def _hand_off(self, session, deadline: float):
+        # Không cắt ngang câu trả lời đang phát: lịch sử của lượt đó phải được ghi trước khi bàn giao
+        while session.is_responding and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        await self._close(session, 1012)
+        if session.is_responding:
+            session.response_task.cancel()
+        await self.detach(session)
+
+    async def drain(self) -> int:
+        """Ngừng nhận kết nối mới và bàn giao mọi phiên đang kết nối; trả về số phiên đã bàn giao"""
+        self.draining = True
+        try:
+            await self.heartbeat()  # Các node khác bỏ node này khỏi vòng hash ngay
+        except Exception as e:
+            log.warning("⚠️  Cluster heartbeat failed: %s", e)
+        sessions = list(self.sessions.values())
+        deadline = time.monotonic() + cfg.DRAIN_TIMEOUT_SECONDS
+        await asyncio.gather(*(self._hand_off(session, deadline) for session in sessions))
+        log.info("==> Drained %d session(s) from node %s", len(sessions), self.node_id)
+        return len(sessions)
+
+    def stats(self) -> dict:
+        return {
+            "node": self.node_id,
+            "store": self.store.name,
+            "draining": self.draining,
+            "sessions": len(self.sessions),
+            "nodes": self.nodes,
+        }
@@ -0,0 +1,240 @@
+"""
+QoS cho pipeline dùng chung: một bảng mạch bị kẹt hay một bạn hỏi liên tục không được chiếm hết
+STT / LLM / TTS của cả lớp.
+- Token bucket theo thiết bị và theo lớp: số câu nói mỗi phút và số token LLM mỗi phút
+  (token được trừ sau mỗi lượt, có thể âm = phải chờ hồi lại). Câu nói chờ quá lâu rồi bị từ
+  chối được hoàn lại hạn mức; bucket đã hồi đầy và lâu không dùng bị bỏ.
+- Tối đa QOS_MAX_CONCURRENT lượt chạy pipeline cùng lúc; lượt chờ được phục vụ theo lớp ưu tiên
+  (giáo viên trước), cùng lớp thì theo thứ tự đến.
+- Lượt vượt hạn mức chỉ chạy khi còn chỗ ngay; không thì nhận câu "đợi chút" đã tổng hợp sẵn.
+  Lượt trong hạn mức chờ tối đa QOS_MAX_WAIT_SECONDS rồi cũng nhận câu đó.
+- Bậc giảm tải cuối cùng (modules.degradation, "canned"): mọi lượt ngoài QOS_UNLIMITED_CLASSES
+  nhận câu đó ngay, không chiếm chỗ trong pipeline.
+"""
+import asyncio
+import hashlib
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from settings import server_settings as cfg
+from modules import metrics
+from modules.degradation import degradation
+from modules.log import get_logger
+
+log = get_logger(__name__)
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.used = self.updated  # Lần trừ / hoàn gần nhất
+
+    def available(self) -> float:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def charge(self, amount: float):
+        self.available()
+        self.tokens -= amount
+        self.used = self.updated
+
+    def refund(self, amount: float):
+        self.available()
+        self.tokens = min(self.capacity, self.tokens + amount)
+        self.used = self.updated
+
+    def idle(self, seconds: float) -> bool:
+        """Đã hồi đầy và không được dùng trong `seconds` giây: bỏ đi cũng như tạo lại"""
+        return self.available() >= self.capacity and self.updated - self.used > seconds
+
+
+class Admission:
+    """Tối đa `slots` lượt cùng lúc; lượt chờ được xếp theo (hạng ưu tiên, thứ tự đến)"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self.active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(not future.done() for _, _, future in self._waiters)
+
+    def try_acquire(self) -> bool:
+        if self.active < self.slots and not self.waiting:
+            self.active += 1
+            return True
+        return False
+
+    async def acquire(self, rank: int, timeout: float) -> bool:
+        if self.try_acquire():
+            return True
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (rank, next(self._seq), future))
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                self.release()  # Chỗ đã được chuyển cho lượt này đúng lúc hết giờ / bị huỷ
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            return False
+
+    def release(self):
+        # Chuyển chỗ thẳng cho lượt đang chờ có ưu tiên cao nhất
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self.active -= 1
+
+
+class QoS:
+    def __init__(self):
+        self.ranks = {name: rank for rank, name in enumerate(cfg.PRIORITY_CLASSES)}
+        self.admission = Admission(cfg.QOS_MAX_CONCURRENT)
+        self._utterances: Dict[str, TokenBucket] = {}
+        self._tokens: Dict[str, TokenBucket] = {}
+        self._pruned_at = time.monotonic()
+        self._busy_lock: Optional[asyncio.Lock] = None
+        self.counts: Counter = Counter()
+
+    def priority(self, name: Optional[str]) -> str:
+        name = (name or cfg.DEFAULT_PRIORITY).lower()
+        if name not in self.ranks:
+            raise ValueError(f"Unknown priority '{name}', choose one of: {', '.join(self.ranks)}")
+        return name
+
+    def _buckets(self, device_id: str, classroom: str):
+        utterances = [
+            ("device_utterances", self._utterances.setdefault(
+                f"device:{device_id}", TokenBucket(cfg.DEVICE_UTTERANCES_PER_MINUTE, cfg.DEVICE_UTTERANCE_BURST))),
+            ("classroom_utterances", self._utterances.setdefault(
+                f"classroom:{classroom}", TokenBucket(cfg.CLASSROOM_UTTERANCES_PER_MINUTE, cfg.CLASSROOM_UTTERANCE_BURST))),
+        ]
+        tokens = [
+            ("device_tokens", self._tokens.setdefault(
+                f"device:{device_id}", TokenBucket(cfg.DEVICE_LLM_TOKENS_PER_MINUTE, cfg.DEVICE_LLM_TOKENS_PER_MINUTE))),
+            ("classroom_tokens", self._tokens.setdefault(
+                f"classroom:{classroom}", TokenBucket(cfg.CLASSROOM_LLM_TOKENS_PER_MINUTE, cfg.CLASSROOM_LLM_TOKENS_PER_MINUTE))),
+        ]
+        return utterances, tokens
+
+    def over_limit(self, device_id: str, classroom: str, priority: str) -> Optional[str]:
+        """Tên hạn mức bị vượt, hoặc None (khi đó một câu nói được trừ vào hạn mức)"""
+        if priority in cfg.QOS_UNLIMITED_CLASSES:
+            return None
+        utterances, tokens = self._buckets(device_id, classroom)
+        for name, bucket in tokens:
+            if bucket.available() <= 0:
+                return name
+        for name, bucket in utterances:
+            if bucket.available() < 1:
+                return name
+        for _, bucket in utterances:
+            bucket.charge(1)
+        return None
+
+    def refund(self, device_id: str, classroom: str):
+        """Trả lại câu nói đã trừ trong over_limit (lượt không được chạy)"""
+        for _, bucket in self._buckets(device_id, classroom)[0]:
+            bucket.refund(1)
+
+    def prune(self):
+        """Bỏ các bucket đã hồi đầy và lâu không dùng (thiết bị / lớp không còn hỏi)"""
+        now = time.monotonic()
+        if now - self._pruned_at < cfg.QOS_BUCKET_IDLE_SECONDS / 10:
+            return
+        self._pruned_at = now
+        for buckets in (self._utterances, self._tokens):
+            for key in [key for key, bucket in buckets.items() if bucket.idle(cfg.QOS_BUCKET_IDLE_SECONDS)]:
+                del buckets[key]
+
+    def charge_tokens(self, device_id: str, classroom: str, priority: str, tokens: int):
+        if not cfg.QOS_ENABLED or priority in cfg.QOS_UNLIMITED_CLASSES or tokens <= 0:
+            return
+        for _, bucket in self._buckets(device_id, classroom)[1]:
+            bucket.charge(tokens)
+
+    @asynccontextmanager
+    async def turn(self, device_id: str, classroom: str, priority: str):
+        """
+        Bao quanh một lượt chạy pipeline. Trả về None nếu được chạy, hoặc lý do phải trả câu
+        "đợi chút" (tên hạn mức bị vượt, "saturated" khi chờ quá lâu, "degraded" ở bậc giảm tải cuối).
+        """
+        if degradation.tier.canned and priority not in cfg.QOS_UNLIMITED_CLASSES:
+            self.counts["degraded"] += 1
+            metrics.tag("qos", "degraded")
+            yield "degraded"
+            return
+        if not cfg.QOS_ENABLED:
+            yield None
+            return
+        self.prune()
+        limit = self.over_limit(device_id, classroom, priority)
+        if limit is not None:
+            # Vượt hạn mức: không được xếp hàng, chỉ chạy khi pipeline đang rảnh
+            admitted = self.admission.try_acquire()
+            reason = None if admitted else limit
+        else:
+            with metrics.span("qos_wait"):
+                admitted = await self.admission.acquire(self.ranks[priority], cfg.QOS_MAX_WAIT_SECONDS)
+            reason = None if admitted else "saturated"
+            if not admitted and priority not in cfg.QOS_UNLIMITED_CLASSES:
+                self.refund(device_id, classroom)  # Trẻ không được trả lời: không tính vào hạn mức
+        self.counts[reason or ("admitted_over_limit" if limit else "admitted")] += 1
+        if reason is not None:
+            metrics.tag("qos", reason)
+            log.info("⏳ Busy reply (%s), priority=%s classroom=%s", reason, priority, classroom)
+        try:
+            yield reason
+        finally:
+            if admitted:
+                self.admission.release()
+
+    def busy_reply_path(self) -> Path:
+        digest = hashlib.sha1(cfg.QOS_BUSY_REPLY.encode("utf-8")).hexdigest()[:8]
+        return Path(cfg.REPLY_CACHE_DIR) / f"busy_{digest}.wav"
+
+    async def busy_reply(self, pipeline) -> Path:
+        """WAV của câu "đợi chút": tổng hợp một lần rồi dùng lại (tên file theo nội dung câu)"""
+        path = self.busy_reply_path()
+        if path.exists():
+            return path
+        if self._busy_lock is None:
+            self._busy_lock = asyncio.Lock()
+        async with self._busy_lock:
+            if not path.exists():
+                await pipeline.wait_ready("tts")
+                tmp = path.with_name(f"{path.stem}.tmp.wav")
+                await pipeline.tts_engine.synthesize_async(cfg.QOS_BUSY_REPLY, output_path=tmp)
+                os.replace(tmp, path)
+                log.info("✅ Busy reply cached at %s", path)
+        return path
+
+    def stats(self) -> dict:
+        return {
+            "enabled": cfg.QOS_ENABLED,
+            "active": self.admission.active,
+            "waiting": self.admission.waiting,
+            "slots": self.admission.slots,
+            "turns": dict(self.counts),
+            "devices": sum(key.startswith("device:") for key in self._utterances),
+        }
+
+
+qos = QoS()
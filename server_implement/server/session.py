@@ -0,0 +1,302 @@
+"""
+Một kết nối thiết bị: nhận audio (text + binary), đưa qua front-end rồi cho chiến lược
+endpointing quyết định; chạy pipeline cho câu nói và stream audio trả lời về thiết bị.
+"""
+import asyncio
+import os
+import re
+import time
+import uuid
+from typing import Optional
+
+from fastapi import WebSocket, WebSocketDisconnect
+
+from settings import server_settings as cfg
+from modules.context import estimate_tokens
+from modules.degradation import degradation
+from modules.frontend import AudioFrontEnd
+from modules.log import get_logger
+from modules.metrics import metrics, start_trace
+from modules.speculation import SpeculativeRun
+from modules.vad import EnergyGate
+from .archive import archiver
+from .audio import FrameAssembler, iter_reply_chunks
+from .qos import qos
+
+log = get_logger(__name__)
+
+_UNSAFE_CHARS_RE = re.compile(r"[^\w.-]+")
+
+
+class ConnectionStats:
+    """Đếm frame của mọi kết nối, để biết một thiết bị đang im lặng tốn bao nhiêu CPU (trên /metrics)"""
+
+    def __init__(self):
+        self.open = 0
+        self.paused = 0
+        self.frames = 0
+        self.gated = 0
+        self.heartbeats = 0
+        # CPU của event loop cho từng frame: front-end (lọc, khử nhiễu, AGC) và VAD/KWS + endpointing
+        self.frontend_cpu = 0.0
+        self.endpointing_cpu = 0.0
+
+    def snapshot(self) -> dict:
+        return {
+            "open": self.open,
+            "paused": self.paused,
+            "frames": self.frames,
+            "gated_frames": self.gated,
+            "gated_ratio": round(self.gated / self.frames, 4) if self.frames else None,
+            "heartbeats": self.heartbeats,
+            "frontend_cpu_seconds": round(self.frontend_cpu, 3),
+            "endpointing_cpu_seconds": round(self.endpointing_cpu, 3),
+            # CPU của cả process; benchmark.idle lấy hiệu hai lần đọc chia cho số kết nối
+            "process_cpu_seconds": round(time.process_time(), 3),
+        }
+
+
+connection_stats = ConnectionStats()
+
+
+class DeviceSession:
+    """Trạng thái dùng chung của một kết nối; phần quyết định câu nói nằm ở Endpointing"""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        pipeline,
+        vad_model=None,
+        kws_model=None,
+        cluster=None,
+        priority: str = cfg.DEFAULT_PRIORITY,
+    ):
+        self.websocket = websocket
+        self.pipeline = pipeline
+        self.cluster = cluster  # server.cluster.Cluster: ghi trạng thái phiên vào session store sau mỗi lượt
+        self.device_id = websocket.query_params.get("device_id") or websocket.client.host
+        self.classroom = websocket.query_params.get("classroom") or cfg.DEFAULT_CLASSROOM
+        self.priority = priority  # Lớp ưu tiên trong server.qos (đã kiểm tra hợp lệ)
+        self.log_extra = {"device_id": self.device_id}  # extra= cho log của kết nối (ngoài trace của một lượt)
+        # Mỗi kết nối một file (id() có thể bị dùng lại sau GC), xoá khi kết nối đóng
+        self.reply_audio_path = os.path.join(
+            cfg.REPLY_CACHE_DIR, f"reply_{_UNSAFE_CHARS_RE.sub('_', self.device_id)}_{uuid.uuid4().hex[:8]}.wav"
+        )
+        self.vad = vad_model.new_stream() if vad_model is not None else None
+        self.kws = kws_model.new_stream() if kws_model is not None else None
+        self.frontend = (
+            AudioFrontEnd(denoise=cfg.FRONTEND_DENOISE, agc=cfg.FRONTEND_AGC) if cfg.FRONTEND_ENABLED else None
+        )
+        self.assembler = FrameAssembler(cfg.VAD_CHUNK_SIZE)
+        self.gate = EnergyGate(
+            cfg.ENERGY_GATE_FLOOR_DBFS,
+            cfg.ENERGY_GATE_MARGIN_DB,
+            cfg.ENERGY_GATE_NOISE_RISE_DB,
+            cfg.ENERGY_GATE_HANGOVER_FRAMES,
+        ) if cfg.ENERGY_GATE_ENABLED else None
+        self.paused = False  # Thiết bị đã gửi PAUSE: không có audio, chỉ có HEARTBEAT
+        self.response_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_responding(self) -> bool:
+        return self.response_task is not None and not self.response_task.done()
+
+    async def _send_text(self, text: str) -> bool:
+        """False nếu thiết bị đã ngắt kết nối (không để thành exception của task không ai chờ)"""
+        try:
+            await self.websocket.send_text(text)
+            return True
+        except (WebSocketDisconnect, RuntimeError):
+            return False
+
+    def start_response(
+        self,
+        audio_data: bytes,
+        speculation: Optional[SpeculativeRun] = None,
+        eos_wait_seconds: float = 0.0,
+    ):
+        self.response_task = asyncio.create_task(self.respond(audio_data, speculation, eos_wait_seconds))
+
+    async def _answer(self, audio_data: bytes, speculation: Optional[SpeculativeRun], trace) -> dict:
+        pipeline, device_id = self.pipeline, self.device_id
+        if speculation is not None:
+            try:
+                input_text, response_text = await speculation.commit()
+            except Exception as e:
+                log.warning("Speculative run failed, running full pipeline: %s", e)
+            else:
+                if response_text is not None:
+                    trace.spans.update(speculation.trace.spans)
+                    for key, value in speculation.trace.tags.items():
+                        trace.tags.setdefault(key, value)
+                    trace.tags["speculative"] = True
+                    return await pipeline.finish_async(
+                        input_text,
+                        response_text,
+                        audio_output_path=self.reply_audio_path,
+                        session_id=device_id,
+                    )
+        # STT đọc PCM trong bộ nhớ; file lưu trữ được ghi sau, ngoài đường găng
+        return await pipeline.process_pcm_async(
+            audio_data,
+            audio_output_path=self.reply_audio_path,
+            session_id=device_id,
+        )
+
+    async def respond(
+        self,
+        audio_data: bytes,
+        speculation: Optional[SpeculativeRun] = None,
+        eos_wait_seconds: float = 0.0,
+    ):
+        """Chạy pipeline cho một câu nói và stream audio trả lời về client."""
+        websocket, pipeline, device_id = self.websocket, self.pipeline, self.device_id
+        trace = start_trace(device_id, session_id=device_id)
+        trace.record("vad_eos", eos_wait_seconds)
+        trace.mark("eos")
+        if degradation.tier.level:
+            trace.tags["degradation"] = degradation.tier.name
+        if not await self._send_text("PROCESSING_START"):
+            if speculation is not None:
+                speculation.abort()  # Client đã ngắt: kết quả suy đoán không còn ai dùng
+            return
+        result = None
+        try:
+            async with qos.turn(device_id, self.classroom, self.priority) as refused:
+                if refused:
+                    # Vượt hạn mức / pipeline quá tải: câu "đợi chút" đã tổng hợp sẵn, không chạy pipeline
+                    if speculation is not None:
+                        speculation.abort()
+                    output_audio_path = await qos.busy_reply(pipeline)
+                else:
+                    result = await self._answer(audio_data, speculation, trace)
+                    output_audio_path = result.get("output_audio")
+                if output_audio_path and os.path.exists(output_audio_path):
+                    with trace.span("downlink"):
+                        first_chunk = True
+                        for chunk in iter_reply_chunks(output_audio_path):
+                            await websocket.send_bytes(chunk)
+                            if first_chunk:
+                                first_chunk = False
+                                tts_ttfa = trace.since("tts_start")
+                                if tts_ttfa is not None:
+                                    trace.record("tts_ttfa", tts_ttfa)
+                                trace.record("e2e_first_audio", trace.since("eos"))
+                else:
+                    log.warning("Pipeline did not return a valid audio output path.")
+        except Exception as e:
+            log.error("An error occurred during pipeline processing: %s", e, exc_info=True)
+            trace.tags["error"] = str(e)
+        # CancelledError không bị bắt ở trên: khi bị ngắt lời, TTS_END không được gửi
+        # và trace của lượt bị huỷ không được đưa vào histogram.
+        await self._send_text("TTS_END")
+        metrics.finish(trace)
+        if result is not None:
+            # Token thật sự dùng của lượt: prompt (ngữ cảnh + RAG + câu hỏi) và câu trả lời
+            tokens = trace.tags.get("llm_input_tokens", 0) + estimate_tokens(result.get("response_text") or "")
+            qos.charge_tokens(device_id, self.classroom, self.priority, tokens)
+        failed = "qos" not in trace.tags and bool(
+            trace.tags.get("error") or trace.tags.get("llm_fallback") or not (result or {}).get("input_text")
+        )
+        archiver.submit(device_id, audio_data, failed=failed)
+        log.debug("Finished streaming response.")
+        if self.cluster is not None:
+            try:
+                await self.cluster.save(device_id)
+            except Exception as e:
+                log.warning("⚠️  Failed to save session state: %s", e, extra=self.log_extra)
+
+    async def cancel_response(self):
+        """Huỷ câu trả lời đang xử lý/phát (barge-in) và báo client dừng loa."""
+        if not self.is_responding:
+            return
+        self.response_task.cancel()
+        try:
+            await self.response_task
+        except asyncio.CancelledError:
+            pass
+        await self._send_text("TTS_ABORT")
+
+    async def _feed(self, endpointing, data: bytes, frames=None):
+        for frame in frames if frames is not None else self.assembler.push(data):
+            connection_stats.frames += 1
+            if self.is_responding and not endpointing.listens_while_responding:
+                continue
+            if self.gate is not None and endpointing.idle and self.gate.is_silence(frame):
+                # Không có câu nói nào đang diễn ra và frame im lặng rõ ràng: không cần front-end / VAD
+                connection_stats.gated += 1
+                endpointing.on_gated(frame)
+                continue
+            start = time.thread_time()
+            if self.frontend:
+                frame = self.frontend(frame)
+                now = time.thread_time()
+                connection_stats.frontend_cpu += now - start
+                start = now
+            await endpointing.on_frame(frame)
+            connection_stats.endpointing_cpu += time.thread_time() - start
+
+    async def _flush(self, endpointing):
+        """Thiết bị ngừng gửi: phần audio còn lại là trọn vẹn"""
+        tail = self.assembler.flush()
+        if tail:
+            await self._feed(endpointing, tail, frames=[tail])
+        await endpointing.on_gap()
+
+    def _set_paused(self, paused: bool):
+        if paused != self.paused:
+            self.paused = paused
+            connection_stats.paused += 1 if paused else -1
+
+    async def run(self, endpointing):
+        """Vòng nhận của kết nối; endpointing là một chiến lược trong server.strategies"""
+        websocket = self.websocket
+        connection_stats.open += 1
+        try:
+            while True:
+                timeout = cfg.HEARTBEAT_TIMEOUT_SECONDS if self.paused else endpointing.receive_timeout
+                if timeout:
+                    try:
+                        message = await asyncio.wait_for(websocket.receive(), timeout)
+                    except asyncio.TimeoutError:
+                        if self.paused:
+                            log.info("Client sent no heartbeat for %ss, closing.", timeout, extra=self.log_extra)
+                            await websocket.close(code=1001)
+                            break
+                        await self._flush(endpointing)
+                        continue
+                else:
+                    message = await websocket.receive()
+
+                if message["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(message.get("code", 1000))
+                if message.get("bytes") is not None:
+                    self._set_paused(False)  # Có audio = đã nói tiếp, kể cả khi RESUME bị mất
+                    await self._feed(endpointing, message["bytes"])
+                elif message.get("text") is not None:
+                    text = message["text"].strip()
+                    if text == cfg.HEARTBEAT_MESSAGE:
+                        connection_stats.heartbeats += 1
+                    elif text == cfg.PAUSE_MESSAGE:
+                        self._set_paused(True)
+                        await self._flush(endpointing)
+                    elif text == cfg.RESUME_MESSAGE:
+                        self._set_paused(False)
+                    else:
+                        await endpointing.on_text(message["text"])
+
+        except WebSocketDisconnect:
+            log.info("Client %s disconnected.", websocket.client.host, extra=self.log_extra)
+        except Exception:
+            log.exception("A critical error occurred in websocket connection", extra=self.log_extra)
+        finally:
+            connection_stats.open -= 1
+            self._set_paused(False)
+            endpointing.close()
+            if self.is_responding:
+                self.response_task.cancel()
+                await asyncio.wait({self.response_task})  # TTS (subprocess) đã bị kill trước khi xoá file
+            try:
+                os.remove(self.reply_audio_path)
+            except FileNotFoundError:
+                pass
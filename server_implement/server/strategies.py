@@ -0,0 +1,268 @@
+"""
+Endpointing strategies
+Mỗi kết nối có một chiến lược quyết định câu nói bắt đầu / kết thúc khi nào:
+- TimeoutEndpointing: thiết bị tự gate audio (AFE VAD trên ESP32); ngừng nhận AUDIO_TIMEOUT giây = hết câu
+- VADEndpointing: Silero VAD trên server, adaptive endpointing, chạy suy đoán, barge-in
+- WakeWordEndpointing: như VAD nhưng chỉ nghe một câu sau mỗi lần có wake word
+  (keyword spotting trên server, hoặc thiết bị gửi "WAKE")
+Chiến lược chỉ nhận frame đã qua front-end; phần ingest / trả lời nằm ở DeviceSession.
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Dict, List, Optional, Type
+
+from settings import server_settings as cfg
+from modules.endpointing import AdaptiveEndpointer, get_pause_stats
+from modules.log import get_logger
+from modules.speculation import SpeculativeRun
+
+log = get_logger(__name__)
+
+
+class Endpointing:
+    name = "base"
+    needs_vad = False
+    needs_kws = False
+    receive_timeout: Optional[float] = None  # Có giá trị thì on_gap() được gọi khi ngừng nhận audio
+    listens_while_responding = False  # False: frame đến khi đang trả lời bị bỏ qua trước front-end
+
+    def __init__(self, session):
+        self.session = session
+
+    @property
+    def idle(self) -> bool:
+        """True: không có câu nói nào đang thu, frame im lặng có thể bỏ qua front-end và VAD"""
+        return False
+
+    async def on_frame(self, frame: bytes):
+        raise NotImplementedError
+
+    def on_gated(self, frame: bytes):
+        """Frame energy gate coi là im lặng chắc chắn (chỉ khi idle), thay cho on_frame()"""
+        pass
+
+    async def on_gap(self):
+        pass
+
+    async def on_text(self, text: str):
+        pass
+
+    def close(self):
+        pass
+
+
+class TimeoutEndpointing(Endpointing):
+    """Hành vi của test_wake_net/main.py: gom mọi gói nhận được, khoảng lặng trên đường truyền = hết câu"""
+
+    name = "timeout"
+    receive_timeout = cfg.AUDIO_TIMEOUT
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.chunks: List[bytes] = []
+
+    async def on_frame(self, frame: bytes):
+        self.chunks.append(frame)
+
+    async def on_gap(self):
+        if not self.chunks:
+            return
+        log.info("==> Audio stream paused. End of utterance.", extra=self.session.log_extra)
+        self.session.start_response(b"".join(self.chunks), eos_wait_seconds=cfg.AUDIO_TIMEOUT)
+        self.chunks = []
+
+
+class VADEndpointing(Endpointing):
+    """Silero VAD theo từng frame 30ms; hành vi của vad_server.py"""
+
+    name = "vad"
+    needs_vad = True
+    listens_while_responding = cfg.BARGE_IN_ENABLED
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.is_speaking = False
+        self.silence_counter = 0
+        self.speech_trigger_counter = 0
+        self.partial_task: Optional[asyncio.Task] = None
+        self.speculation: Optional[SpeculativeRun] = None
+        self.pre_buffer = deque(maxlen=cfg.VAD_BUFFER_FRAMES + cfg.BARGE_IN_TRIGGER_FRAMES)
+        self.speech_buffer: List[bytes] = []
+        if cfg.ENDPOINT_ADAPTIVE:
+            self.endpointer = AdaptiveEndpointer(
+                get_pause_stats(session.device_id),
+                default_frames=cfg.VAD_SILENCE_FRAMES_END,
+                min_frames=cfg.ENDPOINT_MIN_SILENCE_FRAMES,
+                max_frames=cfg.ENDPOINT_MAX_SILENCE_FRAMES,
+            )
+        else:
+            self.endpointer = None
+
+    async def partial_transcript(self, audio_data: bytes, partial_id: int):
+        """Decode tạm thời phần câu nói đã thu để endpointer biết câu đã trọn ý chưa."""
+        try:
+            text = await self.session.pipeline.transcribe_pcm_async(audio_data)
+        except Exception as e:
+            log.warning("Partial transcription failed: %s", e, extra=self.session.log_extra)
+            return
+        self.endpointer.set_partial_transcript(text, partial_id)
+
+    @property
+    def idle(self) -> bool:
+        return not self.is_speaking
+
+    def on_gated(self, frame: bytes):
+        # Giống một frame VAD cho là im lặng khi chưa có câu nói
+        self.speech_trigger_counter = 0
+        self.pre_buffer.append(frame)
+        if self.endpointer:
+            self.endpointer.on_idle()
+
+    def discard_speculation(self):
+        if self.speculation is not None:
+            self.speculation.discard()
+            self.speculation = None
+
+    def start_utterance(self):
+        log.info("==> Voice activity detected. Start recording.", extra=self.session.log_extra)
+        self.is_speaking = True
+        self.speech_buffer.extend(self.pre_buffer)
+        self.pre_buffer.clear()
+        if self.endpointer:
+            self.endpointer.start()
+
+    def end_utterance(self):
+        log.info("==> Silence detected after %d frames. End of utterance.", self.silence_counter, extra=self.session.log_extra)
+        if self.endpointer:
+            self.endpointer.end()
+        self.session.start_response(
+            b"".join(self.speech_buffer),
+            self.speculation,
+            eos_wait_seconds=self.silence_counter * cfg.VAD_FRAME_MS / 1000,
+        )
+        self.speculation = None
+        self.is_speaking = False
+        self.silence_counter = 0
+        self.speech_buffer.clear()
+        self.pre_buffer.clear()
+
+    async def on_frame(self, frame: bytes):
+        session = self.session
+        endpointer = self.endpointer
+        is_processing = session.is_responding
+        speech_prob = session.vad(frame)
+
+        # Khi đang phát trả lời, micro nghe cả tiếng loa nên cần ngưỡng chặt hơn
+        threshold = cfg.BARGE_IN_SPEECH_THRESHOLD if is_processing else cfg.VAD_SPEECH_THRESHOLD
+        if speech_prob > threshold:
+            self.silence_counter = 0
+            if not self.is_speaking:
+                self.pre_buffer.append(frame)
+                self.speech_trigger_counter += 1
+                trigger_frames = cfg.BARGE_IN_TRIGGER_FRAMES if is_processing else cfg.VAD_SILENCE_FRAMES_TRIGGER
+                if self.speech_trigger_counter >= trigger_frames:
+                    if is_processing:
+                        log.info("==> Barge-in detected. Cancelling current response.", extra=self.session.log_extra)
+                        await session.cancel_response()
+                    self.start_utterance()
+            else:
+                self.speech_buffer.append(frame)
+                if endpointer:
+                    endpointer.on_speech()
+                # Trẻ nói tiếp: kết quả suy đoán không còn đúng
+                self.discard_speculation()
+        else:
+            self.speech_trigger_counter = 0
+            if self.is_speaking:
+                self.silence_counter += 1
+                self.speech_buffer.append(frame)
+                if self.silence_counter == cfg.ENDPOINT_PARTIAL_STT_FRAMES:
+                    audio_so_far = b"".join(self.speech_buffer)
+                    if cfg.SPECULATIVE_ENABLED:
+                        on_transcript = None
+                        if endpointer:
+                            partial_id = endpointer.begin_partial()
+                            on_transcript = lambda text, pid=partial_id: endpointer.set_partial_transcript(text, pid)
+                        self.speculation = SpeculativeRun(
+                            session.pipeline, audio_so_far, session_id=session.device_id, on_transcript=on_transcript
+                        )
+                    elif endpointer:
+                        self.partial_task = asyncio.create_task(self.partial_transcript(
+                            audio_so_far, endpointer.begin_partial()
+                        ))
+                if endpointer:
+                    end_of_utterance = endpointer.on_silence(speech_prob)
+                else:
+                    end_of_utterance = self.silence_counter >= cfg.VAD_SILENCE_FRAMES_END
+                if end_of_utterance:
+                    self.end_utterance()
+            else:
+                self.pre_buffer.append(frame)
+                if endpointer:
+                    endpointer.on_idle()
+
+    def close(self):
+        self.discard_speculation()
+
+
+class WakeWordEndpointing(VADEndpointing):
+    """
+    Chỉ chạy VAD/STT trong WAKE_LISTEN_SECONDS sau wake word, mỗi wake word một câu hỏi.
+    Ngoài cửa sổ đó frame chỉ đi qua keyword spotter (nếu có), không tốn VAD/STT/LLM cho
+    tiếng ồn trong lớp. Wake word khi đang trả lời = ngắt lời.
+    """
+
+    name = "wakeword"
+    needs_kws = True
+    listens_while_responding = False
+
+    def __init__(self, session):
+        super().__init__(session)
+        self.listen_until = 0.0
+        # Có KWS phía server thì vẫn phải nghe khi đang trả lời để bắt wake word ngắt lời
+        self.listens_while_responding = session.kws is not None
+
+    @property
+    def listening(self) -> bool:
+        return self.is_speaking or time.monotonic() < self.listen_until
+
+    async def wake(self):
+        log.info("==> Wake word. Listening for a question.", extra=self.session.log_extra)
+        if self.session.is_responding:
+            await self.session.cancel_response()
+        self.listen_until = time.monotonic() + cfg.WAKE_LISTEN_SECONDS
+
+    async def on_text(self, text: str):
+        if text.strip() == cfg.WAKE_MESSAGE:
+            await self.wake()
+
+    def on_gated(self, frame: bytes):
+        # Chưa có wake word: im lặng thì cũng không cần chạy KWS
+        if self.listening:
+            super().on_gated(frame)
+
+    async def on_frame(self, frame: bytes):
+        if not self.listening:
+            if self.session.kws is not None and self.session.kws(frame):
+                await self.wake()
+            return
+        await super().on_frame(frame)
+
+    def end_utterance(self):
+        super().end_utterance()
+        self.listen_until = 0.0
+
+
+STRATEGIES: Dict[str, Type[Endpointing]] = {
+    TimeoutEndpointing.name: TimeoutEndpointing,
+    VADEndpointing.name: VADEndpointing,
+    WakeWordEndpointing.name: WakeWordEndpointing,
+}
+
+
+def get_strategy(name: str = None) -> Type[Endpointing]:
+    name = (name or cfg.ENDPOINTING).lower()
+    if name not in STRATEGIES:
+        raise ValueError(f"Unknown endpointing '{name}', choose one of: {', '.join(STRATEGIES)}")
+    return STRATEGIES[name]
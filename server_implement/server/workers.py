@@ -0,0 +1,259 @@
+"""
+Triển khai nhiều process: process chính giữ websocket, VAD, KWS, LLM, TTS; STT chạy trong
+các process con. Chạy từ thư mục server_implement:
+    python -m server.workers --host 0.0.0.0 --port 8000 [--processes 4]
+
+Khác với uvicorn --workers (mỗi worker một bản Zipformer, ZipVoice, chỉ mục RAG và không gắn
+được thiết bị với worker giữ phiên của nó):
+- STT được tải MỘT lần trong process chính rồi mới fork, các process STT dùng chung trọng số
+  qua copy-on-write (trọng số nằm trong heap C++ của ONNX Runtime, không bị ghi nên không bị chép).
+- Mọi kết nối vẫn ở process chính: lịch sử hội thoại, chỉ mục RAG và prompt cache chỉ có một bản.
+  TTS (ZipVoice) vốn đã chạy trong subprocess riêng.
+- PCM đi qua một vòng slot trong vùng mmap dùng chung; queue chỉ mang số slot và kết quả.
+Vì phải fork trước khi có thread nào, STT được tải xong trước khi server nhận kết nối
+(thread ghi log của modules.log là ngoại lệ: process con ghi log thẳng ra console).
+"""
+import argparse
+import mmap
+import multiprocessing as mp
+import queue
+import signal
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import numpy as np
+
+from settings import server_settings as cfg
+from settings import stt_settings
+from modules import metrics
+from modules.log import get_logger
+
+log = get_logger(__name__)
+
+PCM = "pcm"
+FILE = "file"
+
+
+def _serve(index: int, engine, ring: mmap.mmap, slot_bytes: int, running: mmap.mmap, tasks, results):
+    """Vòng lặp của một process STT; engine và các vùng mmap được kế thừa từ process chính qua fork"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl-C: process chính tự đóng pool
+    # Request đang decode (id + 1, 0 = rảnh) ghi thẳng vào bộ nhớ chung: vẫn đọc được khi
+    # worker chết đột ngột, lúc message trong queue có thể chưa kịp gửi đi
+    current = np.frombuffer(running, dtype=np.int64)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        request_id, kind, data, requested_at, forced = task
+        current[index] = request_id + 1
+        before = engine.decodes.copy()
+        cpu_start = time.thread_time()
+        try:
+            if kind == FILE:
+                text = engine.transcribe(data, requested_at, forced)
+            else:
+                slot, pcm = data
+                if slot is not None:
+                    samples = np.frombuffer(ring, dtype=np.int16, count=pcm, offset=slot * slot_bytes)
+                else:
+                    samples = np.frombuffer(pcm, dtype=np.int16)
+                # astype() chép ra khỏi slot: process chính được dùng lại slot ngay khi có kết quả
+                wav = samples.astype(np.float32) / 32768.0
+                text = engine.transcribe_samples(wav, stt_settings.SAMPLE_RATE, requested_at, forced)
+        except Exception as e:
+            current[index] = 0
+            results.put((request_id, index, "error", str(e)))
+            continue
+        current[index] = 0
+        method = next((m for m in engine.decodes if engine.decodes[m] > before[m]), engine.method)
+        cpu = time.thread_time() - cpu_start
+        results.put((request_id, index, "done", (text, method, cpu, engine.stats())))
+
+
+def resolve_processes(value) -> int:
+    if value == "auto":
+        from modules.stt import available_cores
+        return max(1, available_cores() - stt_settings.RESERVED_CORES)
+    return int(value)
+
+
+class STTWorkerPool:
+    """
+    Mặt trước của các process STT, cùng giao diện với STTEngine mà pipeline dùng
+    (transcribe, transcribe_pcm16, num_workers, config, stats).
+    Các hàm transcribe chặn cho tới khi có kết quả: pipeline gọi chúng trong thread.
+    """
+
+    def __init__(self, engine, processes: int):
+        ctx = mp.get_context("fork")
+        self.num_workers = processes
+        self.config = {**engine.config, "processes": processes, "transport": "shared_memory"}
+        self.slot_bytes = int(cfg.STT_WORKER_SLOT_SECONDS * stt_settings.SAMPLE_RATE) * cfg.BIT_DEPTH_BYTES
+        # mmap ẩn danh là MAP_SHARED: process con fork ra thấy cùng vùng nhớ, không cần đặt tên / unlink.
+        # Chỉ process chính cấp phát và trả slot nên không cần đồng bộ chỉ số giữa các process.
+        self._ring = mmap.mmap(-1, self.slot_bytes * processes)
+        self._free_slots: queue.Queue = queue.Queue()
+        for slot in range(processes):
+            self._free_slots.put(slot)
+        self._running = mmap.mmap(-1, 8 * processes)
+        self._current = np.frombuffer(self._running, dtype=np.int64)
+        self._tasks = ctx.Queue()
+        self._results = ctx.Queue()
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._next_id = 0
+        self._closed = False
+
+        self._workers = [
+            ctx.Process(
+                target=_serve,
+                args=(i, engine, self._ring, self.slot_bytes, self._running, self._tasks, self._results),
+                name=f"stt-worker-{i}",
+                daemon=True,
+            )
+            for i in range(processes)
+        ]
+        for worker in self._workers:
+            worker.start()
+        self._dead = set()
+        self._stats: Dict[int, dict] = {i: engine.stats() for i in range(processes)}
+        # Thread chỉ được tạo SAU khi fork xong
+        self._collector = threading.Thread(target=self._collect, name="stt-results", daemon=True)
+        self._collector.start()
+        log.info("✅ Started %d STT worker process(es) sharing one model copy", processes)
+
+    @property
+    def alive(self) -> int:
+        return sum(worker.is_alive() for worker in self._workers)
+
+    def _submit(self, kind: str, data, requested_at: Optional[float], method: Optional[str]) -> Future:
+        future = Future()
+        with self._lock:
+            if self._closed or not self.alive:
+                raise RuntimeError("No STT worker process available")
+            request_id = self._next_id
+            self._next_id += 1
+            self._pending[request_id] = future
+        self._tasks.put((request_id, kind, data, requested_at, method))
+        return future
+
+    def _wait(self, future: Future) -> str:
+        text, method, cpu = future.result()
+        metrics.tag("stt_method", method)
+        metrics.add_usage("stt", cpu)
+        return text
+
+    def _fail(self, request_id: Optional[int], error: str):
+        with self._lock:
+            future = self._pending.pop(request_id, None)
+        if future is not None:
+            future.set_exception(RuntimeError(error))
+
+    def _reap(self):
+        """Worker chết giữa chừng: báo lỗi cho request nó đang giữ (không fork lại vì process chính đã có thread)"""
+        for index, worker in enumerate(self._workers):
+            if worker.is_alive() or index in self._dead:
+                continue
+            self._dead.add(index)
+            log.error("❌ STT worker %s (pid %s) exited with code %s", worker.name, worker.pid, worker.exitcode)
+            request_id = int(self._current[index]) - 1
+            if request_id >= 0:
+                self._fail(request_id, "STT worker process died")
+        if not self.alive:
+            for request_id in list(self._pending):
+                self._fail(request_id, "No STT worker process available")
+
+    def _collect(self):
+        while True:
+            try:
+                request_id, index, event, payload = self._results.get(timeout=cfg.STT_WORKER_POLL_SECONDS)
+            except queue.Empty:
+                if self._closed:
+                    return
+                self._reap()
+                continue
+            if event == "error":
+                self._fail(request_id, payload)
+                continue
+            text, method, cpu, stats = payload
+            self._stats[index] = stats
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is not None:
+                future.set_result((text, method, cpu))
+
+    def transcribe(self, audio_input_path, requested_at: Optional[float] = None, method: Optional[str] = None) -> str:
+        # File WAV nằm trên cùng máy: chỉ gửi đường dẫn, worker tự đọc
+        return self._wait(self._submit(FILE, str(audio_input_path), requested_at, method))
+
+    def transcribe_pcm16(self, pcm: bytes, requested_at: Optional[float] = None, method: Optional[str] = None) -> str:
+        if len(pcm) > self.slot_bytes:
+            return self._wait(self._submit(PCM, (None, pcm), requested_at, method))
+        slot = self._free_slots.get()
+        try:
+            offset = slot * self.slot_bytes
+            self._ring[offset:offset + len(pcm)] = pcm
+            return self._wait(self._submit(PCM, (slot, len(pcm) // cfg.BIT_DEPTH_BYTES), requested_at, method))
+        finally:
+            self._free_slots.put(slot)
+
+    def stats(self) -> dict:
+        decodes: Counter = Counter()
+        rtf: Dict[str, list] = {}
+        for report in list(self._stats.values()):
+            decodes.update(report["decodes"])
+            for method, value in report["rtf"].items():
+                rtf.setdefault(method, []).append(value)
+        return {
+            "decodes": dict(decodes),
+            "rtf": {method: round(sum(values) / len(values), 4) for method, values in rtf.items()},
+            "processes": {"configured": self.num_workers, "alive": self.alive},
+        }
+
+    def close(self, timeout: float = 5.0):
+        self._closed = True
+        for _ in self._workers:
+            self._tasks.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+            if worker.is_alive():
+                worker.terminate()
+        for request_id in list(self._pending):
+            self._fail(request_id, "STT worker pool closed")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Voice assistant server with STT worker processes")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--processes", default=cfg.STT_WORKER_PROCESSES,
+                        help='Số process STT; "auto" = số core còn lại, 0 = STT trong process chính')
+    args = parser.parse_args()
+
+    processes = resolve_processes(args.processes)
+    pool = None
+    if processes > 0:
+        from modules.stt import STTEngine
+        # Song song hoá bằng process: mỗi worker một recognizer một thread, nên ONNX Runtime
+        # không tạo thread pool nào trước khi fork
+        stt_settings.NUM_THREADS = 1
+        stt_settings.NUM_WORKERS = 1
+        pool = STTWorkerPool(STTEngine(), processes)
+
+    import uvicorn
+    from server import app as server_app
+
+    if pool is not None:
+        server_app.pipeline.stt_engine = pool
+    try:
+        uvicorn.run(server_app.app, host=args.host, port=args.port)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+if __name__ == "__main__":
+    main()
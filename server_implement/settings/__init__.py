@@ -0,0 +1,8 @@
+from . import stt_settings
+from . import tts_settings
+from . import llm_settings
+from . import server_settings
+from . import kws_settings
+from . import cluster_settings
+
+__all__ = ['stt_settings', 'tts_settings', 'llm_settings', 'server_settings', 'kws_settings', 'cluster_settings']
\ No newline at end of file
@@ -0,0 +1,27 @@
+import os
+import socket
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# ===== Session Store =====
+# Nơi giữ trạng thái phiên (lịch sử hội thoại, bản tóm tắt, thống kê khoảng ngừng của thiết bị):
+# - "memory": trong process, chỉ một server như trước
+# - "sqlite": một file dùng chung cho các gateway chạy trên cùng máy (cũng là stand-in của Redis khi thử)
+# - "redis": nhiều máy (cần gói redis)
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SQLITE_PATH = Path(os.getenv("SESSION_SQLITE_PATH", ROOT_DIR / "sessions.db"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+REDIS_KEY_PREFIX = "voice:"
+SESSION_TTL_SECONDS = 7 * 24 * 3600  # Phiên không dùng tới bấy lâu thì bị xoá
+# Gateway đang phục vụ thiết bị giữ lease của phiên và gia hạn theo heartbeat;
+# chỉ node giữ lease mới được ghi, nên hai node không ghi đè lịch sử của nhau khi bàn giao.
+SESSION_LEASE_SECONDS = 30
+
+# ===== Gateway Nodes =====
+NODE_ID = os.getenv("NODE_ID", socket.gethostname())
+NODE_URL = os.getenv("NODE_URL", "")  # Địa chỉ thiết bị dùng để kết nối node này, vd ws://10.0.0.2:8000/ws
+NODE_HEARTBEAT_SECONDS = 5
+NODE_TTL_SECONDS = 15  # Không heartbeat bấy lâu = node đã chết, bị bỏ khỏi vòng hash
+HASH_RING_VNODES = 64  # Số điểm ảo mỗi node trên vòng consistent hash
+DRAIN_TIMEOUT_SECONDS = 30  # Khi drain, chờ câu trả lời đang phát tối đa bấy lâu
@@ -0,0 +1,32 @@
+from pathlib import Path
+
+# ===== Model Paths =====
+# Model KWS là zipformer transducer streaming nhỏ (~3M tham số) của sherpa-onnx;
+# keywords phải viết được bằng token của model này.
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MODEL_DIR = ROOT_DIR / "models" / "KWS"
+
+# ===== Model Files =====
+TOKENS_FILE_PATTERNS = ["tokens.txt"]
+ENCODER_FILE_PATTERNS = ["encoder*.int8.onnx", "encoder*.onnx"]
+DECODER_FILE_PATTERNS = ["decoder*.onnx"]
+JOINER_FILE_PATTERNS = ["joiner*.int8.onnx", "joiner*.onnx"]
+BPE_MODEL_PATTERNS = ["bpe.model"]  # Cần khi KEYWORDS_TOKENS_TYPE = "bpe"
+
+# ===== Keywords =====
+# Chỉ dùng khi server_settings.ENDPOINTING = "wakeword": chỉ câu nói ngay sau wake word
+# mới được đưa vào VAD/STT/LLM, tiếng ồn và tiếng nói chuyện trong lớp bị bỏ qua.
+KWS_ENABLED = True
+KEYWORDS = ["XIN CHÀO BẠN NHỎ"]
+KEYWORDS_FILE = MODEL_DIR / "keywords_generated.txt"  # Tạo lại mỗi lần khởi động
+KEYWORDS_TOKENS_TYPE = "bpe"  # Theo model: bpe | cjkchar | ppinyin | fpinyin
+KEYWORDS_SCORE = 1.0          # Boosting khi gặp token của keyword
+KEYWORDS_THRESHOLD = 0.25     # Ngưỡng kích hoạt; tăng lên nếu lớp ồn báo nhầm nhiều
+NUM_TRAILING_BLANKS = 1
+
+# ===== Recognition Settings =====
+SAMPLE_RATE = 16000
+FEATURE_DIM = 80
+NUM_THREADS = 1  # Một model dùng chung, decode ngay trong event loop theo từng frame
+MAX_ACTIVE_PATHS = 4
+PROVIDER = "cpu"
@@ -0,0 +1,112 @@
+import os
+from pathlib import Path
+
+# ===== Backend =====
+# gemini | openai (endpoint tương thích OpenAI, ví dụ llama.cpp / vLLM / benchmark.llm_server) | mock (offline)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+
+# ===== API Configuration =====
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_API_KEY_HERE")
+GEMINI_MODEL = "gemini-2.5-flash" 
+
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "http://127.0.0.1:8081/v1")
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "")
+OPENAI_MODEL = os.getenv("OPENAI_MODEL", "local-model")
+
+# ===== Mock Backend =====
+MOCK_TTFT_SECONDS = 0.4
+MOCK_TOKENS_PER_SECOND = 80.0
+MOCK_PREFILL_SECONDS_PER_1K_TOKENS = 0.05  # TTFT tăng theo số token đầu vào chưa được cache
+MOCK_REPLIES = [
+    "Tớ nghĩ là bằng hai đó cậu. Cậu thử đếm trên ngón tay xem nhé!",
+    "Câu hỏi hay quá! Con mèo có bốn cái chân đó cậu ạ.",
+    "Tớ cũng thích học đọc lắm. Mình cùng đánh vần chữ này nhé.",
+    "Cậu giỏi quá! Mình học tiếp bài sau nha.",
+]
+
+# ===== Thinking/Chain-of-Thought Settings =====
+USE_THINKING = True
+THINKING_BUDGET = "latency"  # -1 = dynamic thinking, 0 = disabled, >0 = fixed budget, "latency" = theo thời gian còn lại của lượt
+INCLUDE_THOUGHTS = False  # Set True to see model's reasoning process
+
+# Thinking budget theo độ trễ (THINKING_BUDGET = "latency")
+TURN_LATENCY_TARGET_SECONDS = 2.5   # Mục tiêu từ lúc trẻ nói xong tới audio đầu tiên
+LLM_BASE_TTFT_SECONDS = 0.5         # TTFT khi không thinking
+TTS_FIRST_AUDIO_SECONDS = 0.8       # Thời gian dự kiến từ lúc có câu trả lời tới audio đầu tiên
+THINKING_TOKENS_PER_SECOND = 200.0
+THINKING_MIN_TOKENS = 128           # Còn ít hơn thế thì tắt thinking (budget = 0)
+THINKING_MAX_TOKENS = 1024
+
+# ===== RAG Configuration =====
+ROOT_DIR = Path(__file__).resolve().parent.parent
+RAG_DIR = ROOT_DIR / "rag_docs"  # Thư mục chứa tài liệu .txt cho RAG
+RAG_CHUNK_SIZE = 500  # Kích thước mỗi chunk
+RAG_CHUNK_OVERLAP = 50  # Overlap giữa các chunk
+RAG_TOP_K = 3  # Số lượng chunk liên quan nhất được lấy ra
+RAG_MIN_RELEVANCE = 0.35  # Tỉ lệ (theo IDF) từ trong câu hỏi có trong chunk; thấp hơn thì bỏ
+
+# ===== Chat History =====
+HISTORY_DIR = ROOT_DIR / "chat_history"
+MAX_HISTORY_TURNS = 8  # Số lượt hội thoại tối đa được lưu
+
+# ===== Context Budget =====
+CONTEXT_MAX_INPUT_TOKENS = 1200  # Tổng token đầu vào mỗi lượt (prompt + tài liệu + lịch sử)
+TOKENS_PER_WORD = 1.4            # Ước lượng token cho mỗi âm tiết / dấu câu tiếng Việt
+RAG_MAX_TOKENS = 300
+RAG_MIN_CHUNK_TOKENS = 30        # Phần tài liệu còn lại ngắn hơn thế thì bỏ hẳn
+HISTORY_RECENT_TURNS = 3         # Số lượt gần nhất giữ nguyên văn; lượt cũ hơn được tóm tắt
+SUMMARY_MAX_TOKENS = 150
+SUMMARY_LINE_TOKENS = 25
+SUMMARY_IDLE_SECONDS = 3600     # Tóm tắt của session không có lượt nào lâu hơn thế thì bị bỏ khỏi bộ nhớ
+
+# ===== Context Caching =====
+# Phần đầu tĩnh của prompt (ROLE + SAFETY, kèm toàn bộ tài liệu bài học nếu đủ nhỏ) được cache
+# phía server (Gemini cached contents) và dùng lại cho mọi lượt, mọi thiết bị.
+CONTEXT_CACHE_ENABLED = True
+CONTEXT_CACHE_TTL_SECONDS = 3600
+CONTEXT_CACHE_REFRESH_MARGIN_SECONDS = 300  # Còn ít hơn thế thì gia hạn TTL
+CONTEXT_CACHE_CHECK_SECONDS = 30            # Chu kỳ kiểm tra thư mục RAG có thay đổi không
+CONTEXT_CACHE_RETRY_SECONDS = 60            # Tạo cache lỗi thì chờ bấy lâu mới thử lại
+CONTEXT_CACHE_MIN_TOKENS = 1024             # Gemini 2.5 Flash không cache phần ngắn hơn thế
+CONTEXT_CACHE_CORPUS = True                 # Đưa cả tài liệu bài học vào cache, bỏ RAG từng lượt
+CONTEXT_CACHE_MAX_CORPUS_TOKENS = 32000     # Tài liệu lớn hơn thế thì chỉ cache prompt, giữ RAG
+
+# ===== System Prompt =====
+ROLE_PROMPT = (
+    "Bạn là một đứa trẻ lớp 1 đang nói chuyện với một bạn cũng học lớp 1. Bạn xưng Tớ, gọi Cậu\n"
+    "Nhiệm vụ của bạn là cùng học tập với bạn ấy, giải thích chậm rãi, dễ hiểu,\n"
+    "dùng từ ngữ ngây thơ, hồn nhiên, lễ phép.\n"
+    "Luôn khuyến khích bạn ấy đặt câu hỏi.\n"
+    "Tránh dùng từ ngữ người lớn, tránh giáo điều.\n"
+)
+
+SAFETY_PROMPT = (
+    "Không tiết lộ suy luận nội bộ; chỉ trả lời kết luận ngắn gọn, rõ ràng.\n"
+    "Nếu câu hỏi không phù hợp lứa tuổi lớp 1, lịch sự từ chối."
+)
+
+# ===== Generation Settings =====
+TEMPERATURE = 0.7
+MAX_OUTPUT_TOKENS = 1024
+TOP_P = 0.95
+TOP_K = 40
+# ===== Async Client & Reliability =====
+LLM_HTTP_TIMEOUT_MS = 15000         # Timeout của HTTP client (ms), chặn trên cho mọi request
+LLM_MAX_CONNECTIONS = 20            # Connection pool dùng chung cho mọi thiết bị
+LLM_KEEPALIVE_SECONDS = 60
+LLM_CALL_TIMEOUT = 6.0              # Deadline cho một lần gọi (kể cả stream)
+LLM_MAX_RETRIES = 2
+LLM_BACKOFF_BASE = 0.25             # Backoff: BASE * 2^n (giây), có jitter
+LLM_BACKOFF_MAX = 2.0
+LLM_RETRY_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Hedged request: nếu chưa có token đầu tiên sau p95 TTFT gần đây thì gửi thêm một request
+# giống hệt, lấy kết quả nào về trước (tốn thêm quota cho các lượt chậm).
+LLM_HEDGE_ENABLED = True
+LLM_HEDGE_PERCENTILE = 95
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_HEDGE_DEFAULT_DELAY = 2.0       # Dùng khi chưa đủ mẫu TTFT
+
+# SLA cứng: quá thời gian này thì trả lời câu dự phòng thay vì để trẻ chờ
+LLM_HARD_SLA_SECONDS = 8.0
+LLM_FALLBACK_REPLY = "Ơ, tớ nghĩ mãi mà chưa ra. Cậu hỏi lại tớ lần nữa nhé!"
@@ -0,0 +1,159 @@
+import os
+from pathlib import Path
+
+ROOT_DIR = Path(__file__).resolve().parent.parent
+
+# ===== Audio =====
+# Các thông số audio này PHẢI KHỚP với code ESP32
+SAMPLE_RATE = 16000
+BIT_DEPTH_BYTES = 2  # 16-bit = 2 bytes
+CHANNELS = 1
+AUDIO_CHUNK_SIZE = 1024  # Kích thước mỗi đoạn audio gửi về client (firmware chỉ nhận tối đa 1024 byte)
+AUDIO_FOLDER = "audio_files"  # Audio mẫu và kho lưu câu nói đã thu (tương đối với thư mục chạy server)
+REPLY_CACHE_DIR = "audio_cache"  # File WAV trả lời của từng kết nối
+
+# ===== Audio Archive =====
+# Câu nói được lưu SAU khi đã trả lời xong, bởi các worker nền: STT đọc thẳng PCM trong bộ nhớ,
+# việc ghi đĩa không nằm trên đường găng. File: ARCHIVE_DIR/<thiết bị>/<ngày>/<giờ>_<id>[_failed].<đuôi>
+ARCHIVE_ENABLED = True
+ARCHIVE_DIR = os.path.join(AUDIO_FOLDER, "archive")
+ARCHIVE_FORMAT = "flac"  # wav | flac (không mất dữ liệu, nhỏ hơn ~40%) | opus (ogg, nhỏ ~10 lần, đủ để nghe lại)
+ARCHIVE_SAMPLE_RATIO = 1.0  # Tỉ lệ câu nói bình thường được lưu (0.1 = 10%)
+ARCHIVE_FAILURES = True  # Luôn lưu câu lỗi (STT rỗng, câu dự phòng của LLM, lỗi pipeline)
+ARCHIVE_WORKERS = 2
+ARCHIVE_QUEUE_SIZE = 64  # Hàng đợi đầy thì bỏ câu nói (đếm trong /metrics) thay vì chặn
+ARCHIVE_MAX_BYTES = 2 * 1024 ** 3  # Vượt quá thì xoá file cũ nhất
+ARCHIVE_MAX_AGE_DAYS = 30
+ARCHIVE_RETENTION_INTERVAL_SECONDS = 600
+
+# ===== Endpointing =====
+# Cách quyết định một câu nói đã kết thúc, chọn theo loại firmware:
+# - "vad": thiết bị stream liên tục, server dùng Silero VAD (firmware vad/, main/)
+# - "timeout": thiết bị tự quyết định khi nào gửi (AFE VAD trên ESP32, test_wake_net);
+#   ngừng nhận audio AUDIO_TIMEOUT giây = hết câu
+# - "wakeword": như "vad" nhưng chỉ nghe sau khi có wake word (thiết bị gửi "WAKE")
+# Mỗi kết nối có thể chọn riêng bằng query ?endpointing=...
+ENDPOINTING = os.getenv("ENDPOINTING", "vad")
+AUDIO_TIMEOUT = 0.7
+
+# ===== VAD =====
+VAD_FRAME_MS = 30  # Silero VAD hoạt động tốt nhất với frame 30ms
+VAD_CHUNK_SIZE = (SAMPLE_RATE * VAD_FRAME_MS // 1000) * BIT_DEPTH_BYTES  # = 960 bytes
+VAD_SPEECH_THRESHOLD = 0.5  # Ngưỡng tin cậy để coi là có tiếng nói
+VAD_SILENCE_FRAMES_TRIGGER = 1  # Số frame có tiếng nói liên tiếp để bắt đầu thu
+VAD_SILENCE_FRAMES_END = 25  # Số frame im lặng liên tiếp để kết thúc thu (~0.75s)
+VAD_BUFFER_FRAMES = 5  # Lưu lại 5 frame âm thanh ngay TRƯỚC khi có tiếng nói
+VAD_MODEL_PATH = ROOT_DIR / "models" / "silero_vad.onnx"
+
+# ===== Barge-in (ngắt lời khi đang trả lời) =====
+BARGE_IN_ENABLED = True
+BARGE_IN_SPEECH_THRESHOLD = 0.8
+BARGE_IN_TRIGGER_FRAMES = 3
+
+# ===== Adaptive Endpointing =====
+# VAD_SILENCE_FRAMES_END chỉ còn là giá trị mặc định khi chưa có thống kê của thiết bị
+ENDPOINT_ADAPTIVE = True
+ENDPOINT_MIN_SILENCE_FRAMES = 8  # ~240ms, dùng khi câu đã trọn ý
+ENDPOINT_MAX_SILENCE_FRAMES = 45  # ~1.35s, dùng cho người nói ngập ngừng
+ENDPOINT_PARTIAL_STT_FRAMES = 6  # Sau ~180ms im lặng thì decode tạm thời câu nói
+
+# ===== Speculative Run =====
+# Tại ENDPOINT_PARTIAL_STT_FRAMES, chạy luôn STT + LLM thay vì chỉ decode tạm thời;
+# transcript của lần chạy này cũng được đưa cho endpointer.
+SPECULATIVE_ENABLED = True
+
+# ===== Idle Connections =====
+# Thiết bị im lặng vẫn gửi 33 frame/giây: frame im lặng rõ ràng (theo năng lượng) khi không có
+# câu nói nào đang diễn ra được bỏ qua trước front-end và VAD/KWS.
+ENERGY_GATE_ENABLED = os.getenv("ENERGY_GATE", "1") != "0"
+ENERGY_GATE_FLOOR_DBFS = -50.0  # Nhỏ hơn mức này luôn là im lặng
+ENERGY_GATE_MARGIN_DB = 6.0  # Không to hơn nền nhiễu quá bấy nhiêu dB cũng là im lặng
+ENERGY_GATE_NOISE_RISE_DB = 0.02  # Nền nhiễu tăng chậm mỗi frame (~0.7 dB/giây), giảm ngay
+ENERGY_GATE_HANGOVER_FRAMES = 10  # Sau frame to, vẫn đưa ~300ms tiếp theo vào VAD
+# Thiết bị im lặng lâu có thể ngừng gửi audio: gửi "PAUSE", sau đó chỉ gửi "HEARTBEAT" định kỳ,
+# có tiếng thì gửi "RESUME" (hoặc gửi audio luôn) kèm vài frame trước đó.
+PAUSE_MESSAGE = "PAUSE"
+RESUME_MESSAGE = "RESUME"
+HEARTBEAT_MESSAGE = "HEARTBEAT"
+HEARTBEAT_TIMEOUT_SECONDS = 20.0  # Đang tạm dừng mà không nhận được gì trong bấy lâu = thiết bị đã mất
+
+# ===== Wake Word =====
+WAKE_MESSAGE = "WAKE"  # Tin nhắn text thiết bị gửi khi phát hiện wake word
+WAKE_LISTEN_SECONDS = 8.0  # Sau wake word, chờ câu hỏi tối đa bấy lâu
+
+# ===== Audio Front-end =====
+# Lọc DC, khử nhiễu và AGC trên từng frame trước VAD; audio đưa vào STT cũng là audio đã xử lý.
+FRONTEND_ENABLED = True
+FRONTEND_DENOISE = True
+FRONTEND_AGC = True
+
+# ===== QoS =====
+# Một pipeline dùng chung cho cả lớp: hạn mức token bucket theo thiết bị và theo lớp
+# (?classroom=...), hàng đợi vào pipeline có giới hạn và ưu tiên theo lớp ưu tiên (?priority=...).
+# Lượt vượt hạn mức chỉ chạy khi pipeline còn chỗ ngay; đầy thì nhận câu QOS_BUSY_REPLY đã tổng hợp sẵn.
+# Lượt trong hạn mức chờ tối đa QOS_MAX_WAIT_SECONDS rồi cũng nhận câu đó, thay vì chờ không giới hạn.
+QOS_ENABLED = os.getenv("QOS", "1") != "0"
+QOS_MAX_CONCURRENT = 2  # Số lượt chạy STT -> LLM -> TTS cùng lúc
+QOS_MAX_WAIT_SECONDS = 3.0
+PRIORITY_CLASSES = ("teacher", "student")  # Thứ tự ưu tiên, đứng trước được vào trước
+DEFAULT_PRIORITY = "student"
+QOS_UNLIMITED_CLASSES = ("teacher",)  # Không bị giới hạn hạn mức
+DEFAULT_CLASSROOM = "default"
+DEVICE_UTTERANCES_PER_MINUTE = 6
+DEVICE_UTTERANCE_BURST = 3
+CLASSROOM_UTTERANCES_PER_MINUTE = 60
+CLASSROOM_UTTERANCE_BURST = 15
+DEVICE_LLM_TOKENS_PER_MINUTE = 6000  # Token prompt + câu trả lời (ước lượng)
+CLASSROOM_LLM_TOKENS_PER_MINUTE = 60000
+QOS_BUCKET_IDLE_SECONDS = 600  # Bucket đã hồi đầy và không dùng lâu hơn thế thì bị bỏ (tạo lại khi cần)
+QOS_BUSY_REPLY = "Tớ đang trả lời các bạn khác, cậu đợi tớ một chút rồi hỏi lại nhé!"
+
+# ===== Degradation =====
+# Khi quá tải, thay vì mọi lượt đều chậm: giảm dần chất lượng theo từng bậc (mỗi bậc giữ các
+# thay đổi của bậc trước). Lên một bậc khi hàng đợi QoS có lượt chờ hoặc p95 e2e_first_audio
+# của các lượt gần đây vượt SLO; xuống một bậc khi đã nhẹ tải đủ lâu. POST /degradation?tier=
+# để ép một bậc (tier=auto để trả lại cho bộ điều khiển).
+DEGRADATION_ENABLED = os.getenv("DEGRADATION", "1") != "0"
+DEGRADATION_TIERS = (
+    ("normal", {}),
+    ("fewer_tts_steps", {"tts_steps": 4}),   # ZipVoice chạy 4 bước flow matching thay vì NUM_STEP
+    ("no_thinking", {"thinking": False}),     # thinking_budget = 0
+    ("greedy_stt", {"stt_greedy": True}),     # STT bỏ beam search
+    ("no_rag", {"rag": False}),               # Không tìm tài liệu RAG
+    ("canned", {"canned": True}),             # Học sinh nhận câu QOS_BUSY_REPLY đã tổng hợp sẵn
+)
+DEGRADATION_INTERVAL_SECONDS = 2.0
+DEGRADATION_LATENCY_SLO_SECONDS = 2.5  # p95 từ lúc trẻ nói xong tới audio đầu tiên
+DEGRADATION_WINDOW_SECONDS = 30.0      # Chỉ xét các lượt gần đây, và chỉ các lượt sau lần đổi bậc cuối
+DEGRADATION_MIN_SAMPLES = 3            # Ít lượt hơn thì chưa kết luận gì về độ trễ
+DEGRADATION_QUEUE_HIGH = 1             # Số lượt đang chờ vào pipeline coi là quá tải
+DEGRADATION_RECOVER_RATIO = 0.7        # Nhẹ tải khi không ai chờ và p95 < SLO * tỉ lệ này
+DEGRADATION_STEP_UP_CHECKS = 2         # Số lần kiểm tra liên tiếp quá tải trước khi lên bậc
+DEGRADATION_STEP_DOWN_CHECKS = 10      # ... và nhẹ tải trước khi xuống bậc (chậm hơn để không dao động)
+
+# ===== STT Worker Processes =====
+# python -m server.workers: process chính giữ websocket/VAD/LLM/TTS, STT chạy trong
+# STT_WORKER_PROCESSES process con được fork SAU khi model đã tải (dùng chung trọng số
+# qua copy-on-write). 0 = chạy STT trong process chính như trước; "auto" = số core còn lại.
+STT_WORKER_PROCESSES = os.getenv("STT_WORKER_PROCESSES", "auto")
+STT_WORKER_SLOT_SECONDS = 30  # Mỗi slot shared memory chứa tối đa bấy nhiêu giây PCM; dài hơn thì gửi qua pipe
+STT_WORKER_POLL_SECONDS = 1.0  # Chu kỳ kiểm tra worker còn sống
+
+# ===== Logging =====
+# Log đi qua một hàng đợi, một thread nền ghi ra console: event loop không chờ stdout.
+# Mức theo module: LOG_LEVELS="modules.tts=DEBUG,server.strategies=WARNING" (tên logger = tên module)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text")  # text | json (mỗi dòng một object, kèm device/request_id)
+LOG_QUEUE_SIZE = 10000  # Hàng đợi đầy thì bỏ bản ghi (đếm trong /metrics) thay vì chặn
+LOG_RATE_LIMIT_SECONDS = 10.0  # Cùng một cảnh báo từ cùng một chỗ chỉ ghi một lần mỗi bấy lâu
+
+# ===== Profiling =====
+# POST /profile/cpu?seconds=N: lấy mẫu stack mọi thread, trả về collapsed stacks cho flamegraph.
+# POST /profile/memory/start, GET /profile/memory, POST /profile/memory/stop: tracemalloc lúc chạy
+# (PYTHONTRACEMALLOC=1 để bật ngay từ lúc khởi động). CPU time theo giai đoạn luôn được ghi vào trace.
+PROFILE_INTERVAL_SECONDS = 0.005
+PROFILE_MAX_SECONDS = 60.0
+PROFILE_MIN_SECONDS = 1.0
+PROFILE_MIN_INTERVAL_SECONDS = 0.001  # Nhỏ hơn thế thì thread lấy mẫu gần như chạy liên tục, tranh GIL với pipeline
+TRACEMALLOC_FRAMES = 1  # Số frame lưu cho mỗi lần cấp phát; nhiều hơn = traceback dài hơn nhưng chậm hơn
@@ -0,0 +1,60 @@
+from pathlib import Path
+
+# ===== Model Paths =====
+ROOT_DIR = Path(__file__).resolve().parent.parent
+MODEL_DIR = ROOT_DIR / "models" / "Zipformer"
+
+# ===== Model Files =====
+# Các file này sẽ được tự động tìm kiếm theo pattern
+TOKENS_FILE_PATTERNS = ["tokens.txt"]
+ENCODER_FILE_PATTERNS = ["encoder-epoch-20-avg-10.onnx", "encoder*.onnx"]
+DECODER_FILE_PATTERNS = ["decoder-epoch-20-avg-10.onnx", "decoder*.onnx"]
+JOINER_FILE_PATTERNS = ["joiner-epoch-20-avg-10.onnx", "joiner*.onnx"]
+
+# ===== Audio Processing =====
+SAMPLE_RATE = 16000  # Hz - ZipFormer yêu cầu 16kHz
+FEATURE_DIM = 80     # Mel filterbank dimension
+
+# ===== Recognition Settings =====
+NUM_THREADS = "auto"  # intra-op threads mỗi recognizer; "auto" = chọn lúc khởi động theo RTF đo được
+NUM_WORKERS = "auto"  # Số recognizer decode song song; "auto" = số core còn lại / NUM_THREADS
+DECODING_METHOD = "modified_beam_search"  # Options: greedy_search, modified_beam_search
+GREEDY_SEARCH = "greedy_search"  # Tên phương pháp greedy của sherpa-onnx (fallback / khi server giảm tải)
+MAX_ACTIVE_PATHS = 4
+
+# ===== Greedy Fallback =====
+# Với modified_beam_search, mỗi worker có thêm một recognizer greedy (tốn gấp đôi RAM cho STT).
+# Request được decode bằng greedy nếu thời gian ước lượng (độ dài audio x RTF x hàng đợi)
+# vượt quá ngân sách, để p95 của STT không vượt LATENCY_BUDGET_SECONDS khi server tải cao.
+GREEDY_FALLBACK = True
+LATENCY_BUDGET_SECONDS = 0.6
+RTF_SMOOTHING = 0.1  # EWMA của RTF đo được sau mỗi lần decode
+
+# ===== Hotwords (chỉ dùng với modified_beam_search) =====
+HOTWORDS_ENABLED = True
+HOTWORDS_FILE = MODEL_DIR / "hotwords_generated.txt"  # Tạo lại mỗi lần khởi động
+HOTWORDS_SCORE = 1.5
+HOTWORDS_MODELING_UNIT = "bpe"
+BPE_VOCAB_PATTERNS = ["bpe.vocab"]  # Cần để sherpa-onnx tách hotwords thành token
+HOTWORDS_UPPERCASE = True            # Token của model Zipformer tiếng Việt là chữ in hoa
+HOTWORDS_MAX_CORPUS_PHRASES = 300
+HOTWORDS_MIN_COUNT = 2
+CURRICULUM_HOTWORDS = [
+    "không", "một", "hai", "ba", "bốn", "năm", "sáu", "bảy", "tám", "chín", "mười",
+    "mười một", "mười hai", "mười ba", "mười bốn", "mười lăm", "mười sáu",
+    "mười bảy", "mười tám", "mười chín", "hai mươi",
+    "cộng", "trừ", "bằng", "bằng mấy", "bao nhiêu", "lớn hơn", "bé hơn", "bằng nhau",
+    "hình vuông", "hình tròn", "hình tam giác", "hình chữ nhật",
+    "đánh vần", "chữ cái", "tiếng việt", "môn toán",
+]
+PROVIDER = "cpu"  # Options: cpu, cuda, coreml
+
+# ===== Warm-up & Auto-tune =====
+WARMUP_SECONDS = 3.0                   # Độ dài clip tổng hợp dùng để warm-up và đo RTF
+AUTOTUNE_THREAD_CANDIDATES = (1, 2, 4)
+AUTOTUNE_TARGET_RTF = 0.3              # RTF tối đa chấp nhận được cho một câu nói
+AUTOTUNE_MAX_WORKERS = 4
+RESERVED_CORES = 1                     # Chừa cho event loop, VAD và LLM/TTS
+
+# ===== Input/Output =====
+DEFAULT_INPUT_AUDIO = ROOT_DIR / "data" / "ref1.wav"
\ No newline at end of file
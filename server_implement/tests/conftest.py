@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Các module import theo gốc server_implement (settings, modules, server)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,14 @@
+import importlib.util
+
+from fastapi.testclient import TestClient
+
+
+def test_app_imports_without_loading_models():
+    # Model được tải trong lifespan; import app (và /health) không cần sherpa_onnx / ZipVoice
+    from server.app import app
+
+    response = TestClient(app).get("/health")
+    assert response.status_code == 200
+    if importlib.util.find_spec("sherpa_onnx") is None:
+        import sys
+        assert "modules.stt" not in sys.modules
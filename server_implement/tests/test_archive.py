@@ -0,0 +1,100 @@
+import asyncio
+import os
+import time
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+from server import archive as archive_module
+from server.archive import AudioArchiver
+
+PCM = np.arange(-800, 800, dtype=np.int16).tobytes()
+
+
+@pytest.fixture
+def settings(tmp_path, monkeypatch):
+    cfg = archive_module.cfg
+    monkeypatch.setattr(cfg, "ARCHIVE_ENABLED", True)
+    monkeypatch.setattr(cfg, "ARCHIVE_DIR", str(tmp_path / "archive"))
+    monkeypatch.setattr(cfg, "ARCHIVE_FORMAT", "flac")
+    monkeypatch.setattr(cfg, "ARCHIVE_SAMPLE_RATIO", 1.0)
+    monkeypatch.setattr(cfg, "ARCHIVE_FAILURES", True)
+    return cfg
+
+
+def test_writes_unique_files_per_device(settings):
+    async def run():
+        archiver = AudioArchiver()
+        assert archiver.submit("lop1/bàn 2", PCM)
+        assert archiver.submit("lop1/bàn 2", PCM, failed=True)
+        await archiver.stop()
+        return archiver
+
+    archiver = asyncio.run(run())
+    files = sorted(archiver.root.rglob("*.flac"))
+    assert len(files) == 2
+    assert {f.relative_to(archiver.root).parts[0] for f in files} == {"lop1_bàn_2"}
+    assert sum(f.stem.endswith("_failed") for f in files) == 1
+    samples, rate = sf.read(str(files[0]), dtype="int16")
+    assert rate == settings.SAMPLE_RATE
+    np.testing.assert_array_equal(samples, np.frombuffer(PCM, dtype=np.int16))
+    assert archiver.stats()["written"] == 2 and archiver.stats()["failures"] == 1
+
+
+def test_sampling_keeps_failures(settings, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_SAMPLE_RATIO", 0.25)
+    rolls = iter([0.1, 0.9, 0.9])
+    monkeypatch.setattr(archive_module.random, "random", lambda: next(rolls))
+
+    async def run():
+        archiver = AudioArchiver()
+        results = [archiver.submit("dev", PCM) for _ in range(3)]
+        results.append(archiver.submit("dev", PCM, failed=True))  # Không qua lấy mẫu
+        await archiver.stop()
+        return archiver, results
+
+    archiver, results = asyncio.run(run())
+    assert results == [True, False, False, True]
+    assert archiver.counts["sampled_out"] == 2
+    assert archiver.counts["written"] == 2
+
+
+def test_full_queue_drops_instead_of_blocking(settings, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_QUEUE_SIZE", 2)
+    monkeypatch.setattr(settings, "ARCHIVE_WORKERS", 0)
+
+    async def run():
+        archiver = AudioArchiver()
+        results = [archiver.submit("dev", PCM) for _ in range(4)]
+        return archiver, results
+
+    archiver, results = asyncio.run(run())
+    assert results == [True, True, False, False]
+    assert archiver.counts["dropped"] == 2
+
+
+def make_file(root, relative, size, age_days=0.0):
+    path = root / relative
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"\0" * size)
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_sweep_removes_old_files_then_oldest_over_budget(settings, monkeypatch):
+    monkeypatch.setattr(settings, "ARCHIVE_MAX_AGE_DAYS", 30)
+    monkeypatch.setattr(settings, "ARCHIVE_MAX_BYTES", 250)
+    archiver = AudioArchiver()
+    root = archiver.root
+    expired = make_file(root, "a/2026-01-01/old.flac", 10, age_days=40)
+    oldest = make_file(root, "a/2026-10-01/x.flac", 100, age_days=3)
+    middle = make_file(root, "b/2026-10-02/y.flac", 100, age_days=2)
+    newest = make_file(root, "b/2026-10-03/z.flac", 100, age_days=1)
+
+    assert archiver.sweep() == 2
+    assert not expired.exists() and not oldest.exists()
+    assert middle.exists() and newest.exists()
+    assert not (root / "a").exists()  # Thư mục trống được dọn
+    assert archiver.sweep() == 0
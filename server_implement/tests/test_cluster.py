@@ -0,0 +1,106 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from modules.session_store import MemorySessionStore, SQLiteSessionStore
+from server.cluster import Cluster, HashRing
+
+
+class FakeLLM:
+    def __init__(self):
+        self.history = SimpleNamespace(restored={}, restore=lambda d, m: self.history.restored.update({d: m}))
+        self.context = SimpleNamespace(restore=lambda d, s: None)
+
+
+class SlowPipeline:
+    """LLM chỉ sẵn sàng khi test gọi load()"""
+
+    def __init__(self):
+        self.llm_engine = None
+        self._ready = asyncio.Event()
+
+    def load(self):
+        self.llm_engine = FakeLLM()
+        self._ready.set()
+
+    async def wait_ready(self, *names):
+        await self._ready.wait()
+
+
+def test_attach_does_not_wait_for_llm(tmp_path):
+    async def run():
+        store = SQLiteSessionStore(str(tmp_path / "sessions.db"))
+        store.save("dev-1", {"messages": [{"role": "user", "content": "xin chào"}]}, "old-node", 60)
+        store.release("dev-1", "old-node")
+        pipeline = SlowPipeline()
+        cluster = Cluster(store, pipeline, node_id="node-a", node_url="ws://a")
+        session = SimpleNamespace(device_id="dev-1")
+
+        assert await asyncio.wait_for(cluster.attach(session), timeout=1.0)
+        pipeline.load()
+        await asyncio.sleep(0)  # Task nạp lịch sử chạy ngay khi LLM sẵn sàng
+        assert pipeline.llm_engine.history.restored["dev-1"][0]["content"] == "xin chào"
+        store.close()
+
+    asyncio.run(run())
+
+
+def test_hash_ring_is_deterministic_and_balanced():
+    assert HashRing().node_for("dev-1") is None
+    nodes = ["node-a", "node-b", "node-c"]
+    ring = HashRing(nodes)
+    devices = [f"esp32-{i}" for i in range(3000)]
+    owners = {d: ring.node_for(d) for d in devices}
+    assert owners == {d: HashRing(list(reversed(nodes))).node_for(d) for d in devices}
+    counts = {node: list(owners.values()).count(node) for node in nodes}
+    assert min(counts.values()) > len(devices) / len(nodes) * 0.7
+
+
+def test_hash_ring_removing_a_node_only_moves_its_devices():
+    ring = HashRing(["node-a", "node-b", "node-c"])
+    devices = [f"esp32-{i}" for i in range(3000)]
+    before = {d: ring.node_for(d) for d in devices}
+    ring.set_nodes(["node-a", "node-b"])
+    for device, owner in before.items():
+        if owner != "node-c":
+            assert ring.node_for(device) == owner
+        else:
+            assert ring.node_for(device) in ("node-a", "node-b")
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = MemorySessionStore() if request.param == "memory" else SQLiteSessionStore(str(tmp_path / "s.db"))
+    yield store
+    store.close()
+
+
+def test_lease_is_exclusive_until_released(store):
+    assert store.claim("dev-1", "node-a", ttl=60)
+    assert store.claim("dev-1", "node-a", ttl=60)  # Gia hạn
+    assert not store.claim("dev-1", "node-b", ttl=60)
+    assert store.owner("dev-1") == "node-a"
+    store.release("dev-1", "node-b")  # Không phải chủ: không có tác dụng
+    assert store.owner("dev-1") == "node-a"
+    store.release("dev-1", "node-a")
+    assert store.owner("dev-1") is None
+    assert store.claim("dev-1", "node-b", ttl=60)
+
+
+def test_save_requires_the_lease(store):
+    assert store.claim("dev-1", "node-a", ttl=60)
+    assert not store.save("dev-1", {"messages": []}, "node-b", ttl=60)
+    assert store.save("dev-1", {"messages": [{"role": "user", "content": "a"}]}, "node-a", ttl=60)
+    assert store.load("dev-1")["messages"][0]["content"] == "a"
+
+
+def test_force_claim_and_expiry(store):
+    assert store.claim("dev-1", "node-a", ttl=60)
+    assert store.claim("dev-1", "node-b", ttl=60, force=True)
+    assert store.owner("dev-1") == "node-b"
+    assert store.claim("dev-2", "node-a", ttl=0.05)
+    time.sleep(0.1)
+    assert store.owner("dev-2") is None
+    assert store.claim("dev-2", "node-b", ttl=60)
@@ -0,0 +1,87 @@
+import pytest
+
+from modules import context as context_module
+from modules.context import ContextBuilder, estimate_tokens, truncate_to_tokens
+from settings import llm_settings
+
+
+def turns(count, words=5):
+    """count lượt hỏi-đáp, seq tăng dần như ChatHistory"""
+    history = []
+    for i in range(count):
+        history.append({"role": "user", "content": f"câu hỏi {i} " + "chữ " * words, "seq": 2 * i + 1})
+        history.append({"role": "assistant", "content": f"trả lời {i}. " + "chữ " * words, "seq": 2 * i + 2})
+    return history
+
+
+def test_truncate_to_tokens_respects_limit():
+    text = "một hai ba bốn năm sáu bảy tám chín mười"
+    short = truncate_to_tokens(text, 5)
+    assert short.endswith("…")
+    assert estimate_tokens(short.rstrip(" …")) <= 5
+    assert truncate_to_tokens(text, 100) == text
+
+
+def test_older_turns_go_to_summary_and_recent_stay_verbatim(monkeypatch):
+    monkeypatch.setattr(llm_settings, "HISTORY_RECENT_TURNS", 2)
+    builder = ContextBuilder()
+    prompt, messages, _ = builder.build("câu mới", turns(4), None, session_id="s")
+
+    assert "Cậu hỏi: câu hỏi 0" in prompt and "Tớ đáp: trả lời 1." in prompt
+    assert [m["content"].split(" chữ")[0] for m in messages] == [
+        "câu hỏi 2", "trả lời 2.", "câu hỏi 3", "trả lời 3.", "câu mới",
+    ]
+
+
+def test_messages_over_budget_are_folded_into_summary(monkeypatch):
+    monkeypatch.setattr(llm_settings, "HISTORY_RECENT_TURNS", 3)
+    builder = ContextBuilder()
+    history = turns(3, words=60)
+    # Đủ cho lượt cuối và một bản tóm tắt đầy, không đủ cho cả ba lượt
+    room = sum(estimate_tokens(m["content"]) for m in history[-2:]) + llm_settings.SUMMARY_MAX_TOKENS
+    monkeypatch.setattr(
+        llm_settings, "CONTEXT_MAX_INPUT_TOKENS", builder.base_tokens + estimate_tokens("câu mới") + room
+    )
+    prompt, messages, _ = builder.build("câu mới", history, None, session_id="s")
+
+    sent = [m["content"] for m in messages[:-1]]
+    assert sent and messages[0]["role"] == "user"
+    assert history[0]["content"] not in sent
+    # Lượt bị bỏ không mất: nằm trong tóm tắt
+    assert "Cậu hỏi: câu hỏi 0" in prompt
+
+    # Lượt sau (ngân sách rộng) không gửi lại nguyên văn lượt đã tóm tắt
+    monkeypatch.setattr(llm_settings, "CONTEXT_MAX_INPUT_TOKENS", 100000)
+    prompt, messages, _ = builder.build("câu nữa", history, None, session_id="s")
+    assert history[0]["content"] not in [m["content"] for m in messages]
+    assert prompt.count("Cậu hỏi: câu hỏi 0") == 1
+
+
+def test_summary_is_capped(monkeypatch):
+    monkeypatch.setattr(llm_settings, "HISTORY_RECENT_TURNS", 1)
+    builder = ContextBuilder()
+    builder.build("câu mới", turns(40, words=20), None, session_id="s")
+    summary = "\n".join(builder.export("s")["summary"])
+    assert 0 < estimate_tokens(summary) <= llm_settings.SUMMARY_MAX_TOKENS
+    assert "câu hỏi 38" in summary  # Giữ phần mới nhất
+
+
+def test_idle_summaries_are_evicted(monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(context_module.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(llm_settings, "HISTORY_RECENT_TURNS", 1)
+    monkeypatch.setattr(llm_settings, "SUMMARY_IDLE_SECONDS", 100)
+    builder = ContextBuilder()
+    builder.build("a", turns(3), None, session_id="old")
+    clock[0] += 50
+    builder.build("a", turns(3), None, session_id="new")
+    clock[0] += 60
+    builder.build("a", turns(3), None, session_id="new")
+
+    assert builder.export("old")["summary"] == []
+    assert builder.export("new")["summary"]
+
+
+@pytest.mark.parametrize("elapsed, expected", [(0.0, 240), (1.0, 0), (None, 240)])
+def test_thinking_budget_follows_remaining_time(elapsed, expected):
+    assert ContextBuilder().thinking_budget(elapsed) == expected
@@ -0,0 +1,75 @@
+from settings import server_settings as cfg
+from modules.degradation import DegradationController, build_tiers
+from modules.metrics import RequestTrace, metrics
+
+
+def test_tiers_are_cumulative():
+    tiers = build_tiers((("normal", {}), ("fast", {"tts_steps": 4}), ("lean", {"rag": False})))
+    assert [t.level for t in tiers] == [0, 1, 2]
+    assert tiers[0].tts_steps is None and tiers[0].rag
+    assert tiers[2].tts_steps == 4 and not tiers[2].rag
+
+
+def test_step_up_needs_consecutive_overload():
+    controller = DegradationController()
+    for _ in range(cfg.DEGRADATION_STEP_UP_CHECKS - 1):
+        controller.evaluate(queue_depth=cfg.DEGRADATION_QUEUE_HIGH)
+    assert controller.tier.level == 0
+    controller.evaluate(queue_depth=0)  # Một lần nhẹ tải: đếm lại từ đầu
+    for _ in range(cfg.DEGRADATION_STEP_UP_CHECKS - 1):
+        controller.evaluate(queue_depth=cfg.DEGRADATION_QUEUE_HIGH)
+    assert controller.tier.level == 0
+    controller.evaluate(queue_depth=cfg.DEGRADATION_QUEUE_HIGH)
+    assert controller.tier.level == 1
+    assert controller.history[-1]["to"] == controller.tiers[1].name
+
+
+def test_steps_one_tier_at_a_time_and_stops_at_last():
+    controller = DegradationController()
+    for _ in range(cfg.DEGRADATION_STEP_UP_CHECKS * (len(controller.tiers) + 2)):
+        controller.evaluate(queue_depth=5)
+    assert controller.tier.level == len(controller.tiers) - 1
+    assert all(h["to"] != h["from"] for h in controller.history)
+    assert sum(controller.changes.values()) == len(controller.tiers) - 1
+
+
+def test_recovery_is_slower_than_escalation():
+    controller = DegradationController()
+    for _ in range(cfg.DEGRADATION_STEP_UP_CHECKS * 2):
+        controller.evaluate(queue_depth=5)
+    assert controller.tier.level == 2
+    for _ in range(cfg.DEGRADATION_STEP_DOWN_CHECKS - 1):
+        controller.evaluate(queue_depth=0)
+    assert controller.tier.level == 2
+    controller.evaluate(queue_depth=0)
+    assert controller.tier.level == 1
+    for _ in range(cfg.DEGRADATION_STEP_DOWN_CHECKS * 3):
+        controller.evaluate(queue_depth=0)
+    assert controller.tier.level == 0
+
+
+def test_latency_over_slo_steps_up():
+    metrics.reset()
+    controller = DegradationController()
+    for _ in range(cfg.DEGRADATION_MIN_SAMPLES):
+        trace = RequestTrace("dev")
+        trace.record("e2e_first_audio", cfg.DEGRADATION_LATENCY_SLO_SECONDS * 2)
+        metrics.finish(trace)
+    for _ in range(cfg.DEGRADATION_STEP_UP_CHECKS):
+        controller.evaluate(queue_depth=0)
+    assert controller.tier.level == 1
+    # Các lượt chậm trước lần đổi bậc không được tính lại cho bậc mới
+    controller.evaluate(queue_depth=0)
+    assert controller.pressure["samples"] == 0
+    metrics.reset()
+
+
+def test_forced_tier_holds_until_auto():
+    controller = DegradationController()
+    controller.force("no_rag")
+    assert not controller.tier.rag
+    for _ in range(cfg.DEGRADATION_STEP_DOWN_CHECKS * 2):
+        controller.evaluate(queue_depth=0)
+    assert controller.tier.name == "no_rag"
+    controller.force("auto")
+    assert controller.tier.level == 0
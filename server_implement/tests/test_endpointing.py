@@ -0,0 +1,62 @@
+from modules.endpointing import AdaptiveEndpointer, PauseStats
+
+DEFAULT, MIN, MAX = 25, 8, 45
+
+
+def make(pauses=()):
+    stats = PauseStats(min_samples=10)
+    for frames in pauses:
+        stats.add(frames)
+    return AdaptiveEndpointer(stats, default_frames=DEFAULT, min_frames=MIN, max_frames=MAX)
+
+
+def silence(endpointer, frames, prob):
+    for _ in range(frames):
+        endpointer.on_silence(prob)
+
+
+def test_default_without_history():
+    assert make().required_silence_frames() == DEFAULT
+
+
+def test_learned_pauses_are_clamped_to_bounds():
+    assert make([2] * 20).required_silence_frames() == MIN  # 2 + margin < min
+    assert make([100] * 20).required_silence_frames() == MAX
+    assert make([20] * 20).required_silence_frames() == 20 + AdaptiveEndpointer.PAUSE_MARGIN_FRAMES
+
+
+def test_vad_trend_scales_the_window():
+    confident = make()
+    silence(confident, 3, 0.01)
+    assert confident.required_silence_frames() == int(DEFAULT * AdaptiveEndpointer.CONFIDENT_FACTOR)
+    hesitant = make()
+    silence(hesitant, 3, 0.4)
+    assert hesitant.required_silence_frames() == int(DEFAULT * AdaptiveEndpointer.HESITANT_FACTOR)
+    capped = make([40] * 20)
+    silence(capped, 3, 0.4)
+    assert capped.required_silence_frames() == MAX
+
+
+def test_partial_transcript():
+    complete = make([40] * 20)
+    complete.set_partial_transcript("con mèo có bốn chân không", complete.begin_partial())
+    assert complete.required_silence_frames() == MIN
+    hesitant = make()
+    hesitant.set_partial_transcript("con mèo và", hesitant.begin_partial())
+    assert hesitant.required_silence_frames() == int(DEFAULT * AdaptiveEndpointer.HESITANT_FACTOR)
+
+
+def test_late_partial_is_ignored_after_speech_resumes():
+    endpointer = make()
+    partial_id = endpointer.begin_partial()
+    endpointer.on_speech()
+    endpointer.set_partial_transcript("con mèo có bốn chân không", partial_id)
+    assert endpointer.partial_text is None
+    assert endpointer.required_silence_frames() == DEFAULT
+
+
+def test_on_silence_reports_end_when_window_reached():
+    endpointer = make()
+    results = [endpointer.on_silence(0.01) for _ in range(MAX)]
+    end = results.index(True) + 1
+    assert end == int(DEFAULT * AdaptiveEndpointer.CONFIDENT_FACTOR)
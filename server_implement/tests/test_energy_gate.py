@@ -0,0 +1,56 @@
+import numpy as np
+
+from modules.vad import EnergyGate
+
+SR = 16000
+FRAME = 480  # 30 ms
+
+
+def frames(signal):
+    pcm = np.clip(signal, -32768, 32767).astype(np.int16)
+    return [pcm[i:i + FRAME].tobytes() for i in range(0, len(pcm) - FRAME + 1, FRAME)]
+
+
+def noise(seconds, dbfs, seed=0):
+    rms = 32768.0 * 10 ** (dbfs / 20)
+    return np.random.default_rng(seed).standard_normal(int(SR * seconds)) * rms
+
+
+def speech(seconds, dbfs):
+    t = np.arange(int(SR * seconds)) / SR
+    rms = 32768.0 * 10 ** (dbfs / 20)
+    voiced = np.sin(2 * np.pi * 200 * t) + 0.5 * np.sin(2 * np.pi * 400 * t)
+    return voiced / np.sqrt(np.mean(voiced ** 2)) * rms
+
+
+def run(gate, signal):
+    return [gate.is_silence(f) for f in frames(signal)]
+
+
+def test_background_noise_is_gated():
+    gate = EnergyGate(hangover_frames=0)
+    results = run(gate, noise(2.0, -60))
+    assert all(results)
+
+
+def test_speech_passes_gate():
+    gate = EnergyGate(hangover_frames=0)
+    run(gate, noise(1.0, -55))
+    assert not any(run(gate, speech(0.5, -30)))
+
+
+def test_speech_on_dc_offset_passes_gate():
+    # INMP441: offset DC lớn (~-20 dBFS) cộng nhiễu nhỏ; tiếng nói nhỏ hơn nhiều so với DC
+    dc = 32768.0 * 0.1
+    gate = EnergyGate(hangover_frames=0)
+    assert all(run(gate, dc + noise(1.0, -60)))
+    assert not any(run(gate, dc + speech(0.5, -35)))
+
+
+def test_hangover_keeps_frames_after_speech():
+    gate = EnergyGate(hangover_frames=3)
+    run(gate, noise(1.0, -60))
+    run(gate, speech(0.1, -30))
+    after = run(gate, noise(0.3, -60, seed=1))
+    assert after[:3] == [False, False, False]
+    assert all(after[3:])
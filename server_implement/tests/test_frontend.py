@@ -0,0 +1,88 @@
+import numpy as np
+import pytest
+
+from modules import frontend
+from modules.frontend import AudioFrontEnd
+
+SR = frontend.SAMPLE_RATE
+FRAME = 480
+
+
+def tone(seconds, amplitude, freq=300.0):
+    t = np.arange(int(SR * seconds)) / SR
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def rms(x):
+    return float(np.sqrt(np.mean(np.square(x, dtype=np.float64))))
+
+
+def run(fe, signal):
+    return np.concatenate([fe.process(signal[i:i + FRAME]) for i in range(0, len(signal), FRAME)])
+
+
+def reference_highpass(x):
+    y = np.zeros(len(x))
+    prev_x = prev_y = 0.0
+    for n, sample in enumerate(x.astype(np.float64)):
+        prev_y = sample - prev_x + frontend.HIGHPASS_POLE * prev_y
+        prev_x = sample
+        y[n] = prev_y
+    return y
+
+
+def test_highpass_matches_recursive_filter_across_frames():
+    signal = np.random.default_rng(0).standard_normal(FRAME * 6).astype(np.float32) * 0.1 + 0.2
+    fe = AudioFrontEnd(denoise=False, agc=False)
+    # Frame độ dài khác nhau: trạng thái phải nối liền giữa các lần gọi
+    out = np.concatenate([fe.process(signal[:FRAME]), fe.process(signal[FRAME:FRAME + 100]),
+                          fe.process(signal[FRAME + 100:])])
+    np.testing.assert_allclose(out, reference_highpass(signal), atol=1e-4)
+
+
+def test_highpass_removes_dc_offset_and_keeps_speech_band():
+    fe = AudioFrontEnd(denoise=False, agc=False)
+    speech = tone(2.0, 0.05)
+    out = run(fe, speech + 0.3)
+    tail = out[-SR // 2:]  # Sau khi bộ lọc đã ổn định
+    assert abs(float(np.mean(tail))) < 1e-3
+    assert rms(tail) == pytest.approx(rms(speech[-SR // 2:]), rel=0.05)
+
+
+def test_agc_raises_quiet_speech_towards_target():
+    fe = AudioFrontEnd(denoise=False, agc=True)
+    out = run(fe, tone(3.0, 0.01))
+    assert frontend.AGC_MAX_GAIN >= fe.gain > 5
+    assert rms(out[-FRAME * 10:]) == pytest.approx(frontend.AGC_TARGET_RMS, rel=0.2)
+
+
+def test_agc_attacks_fast_and_never_exceeds_max_gain():
+    fe = AudioFrontEnd(denoise=False, agc=True)
+    run(fe, tone(5.0, 0.004))  # Rất nhỏ: gain bị chặn ở AGC_MAX_GAIN
+    assert fe.gain <= frontend.AGC_MAX_GAIN
+    run(fe, tone(0.15, 0.8))  # To đột ngột: 5 frame là gain đã giảm mạnh
+    assert fe.gain < 1.0
+    assert fe.gain >= frontend.AGC_MIN_GAIN
+
+
+def test_agc_holds_gain_in_silence():
+    fe = AudioFrontEnd(denoise=False, agc=True)
+    run(fe, tone(1.0, 0.02))
+    gain = fe.gain
+    run(fe, np.random.default_rng(1).standard_normal(SR).astype(np.float32) * 0.0005)
+    assert fe.gain == gain  # Không khuếch đại nhiễu nền
+
+
+def test_denoise_does_not_amplify_stationary_noise():
+    # Khử nhẹ (ước lượng nhiễu theo min): chỉ kiểm tra nhiễu không bị to lên và frame đủ độ dài
+    noise = np.random.default_rng(2).standard_normal(SR * 2).astype(np.float32) * 0.01
+    fe = AudioFrontEnd(denoise=True, agc=False)
+    out = run(fe, noise)
+    assert len(out) == len(noise)
+    assert rms(out[-SR // 2:]) < rms(noise[-SR // 2:])
+
+
+def test_call_keeps_frame_length():
+    fe = AudioFrontEnd()
+    pcm = (tone(0.03, 0.5) * 32767).astype(np.int16).tobytes()
+    assert len(fe(pcm)) == len(pcm)
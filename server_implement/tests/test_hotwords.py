@@ -0,0 +1,32 @@
+from modules import hotwords
+from modules.hotwords import build_hotwords_file, corpus_phrases
+
+
+def write_docs(tmp_path):
+    docs = tmp_path / "rag"
+    (docs / "toan").mkdir(parents=True, exist_ok=True)
+    (docs / "toan" / "bai1.txt").write_text(
+        "Phép cộng: hai cộng ba bằng năm.\nHai cộng ba bằng mấy?\nCon mèo có bốn chân.\n", encoding="utf-8"
+    )
+    (docs / "ghichu.md").write_text("hai cộng ba hai cộng ba", encoding="utf-8")  # Không phải .txt
+    return docs
+
+
+def test_corpus_phrases_counts_repeated_2_and_3_syllable_phrases(tmp_path):
+    phrases = corpus_phrases(write_docs(tmp_path), max_phrases=10, min_count=2)
+    assert "hai cộng" in phrases and "hai cộng ba" in phrases and "cộng ba bằng" in phrases
+    assert "con mèo" not in phrases  # Chỉ xuất hiện một lần
+    assert all(2 <= len(p.split()) <= 3 for p in phrases)
+    assert corpus_phrases(write_docs(tmp_path), max_phrases=2, min_count=2) == phrases[:2]
+    assert corpus_phrases(tmp_path / "missing", 10, 2) == []
+
+
+def test_build_hotwords_file_merges_and_uppercases(tmp_path, monkeypatch):
+    monkeypatch.setattr(hotwords.cfg, "HOTWORDS_UPPERCASE", True)
+    output = tmp_path / "model" / "hotwords.txt"
+    count = build_hotwords_file(output, rag_dir=write_docs(tmp_path), extra=["Hai cộng ba", " phép trừ ", ""])
+    lines = output.read_text(encoding="utf-8").splitlines()
+    assert count == len(lines)
+    assert lines[:2] == ["HAI CỘNG BA", "PHÉP TRỪ"]  # Danh sách cố định đứng trước
+    assert len(set(lines)) == len(lines)  # Không trùng với cụm lấy từ tài liệu
+    assert "HAI CỘNG" in lines
@@ -0,0 +1,122 @@
+import asyncio
+from types import SimpleNamespace
+
+from modules import kws
+from modules.kws import KeywordSpotterModel, KeywordStream, build_keywords_file
+from server.strategies import WakeWordEndpointing
+
+WAKE = b"\x01\x00" * 480
+NOISE = b"\x00\x00" * 480
+
+
+def test_keywords_file_uses_model_tokens(tmp_path, monkeypatch):
+    monkeypatch.setattr(kws.cfg, "KEYWORDS", ["XIN CHÀO BẠN NHỎ", "  ", "ƠI BẠN"])
+    monkeypatch.setattr(kws.cfg, "KEYWORDS_TOKENS_TYPE", "cjkchar")
+    monkeypatch.setattr(kws.cfg, "KEYWORDS_FILE", tmp_path / "keywords.txt")
+    calls = []
+
+    def text2token(phrases, tokens, tokens_type, bpe_model):
+        calls.append((tokens, tokens_type, bpe_model))
+        return [[f"▁{word}" for word in phrase.split()] for phrase in phrases]
+
+    count = build_keywords_file(SimpleNamespace(text2token=text2token), "tokens.txt")
+    assert count == 2
+    assert calls == [("tokens.txt", "cjkchar", None)]  # Không cần bpe.model
+    assert (tmp_path / "keywords.txt").read_text(encoding="utf-8").splitlines() == [
+        "▁XIN ▁CHÀO ▁BẠN ▁NHỎ @XIN_CHÀO_BẠN_NHỎ",
+        "▁ƠI ▁BẠN @ƠI_BẠN",
+    ]
+
+
+class FakeStream:
+    def __init__(self):
+        self.pending = []
+        self.heard = ""
+
+    def accept_waveform(self, sample_rate, samples):
+        self.pending.append(samples)
+
+
+class FakeSpotter:
+    """Báo keyword khi nhận một frame WAKE; mỗi frame đủ cho một lần decode"""
+
+    def __init__(self):
+        self.resets = 0
+
+    def create_stream(self):
+        return FakeStream()
+
+    def is_ready(self, stream):
+        return bool(stream.pending)
+
+    def decode_stream(self, stream):
+        stream.heard = "XIN_CHÀO_BẠN_NHỎ" if stream.pending.pop(0).max() > 0 else stream.heard
+
+    def get_result(self, stream):
+        return stream.heard
+
+    def reset_stream(self, stream):
+        stream.heard = ""
+        self.resets += 1
+
+
+def fake_model():
+    model = object.__new__(KeywordSpotterModel)
+    model.spotter = FakeSpotter()
+    model.detections = 0
+    return model
+
+
+def test_stream_reports_each_detection_once():
+    model = fake_model()
+    stream = KeywordStream(model)
+    assert stream(NOISE) is None
+    assert stream(WAKE) == "XIN_CHÀO_BẠN_NHỎ"
+    assert stream(NOISE) is None  # Đã reset: không báo lại ở frame sau
+    assert model.detections == 1 and model.spotter.resets == 1
+
+
+class FakeSession:
+    device_id = "dev-kws"
+    log_extra = {"device_id": "dev-kws"}
+
+    def __init__(self, responding=False):
+        self.vad_frames = 0
+        self.cancelled = 0
+        self.is_responding = responding
+        self.pipeline = None
+        self.kws = lambda frame: "XIN_CHÀO_BẠN_NHỎ" if frame == WAKE else None
+
+    def vad(self, frame):
+        self.vad_frames += 1
+        return 0.0
+
+    async def cancel_response(self):
+        self.cancelled += 1
+        self.is_responding = False
+
+
+def test_wakeword_gates_vad_until_keyword():
+    async def run():
+        session = FakeSession()
+        strategy = WakeWordEndpointing(session)
+        assert strategy.listens_while_responding
+        for _ in range(5):
+            await strategy.on_frame(NOISE)
+        assert session.vad_frames == 0 and not strategy.listening
+        await strategy.on_frame(WAKE)
+        assert strategy.listening
+        await strategy.on_frame(NOISE)
+        assert session.vad_frames == 1
+
+    asyncio.run(run())
+
+
+def test_keyword_during_reply_interrupts_it():
+    async def run():
+        session = FakeSession(responding=True)
+        strategy = WakeWordEndpointing(session)
+        await strategy.on_frame(WAKE)
+        assert session.cancelled == 1 and strategy.listening
+
+    asyncio.run(run())
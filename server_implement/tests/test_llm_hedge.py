@@ -0,0 +1,57 @@
+import asyncio
+from collections import deque
+
+from settings import llm_settings
+from modules.llm import LLMEngine
+from modules.llm_backends import MockBackend
+
+
+class CountingBackend(MockBackend):
+    def __init__(self, ttft_seconds, tokens_per_second):
+        super().__init__(ttft_seconds=ttft_seconds, tokens_per_second=tokens_per_second)
+        self.calls = 0
+
+    def astream(self, *args, **kwargs):
+        self.calls += 1
+        return super().astream(*args, **kwargs)
+
+
+def make_engine(backend):
+    # Không cần RAG / lịch sử / context: chỉ thử _hedged_call
+    engine = object.__new__(LLMEngine)
+    engine.backend = backend
+    engine.ttft_samples = deque()
+    return engine
+
+
+def hedged_call(engine):
+    messages = [{"role": "user", "content": "con mèo có mấy chân"}]
+    return asyncio.run(engine._hedged_call("system", messages, None, None))
+
+
+def test_no_hedge_once_first_token_arrived(monkeypatch):
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    # Token đầu tiên đến ngay nhưng cả stream kéo dài hơn hedge delay nhiều lần
+    backend = CountingBackend(ttft_seconds=0.0, tokens_per_second=50)
+    reply, ttft = hedged_call(make_engine(backend))
+    assert backend.calls == 1
+    assert reply == MockBackend.reply_for([{"content": "con mèo có mấy chân"}])
+    assert ttft < 0.05
+
+
+def test_hedge_when_first_token_is_late(monkeypatch):
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_ENABLED", True)
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    backend = CountingBackend(ttft_seconds=0.2, tokens_per_second=1000)
+    reply, _ = hedged_call(make_engine(backend))
+    assert backend.calls == 2
+    assert reply
+
+
+def test_hedge_disabled(monkeypatch):
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_ENABLED", False)
+    monkeypatch.setattr(llm_settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    backend = CountingBackend(ttft_seconds=0.2, tokens_per_second=1000)
+    hedged_call(make_engine(backend))
+    assert backend.calls == 1
@@ -0,0 +1,65 @@
+import json
+import logging
+import queue
+
+from modules import log as log_module
+from modules import metrics
+from modules.log import JsonFormatter, RateLimitFilter, TextFormatter, TraceContextFilter, parse_levels
+
+
+def record(level=logging.WARNING, lineno=10, msg="frame dropped %s", args=(1,)):
+    return logging.LogRecord("modules.vad", level, "/srv/modules/vad.py", lineno, msg, args, None)
+
+
+def test_parse_levels():
+    assert parse_levels("modules.tts=debug, server = WARNING,,bad,=INFO") == {
+        "modules.tts": "DEBUG",
+        "server": "WARNING",
+    }
+    assert parse_levels("") == {}
+
+
+def test_rate_limit_per_call_site(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr(log_module.time, "monotonic", lambda: clock[0])
+    limiter = RateLimitFilter(interval=5)
+    assert limiter.filter(record())
+    assert not limiter.filter(record())
+    assert not limiter.filter(record())
+    assert limiter.filter(record(lineno=11))  # Dòng code khác: không bị giới hạn chung
+    assert all(limiter.filter(record(level=logging.INFO)) for _ in range(3))
+    assert limiter.suppressed == 2
+
+    clock[0] += 5
+    passed = record()
+    assert limiter.filter(passed)
+    assert passed.suppressed == 2  # Số bản ghi bị bỏ đi kèm lần kế tiếp
+    assert "(+2 similar suppressed)" in TextFormatter().format(passed)
+
+
+def test_rate_limit_disabled():
+    limiter = RateLimitFilter(interval=0)
+    assert all(limiter.filter(record()) for _ in range(5))
+
+
+def test_trace_context_and_json_format():
+    trace = metrics.start_trace("dev-7")
+    try:
+        entry = record(msg="stt %s", args=("ok",))
+        TraceContextFilter().filter(entry)
+    finally:
+        metrics.use_trace(None)
+    entry.classroom = "1A"  # extra={...}
+    data = json.loads(JsonFormatter().format(entry))
+    assert data["msg"] == "stt ok"
+    assert data["device_id"] == "dev-7" and data["request_id"] == trace.request_id
+    assert data["classroom"] == "1A" and data["level"] == "WARNING"
+
+
+def test_queue_handler_never_blocks():
+    handler = log_module._QueueHandler(queue.Queue(maxsize=1))
+    handler.handle(record())
+    handler.handle(record())
+    assert handler.dropped == 1
+    queued = handler.queue.get_nowait()
+    assert queued.msg == "frame dropped 1" and queued.args is None
@@ -0,0 +1,92 @@
+import asyncio
+import time
+
+import pytest
+
+from modules import metrics
+from modules.metrics import LatencyHistogram, MetricsRegistry
+
+
+def test_histogram_percentiles():
+    hist = LatencyHistogram(window=1000)
+    for ms in range(1, 101):
+        hist.observe(ms / 1000)
+    summary = hist.summary()
+    assert summary["count"] == 100
+    assert summary["max"] == pytest.approx(0.1)
+    assert summary["p50"] == pytest.approx(0.0505, abs=1e-3)
+    assert summary["p99"] == pytest.approx(0.099, abs=1e-3)
+    assert LatencyHistogram().summary() == {"count": 0}
+
+
+def test_histogram_window_keeps_totals():
+    hist = LatencyHistogram(window=2)
+    for seconds in (10.0, 1.0, 1.0):
+        hist.observe(seconds)
+    summary = hist.summary()
+    assert summary["max"] == 1.0  # Mẫu cũ đã rời cửa sổ
+    assert summary["count"] == 3 and summary["mean"] == 4.0
+
+
+def test_spans_are_recorded_into_the_current_trace():
+    registry = MetricsRegistry()
+
+    async def turn(device_id, delay):
+        trace = metrics.start_trace(device_id)
+        with metrics.span("stt"):
+            await asyncio.sleep(delay)
+        metrics.record("llm_ttft", 0.25)
+        metrics.tag("stt_method", "greedy_search")
+        registry.finish(trace)
+
+    async def run():
+        # Mỗi task một context: span của lượt này không lẫn sang lượt kia
+        await asyncio.gather(turn("a", 0.02), turn("b", 0.05))
+
+    asyncio.run(run())
+    snapshot = registry.snapshot()
+    assert snapshot["requests"] == 2
+    assert list(snapshot["stages"]) == ["stt", "llm_ttft"]  # Theo thứ tự STAGES
+    spans = {t["device_id"]: t["spans"] for t in snapshot["recent"]}
+    assert 0.02 <= spans["a"]["stt"] < 0.05 <= spans["b"]["stt"]
+    assert all(t["stt_method"] == "greedy_search" for t in snapshot["recent"])
+
+
+def test_helpers_are_noops_without_trace():
+    metrics.use_trace(None)
+    with metrics.span("stt"), metrics.usage("stt"):
+        pass
+    metrics.record("stt", 1.0)
+    metrics.tag("x", 1)
+    assert metrics.current_trace() is None
+
+
+def test_usage_records_cpu_time():
+    trace = metrics.start_trace("dev")
+    with metrics.usage("tts"):
+        end = time.thread_time() + 0.02
+        while time.thread_time() < end:
+            pass
+    metrics.use_trace(None)
+    assert trace.cpu["tts"] >= 0.02
+
+
+def test_recent_traces_and_prometheus():
+    registry = MetricsRegistry()
+    old = metrics.RequestTrace("dev")
+    old.started_at -= 100
+    old.record("e2e_first_audio", 2.0)
+    new = metrics.RequestTrace("dev")
+    new.record("e2e_first_audio", 1.0)
+    new.record("stt", 0.3)
+    for trace in (old, new):
+        registry.finish(trace)
+    recent = registry.recent_traces("e2e_first_audio", time.time() - 10)
+    assert [t["request_id"] for t in recent] == [new.request_id]
+    assert registry.recent_traces("rag", 0) == []
+
+    text = registry.prometheus()
+    assert 'voice_stage_latency_seconds_count{stage="e2e_first_audio"} 2' in text
+    assert "voice_requests_total 2" in text
+    registry.reset()
+    assert registry.snapshot()["requests"] == 0
@@ -0,0 +1,64 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from modules import profiler as profiler_module
+from modules.profiler import SamplingProfiler
+
+
+@pytest.fixture
+def short_profiles(monkeypatch):
+    monkeypatch.setattr(profiler_module.cfg, "PROFILE_MIN_SECONDS", 0.05)
+    monkeypatch.setattr(profiler_module.cfg, "PROFILE_MAX_SECONDS", 0.3)
+
+
+@pytest.fixture
+def busy_thread():
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait, name="busy-worker")
+    thread.start()
+    yield thread
+    stop.set()
+    thread.join()
+
+
+@pytest.mark.parametrize("interval", [0, -0.01])
+def test_non_positive_interval_is_rejected(interval):
+    with pytest.raises(ValueError):
+        SamplingProfiler().run(1.0, interval)
+
+
+def test_seconds_are_clamped(short_profiles, busy_thread):
+    profiler = SamplingProfiler()
+    start = time.perf_counter()
+    stacks = profiler.run(-5, 0.01)
+    assert time.perf_counter() - start >= 0.05
+    assert "busy-worker" in stacks  # Vẫn lấy mẫu, không trả về profile rỗng
+
+    start = time.perf_counter()
+    profiler.run(3600, 0.01)
+    assert time.perf_counter() - start < 2
+
+
+def test_only_one_profile_runs_at_a_time(short_profiles, busy_thread):
+    profiler = SamplingProfiler()
+    result = []
+    first = threading.Thread(target=lambda: result.append(profiler.run(0.3, 0.01)))
+    first.start()
+    while not profiler.running:
+        time.sleep(0.001)
+    with pytest.raises(RuntimeError):
+        profiler.run(0.1, 0.01)
+    first.join()
+    assert not profiler.running
+    assert "busy-worker" in result[0]
+    profiler.run(0.05, 0.01)  # Lock đã được trả
+
+
+def test_profile_endpoint_rejects_bad_interval():
+    from server.app import app
+
+    response = TestClient(app).post("/profile/cpu", params={"seconds": 1, "interval_ms": 0})
+    assert response.status_code == 400
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+
+from modules.prompt_cache import PromptCache
+from settings import llm_settings
+
+PREFIX = "Bạn là trợ lý. " * 2000
+
+
+class SlowBackend:
+    name = "slow"
+    model = "test"
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.entered = threading.Event()
+        self.creates = 0
+        self.refreshes = 0
+
+    def create_cache(self, text, ttl_seconds):
+        self.creates += 1
+        self.entered.set()
+        assert self.release.wait(5)
+        return f"cache-{self.creates}", time.time() + ttl_seconds
+
+    def refresh_cache(self, name, ttl_seconds):
+        self.refreshes += 1
+        self.entered.set()
+        assert self.release.wait(5)
+        return time.time() + ttl_seconds
+
+    def delete_cache(self, name):
+        pass
+
+
+@pytest.fixture(autouse=True)
+def small_min_tokens(monkeypatch):
+    monkeypatch.setattr(llm_settings, "CONTEXT_CACHE_MIN_TOKENS", 10)
+
+
+def start_get(cache, results):
+    thread = threading.Thread(target=lambda: results.append(cache.get(PREFIX)))
+    thread.start()
+    return thread
+
+
+def test_concurrent_callers_use_uncached_prompt_while_creating():
+    backend = SlowBackend()
+    cache = PromptCache(backend)
+    results = []
+    creator = start_get(cache, results)
+    assert backend.entered.wait(5)
+
+    # Không bị chặn bởi lời gọi mạng đang chạy
+    assert cache.get(PREFIX) is None
+    cache.invalidate("unknown")
+    assert cache.stats()["name"] is None
+
+    backend.release.set()
+    creator.join(5)
+    assert results[0] is not None and results[0].name == "cache-1"
+    assert backend.creates == 1
+    assert cache.get(PREFIX) is results[0]
+
+
+def test_refresh_in_flight_keeps_serving_current_entry():
+    backend = SlowBackend()
+    backend.release.set()
+    cache = PromptCache(backend)
+    entry = cache.get(PREFIX)
+    entry.expires_at = time.time() + 10  # Sắp hết hạn -> cần gia hạn
+    backend.release.clear()
+    backend.entered.clear()
+
+    results = []
+    refresher = start_get(cache, results)
+    assert backend.entered.wait(5)
+    assert cache.get(PREFIX) is entry
+    backend.release.set()
+    refresher.join(5)
+    assert results == [entry]
+    assert backend.refreshes == 1
+    assert entry.expires_at > time.time() + llm_settings.CONTEXT_CACHE_REFRESH_MARGIN_SECONDS
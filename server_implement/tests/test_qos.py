@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from server import qos as qos_module
+from server.qos import Admission, QoS, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_burst_and_refill(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(qos_module.time, "monotonic", clock)
+    bucket = TokenBucket(rate_per_minute=6, burst=3)
+    for _ in range(3):
+        assert bucket.available() >= 1
+        bucket.charge(1)
+    assert bucket.available() < 1
+    clock.now += 10  # 6/phút = 1 token mỗi 10 giây
+    assert bucket.available() == pytest.approx(1.0)
+    clock.now += 3600
+    assert bucket.available() == 3  # Không vượt burst
+
+
+def test_token_bucket_can_go_negative(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(qos_module.time, "monotonic", clock)
+    bucket = TokenBucket(rate_per_minute=600, burst=100)
+    bucket.charge(250)
+    assert bucket.available() == pytest.approx(-150)
+    clock.now += 15  # 10 token/giây
+    assert bucket.available() == pytest.approx(0)
+
+
+def test_admission_hands_slot_to_highest_priority_waiter():
+    async def run():
+        admission = Admission(1)
+        assert admission.try_acquire()
+        served = []
+
+        async def turn(name, rank):
+            if await admission.acquire(rank, timeout=2):
+                served.append(name)
+                await asyncio.sleep(0.01)
+                admission.release()
+
+        students = [asyncio.create_task(turn("s1", 1)), asyncio.create_task(turn("s2", 1))]
+        await asyncio.sleep(0)
+        teacher = asyncio.create_task(turn("t", 0))
+        await asyncio.sleep(0.01)
+        assert admission.waiting == 3
+        admission.release()
+        await asyncio.gather(teacher, *students)
+        assert served == ["t", "s1", "s2"]
+        assert admission.active == 0
+
+    asyncio.run(run())
+
+
+def test_admission_timeout_and_cancel_do_not_leak_slots():
+    async def run():
+        admission = Admission(1)
+        assert admission.try_acquire()
+        assert not await admission.acquire(1, timeout=0.01)
+        waiter = asyncio.create_task(admission.acquire(1, timeout=5))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert admission.waiting == 0
+        admission.release()
+        assert admission.active == 0
+        assert admission.try_acquire()
+
+    asyncio.run(run())
+
+
+def test_try_acquire_does_not_jump_the_queue():
+    async def run():
+        admission = Admission(2)
+        assert admission.try_acquire() and admission.try_acquire()
+        waiter = asyncio.create_task(admission.acquire(1, timeout=1))
+        await asyncio.sleep(0)
+        admission.release()  # Chỗ được chuyển thẳng cho lượt đang chờ
+        assert await waiter
+        assert not admission.try_acquire()
+        assert admission.active == 2
+
+    asyncio.run(run())
+
+
+def test_unknown_priority_is_rejected():
+    qos = QoS()
+    assert qos.priority(None) == qos_module.cfg.DEFAULT_PRIORITY
+    assert qos.priority("Teacher") == "teacher"
+    with pytest.raises(ValueError):
+        qos.priority("boss")
+
+
+def test_saturated_turn_is_refunded(monkeypatch):
+    monkeypatch.setattr(qos_module.cfg, "QOS_ENABLED", True)
+    monkeypatch.setattr(qos_module.cfg, "QOS_MAX_WAIT_SECONDS", 0.01)
+
+    async def run():
+        qos = QoS()
+        qos.admission = Admission(1)
+        assert qos.admission.try_acquire()  # Pipeline đang bận
+        async with qos.turn("dev", "lop1", "student") as refused:
+            assert refused == "saturated"
+        device = qos._utterances["device:dev"]
+        assert device.available() == pytest.approx(device.capacity, abs=0.01)
+
+        qos.admission.release()
+        async with qos.turn("dev", "lop1", "student") as refused:
+            assert refused is None
+        assert device.available() == pytest.approx(device.capacity - 1, abs=0.01)
+
+    asyncio.run(run())
+
+
+def test_idle_full_buckets_are_pruned(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(qos_module.time, "monotonic", clock)
+    monkeypatch.setattr(qos_module.cfg, "QOS_BUCKET_IDLE_SECONDS", 100)
+    qos = QoS()
+    assert qos.over_limit("quiet", "lop1", "student") is None
+    clock.now += 5
+    qos.charge_tokens("busy", "lop2", "student", 10 ** 6)  # Âm rất sâu: chưa hồi đầy
+    clock.now += 200
+    qos.prune()
+    assert "device:quiet" not in qos._utterances and "device:quiet" not in qos._tokens
+    assert "device:busy" in qos._tokens
+    assert "device:busy" not in qos._utterances  # Chưa từng trừ câu nói: đầy và idle
@@ -0,0 +1,47 @@
+import os
+import threading
+
+from modules.llm import SimpleRAG
+
+
+def write_docs(folder, n):
+    for i in range(n):
+        (folder / f"bai_{i}.txt").write_text(f"Con mèo có bốn cái chân. Bài {i} về con vật.", encoding="utf-8")
+
+
+def test_concurrent_load_does_not_duplicate_chunks(tmp_path):
+    write_docs(tmp_path, 3)
+    rag = SimpleRAG(str(tmp_path), chunk_size=20, overlap=5)
+    threads = [threading.Thread(target=rag.search, args=("con mèo",)) for _ in range(8)]
+    [t.start() for t in threads]
+    [t.join() for t in threads]
+    single = SimpleRAG(str(tmp_path), chunk_size=20, overlap=5)
+    single._load()
+    assert len(rag.chunks) == len(single.chunks)
+    assert rag.version == 1
+
+
+def test_search_never_sees_empty_index_during_reload(tmp_path):
+    write_docs(tmp_path, 3)
+    rag = SimpleRAG(str(tmp_path), chunk_size=20, overlap=5)
+    assert rag.search("con mèo")
+    empty = []
+    stop = threading.Event()
+
+    def searcher():
+        while not stop.is_set():
+            if not rag.search("con mèo"):
+                empty.append(True)
+
+    threads = [threading.Thread(target=searcher) for _ in range(4)]
+    [t.start() for t in threads]
+    for i in range(20):
+        path = tmp_path / "bai_0.txt"
+        path.write_text(f"Con mèo có bốn cái chân. Lần sửa {i}.", encoding="utf-8")
+        os.utime(path, ns=(i * 10**9, i * 10**9))  # mtime luôn đổi
+        assert rag.reload_if_changed()
+    stop.set()
+    [t.join() for t in threads]
+    assert not empty
+    assert rag.version == 21
+    assert not rag.reload_if_changed()
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from modules.resample import StreamingResampler, resample
+
+
+def tone(freq, sr, seconds=0.5, amplitude=0.5):
+    t = np.arange(int(sr * seconds)) / sr
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def rms(x):
+    return float(np.sqrt(np.mean(np.square(x, dtype=np.float64))))
+
+
+@pytest.mark.parametrize("src, dst", [(24000, 16000), (16000, 24000), (44100, 16000), (16000, 8000)])
+def test_output_length(src, dst):
+    x = tone(440, src, seconds=0.37)
+    y = resample(x, src, dst)
+    assert len(y) == -(-len(x) * dst // src)
+    assert y.dtype == np.float32
+
+
+@pytest.mark.parametrize("src, dst", [(24000, 16000), (44100, 16000), (16000, 24000)])
+def test_passband_tone_is_preserved(src, dst):
+    y = resample(tone(1000, src), src, dst)
+    core = y[len(y) // 4: -len(y) // 4]  # Bỏ hai đầu (độ trễ của bộ lọc)
+    assert rms(core) == pytest.approx(0.5 / np.sqrt(2), rel=0.02)
+    spectrum = np.abs(np.fft.rfft(core * np.hanning(len(core))))
+    peak = np.argmax(spectrum) * dst / len(core)
+    assert peak == pytest.approx(1000, abs=dst / len(core) * 2)
+
+
+def test_tone_above_new_nyquist_is_rejected():
+    # 24 kHz -> 16 kHz: 10 kHz nằm trên Nyquist mới (8 kHz), phải bị chặn thay vì alias xuống 6 kHz
+    y = resample(tone(10000, 24000), 24000, 16000)
+    core = y[len(y) // 4: -len(y) // 4]
+    assert 20 * np.log10(rms(core) / (0.5 / np.sqrt(2))) < -60
+
+
+def test_streaming_matches_whole_signal():
+    x = tone(700, 24000, seconds=0.3)
+    whole = resample(x, 24000, 16000)
+    resampler = StreamingResampler(24000, 16000)
+    blocks = [resampler.process(x[i:i + 777]) for i in range(0, len(x), 777)]
+    streamed = np.concatenate(blocks + [resampler.flush()])
+    assert np.allclose(streamed, whole, atol=1e-6)
+
+
+def test_int16_in_int16_out():
+    x = (tone(440, 24000) * 32767).astype(np.int16)
+    y = resample(x, 24000, 16000)
+    assert y.dtype == np.int16
+    assert resample(x, 16000, 16000) is x
@@ -0,0 +1,30 @@
+import asyncio
+from types import SimpleNamespace
+
+from modules.speculation import SpeculativeRun, speculation_stats
+from server.session import DeviceSession
+from tests.test_speculation import FakePipeline
+
+
+class ClosedWebSocket:
+    query_params = {"device_id": "dev-1"}
+    client = SimpleNamespace(host="127.0.0.1")
+
+    async def send_text(self, text):
+        raise RuntimeError('Cannot call "send" once a close message has been sent.')
+
+
+def test_disconnect_before_processing_start_aborts_speculation():
+    async def run():
+        speculation_stats.reset()
+        session = DeviceSession(ClosedWebSocket(), FakePipeline())
+        speculation = SpeculativeRun(FakePipeline(), b"\0" * 320, session_id="dev-1")
+        await session.respond(b"\0" * 320, speculation)
+        await asyncio.sleep(0)
+        assert speculation.task.cancelled()
+
+    asyncio.run(run())
+    stats = speculation_stats.snapshot()
+    assert stats["aborted"] == 1
+    assert stats["discarded"] == 0
+    assert "wasted_wall_seconds" in stats
@@ -0,0 +1,32 @@
+import asyncio
+
+from modules.speculation import SpeculativeRun, speculation_stats
+
+
+class FakePipeline:
+    async def transcribe_pcm_async(self, pcm):
+        return "con mèo có mấy chân"
+
+    async def generate_reply_async(self, text, session_id="default"):
+        await asyncio.sleep(0.01)
+        return "Con mèo có bốn chân."
+
+
+def test_abort_is_not_a_miss():
+    async def run():
+        speculation_stats.reset()
+        hit = SpeculativeRun(FakePipeline(), b"\0" * 320)
+        assert await hit.commit() == ("con mèo có mấy chân", "Con mèo có bốn chân.")
+        refused = SpeculativeRun(FakePipeline(), b"\0" * 320)
+        await asyncio.sleep(0)
+        refused.abort()
+        missed = SpeculativeRun(FakePipeline(), b"\0" * 320)
+        await asyncio.sleep(0)
+        missed.discard()
+
+    asyncio.run(run())
+    stats = speculation_stats.snapshot()
+    assert stats["committed"] == 1
+    assert stats["discarded"] == 1
+    assert stats["aborted"] == 1
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,65 @@
+import os
+from collections import Counter
+
+import numpy as np
+import pytest
+
+from server import workers as workers_module
+from server.workers import STTWorkerPool
+
+DIE = 1234  # Số mẫu làm worker chết giữa chừng
+
+
+class StubEngine:
+    """Giả STTEngine: trả về số mẫu và tổng của audio nhận được"""
+
+    config = {"model": "stub"}
+    method = "greedy_search"
+
+    def __init__(self):
+        self.decodes = Counter()
+
+    def transcribe_samples(self, wav, sample_rate, requested_at=None, forced=None):
+        if len(wav) == DIE:
+            os._exit(3)
+        self.decodes[forced or self.method] += 1
+        return f"{len(wav)}:{round(float(np.sum(wav)) * 32768)}"
+
+    def stats(self):
+        return {"decodes": dict(self.decodes), "rtf": {}}
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    monkeypatch.setattr(workers_module.cfg, "STT_WORKER_SLOT_SECONDS", 0.5)
+    monkeypatch.setattr(workers_module.cfg, "STT_WORKER_POLL_SECONDS", 0.05)
+    pool = STTWorkerPool(StubEngine(), 2)
+    yield pool
+    pool.close(timeout=2)
+
+
+def pcm(samples):
+    return np.asarray(samples, dtype=np.int16).tobytes()
+
+
+def test_pcm_round_trips_through_slot_ring(pool):
+    short = np.arange(1, 101)
+    assert pool.transcribe_pcm16(pcm(short)) == f"100:{short.sum()}"
+    # Dài hơn một slot: gửi thẳng qua queue
+    long = np.ones(pool.slot_bytes, dtype=np.int16)
+    assert len(pcm(long)) > pool.slot_bytes
+    assert pool.transcribe_pcm16(pcm(long)) == f"{len(long)}:{len(long)}"
+    # Slot được trả lại sau mỗi lượt: dùng lại nhiều lần hơn số slot
+    for value in range(5):
+        assert pool.transcribe_pcm16(pcm([value] * 10)) == f"10:{value * 10}"
+    assert pool._free_slots.qsize() == pool.num_workers
+    assert pool.stats()["decodes"]["greedy_search"] == 7
+
+
+def test_worker_death_fails_in_flight_request(pool):
+    with pytest.raises(RuntimeError, match="died"):
+        pool.transcribe_pcm16(pcm([0] * DIE))
+    assert pool.alive == 1
+    assert not pool._pending
+    # Worker còn lại vẫn phục vụ
+    assert pool.transcribe_pcm16(pcm([2] * 3)) == "3:6"
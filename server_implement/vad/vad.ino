@@ -1,4 +1,5 @@
 #include <Arduino.h>
+#include <math.h>
 #include "driver/i2s.h"
 #include <WiFi.h>
 #include <ArduinoWebsockets.h>
@@ -36,6 +37,16 @@ const char* websocket_server_path = "/ws";
 // --- Cấu hình Âm thanh Loa ---
 #define SPEAKER_GAIN            8.0f
 
+// --- Full-duplex: vẫn gửi mic khi đang phát để server phát hiện ngắt lời (barge-in) ---
+#define FULL_DUPLEX             1
+
+// --- Tạm dừng uplink khi im lặng lâu: server không phải xử lý 33 frame/giây im lặng ---
+#define UPLINK_PAUSE_ENABLED    1
+#define PAUSE_RMS_THRESHOLD     300     // RMS (mẫu 16-bit) dưới ngưỡng này = im lặng
+#define PAUSE_AFTER_FRAMES      100     // ~3 giây im lặng liên tục thì gửi "PAUSE" và ngừng gửi
+#define PREROLL_FRAMES          5       // Khi có tiếng, gửi lại ~150ms trước đó để không mất âm đầu
+#define HEARTBEAT_INTERVAL_MS   5000    // PHẢI nhỏ hơn HEARTBEAT_TIMEOUT_SECONDS của server
+
 // ===============================================================
 // 2. BIẾN TOÀN CỤC
 // ===============================================================
@@ -48,9 +59,19 @@ enum State {
   STATE_PLAYING_RESPONSE   // Tạm dừng mic, chỉ phát loa
 };
 volatile State currentState = STATE_STREAMING;
+// Sau TTS_ABORT, bỏ qua các gói audio còn đang trên đường tới cho đến câu trả lời kế tiếp
+volatile bool discardResponseAudio = false;
 
 byte i2s_read_buffer[I2S_READ_CHUNK_SIZE];
 
+// Trạng thái tạm dừng uplink (chỉ dùng trong audio_processing_task)
+bool uplinkPaused = false;
+int silentFrames = 0;
+byte preroll_buffer[PREROLL_FRAMES][I2S_READ_CHUNK_SIZE];
+int prerollHead = 0;
+int prerollCount = 0;
+unsigned long lastHeartbeatMs = 0;
+
 // ===============================================================
 // 3. CÁC HÀM CÀI ĐẶT I2S
 // ===============================================================
@@ -79,6 +100,8 @@ void onWebsocketEvent(WebsocketsEvent event, String data) {
     if (event == WebsocketsEvent::ConnectionOpened) {
         Serial.println("Websocket connection opened. Starting to stream audio.");
         currentState = STATE_STREAMING; 
+        uplinkPaused = false;
+        silentFrames = 0;
     } else if (event == WebsocketsEvent::ConnectionClosed) {
         Serial.println("Websocket connection closed.");
     }
@@ -91,14 +114,24 @@ void onWebsocketMessage(WebsocketsMessage message) {
 
         if (text_msg == "PROCESSING_START") {
             Serial.println("Server is processing. Pausing microphone.");
+            discardResponseAudio = false;
             currentState = STATE_WAITING;
         }
         else if (text_msg == "TTS_END") {
             Serial.println("End of TTS. Returning to streaming mode.");
             currentState = STATE_STREAMING;
         }
+        else if (text_msg == "TTS_ABORT") {
+            Serial.println("Response interrupted (barge-in). Stopping speaker.");
+            discardResponseAudio = true;
+            i2s_zero_dma_buffer(I2S_SPEAKER_PORT);
+            currentState = STATE_STREAMING;
+        }
     }
     else if (message.isBinary()) {
+        if (discardResponseAudio) {
+            return;
+        }
         if (currentState != STATE_PLAYING_RESPONSE) {
             Serial.println("Receiving audio from server, pausing mic and starting playback...");
             currentState = STATE_PLAYING_RESPONSE;
@@ -121,13 +154,63 @@ void onWebsocketMessage(WebsocketsMessage message) {
     }
 }
 
+float frame_rms(const int16_t* samples, size_t count) {
+    double sum_sq = 0;
+    for (size_t i = 0; i < count; i++) {
+        sum_sq += (double)samples[i] * samples[i];
+    }
+    return sqrt(sum_sq / count);
+}
+
+// Gửi frame vừa đọc, hoặc giữ lại khi uplink đang tạm dừng
+void send_frame() {
+    if (!UPLINK_PAUSE_ENABLED) {
+        client.sendBinary((const char*)i2s_read_buffer, I2S_READ_CHUNK_SIZE);
+        return;
+    }
+    bool silent = frame_rms((const int16_t*)i2s_read_buffer, I2S_READ_CHUNK_SIZE / 2) < PAUSE_RMS_THRESHOLD;
+
+    if (uplinkPaused) {
+        if (silent) {
+            memcpy(preroll_buffer[prerollHead], i2s_read_buffer, I2S_READ_CHUNK_SIZE);
+            prerollHead = (prerollHead + 1) % PREROLL_FRAMES;
+            if (prerollCount < PREROLL_FRAMES) prerollCount++;
+            if (millis() - lastHeartbeatMs >= HEARTBEAT_INTERVAL_MS) {
+                client.send("HEARTBEAT");
+                lastHeartbeatMs = millis();
+            }
+            return;
+        }
+        Serial.println("Sound detected. Resuming uplink.");
+        client.send("RESUME");
+        for (int i = 0; i < prerollCount; i++) {
+            int idx = (prerollHead - prerollCount + i + PREROLL_FRAMES) % PREROLL_FRAMES;
+            client.sendBinary((const char*)preroll_buffer[idx], I2S_READ_CHUNK_SIZE);
+        }
+        prerollCount = 0;
+        silentFrames = 0;
+        uplinkPaused = false;
+    }
+
+    client.sendBinary((const char*)i2s_read_buffer, I2S_READ_CHUNK_SIZE);
+    silentFrames = silent ? silentFrames + 1 : 0;
+    // Chỉ tạm dừng khi đang chờ câu hỏi; khi đang phát trả lời vẫn gửi để server bắt được ngắt lời
+    if (silentFrames >= PAUSE_AFTER_FRAMES && currentState == STATE_STREAMING) {
+        Serial.println("Long silence. Pausing uplink.");
+        client.send("PAUSE");
+        uplinkPaused = true;
+        lastHeartbeatMs = millis();
+        prerollCount = 0;
+    }
+}
+
 void audio_processing_task(void *pvParameters) {
   size_t bytes_read;
   while (true) {
-    if (currentState == STATE_STREAMING) {
+    if (currentState == STATE_STREAMING || FULL_DUPLEX) {
         i2s_read(I2S_MIC_PORT, i2s_read_buffer, I2S_READ_CHUNK_SIZE, &bytes_read, portMAX_DELAY);
         if (bytes_read == I2S_READ_CHUNK_SIZE && client.available()) {
-            client.sendBinary((const char*)i2s_read_buffer, bytes_read);
+            send_frame();
         }
     } else {
         vTaskDelay(pdMS_TO_TICKS(20));